@@ -1,46 +1,381 @@
 import os
+import re
 import csv
 import io
-import tempfile
 import base64
+import json
 import pytz
-import locale
-from datetime import datetime, date, timedelta
-from flask import Flask, request, jsonify, render_template, Response, send_file
+import unicodedata
+import threading
+import time
+import zlib
+import codecs
+import hmac
+import hashlib
+import secrets
+import tempfile
+import zipfile
+import gzip
+from collections import OrderedDict, namedtuple
+from datetime import datetime, date, timedelta, timezone
+from flask import Flask, request, jsonify, render_template, Response, send_file, url_for, stream_with_context, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from sqlalchemy import func, JSON, and_
-from functools import wraps
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import func, JSON, and_, or_, tuple_, event, DDL, inspect, bindparam, select, null
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.exc import SQLAlchemyError
+from functools import wraps, lru_cache
+import click
 from fpdf import FPDF
+from PIL import Image, ImageOps
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import http_date, is_resource_modified
+from jobs import FilaRelatorios, CONCLUIDO
+from metrics import Registro
+from blobs import criar_armazenamento
+
+# Opcionais: sem orjson o JSON sai pelo json da biblioteca padrão; sem brotli, só gzip.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # --- Configuração da Aplicação ---
 app = Flask(__name__, template_folder='frontend', static_folder='frontend')
-CORS(app)
+CORS(app, expose_headers=['X-Total-Count', 'X-Next-Cursor', 'Link', 'Server-Timing', 'X-DB-Queries'])
 
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['STATISTICS_CACHE_TTL'] = int(os.environ.get('STATISTICS_CACHE_TTL', 30))
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+app.config['PHOTO_MAX_SIZE'] = int(os.environ.get('PHOTO_MAX_SIZE', 1024))
+app.config['PHOTO_THUMB_SIZE'] = int(os.environ.get('PHOTO_THUMB_SIZE', 160))
+app.config['PHOTO_JPEG_QUALITY'] = int(os.environ.get('PHOTO_JPEG_QUALITY', 85))
+app.config['PDF_PHOTO_CACHE_SIZE'] = int(os.environ.get('PDF_PHOTO_CACHE_SIZE', 128))
+app.config['PDF_PHOTO_CACHE_TTL'] = int(os.environ.get('PDF_PHOTO_CACHE_TTL', 600))
+app.config['AUTH_TOKEN_MAX_AGE'] = int(os.environ.get('AUTH_TOKEN_MAX_AGE', 12 * 60 * 60))
+app.config['AUTH_CACHE_SIZE'] = int(os.environ.get('AUTH_CACHE_SIZE', 1024))
+app.config['AUTH_CACHE_TTL'] = int(os.environ.get('AUTH_CACHE_TTL', 300))
+app.config['EXPORT_JOBS_DIR'] = os.environ.get('EXPORT_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'provavida-exportacoes'))
+app.config['EXPORT_JOBS_MAX_BYTES'] = int(os.environ.get('EXPORT_JOBS_MAX_BYTES', 512 * 1024 * 1024))
+app.config['EXPORT_JOBS_THREADS'] = int(os.environ.get('EXPORT_JOBS_THREADS', 2))
+app.config['EXPORT_JOBS_PROCESSES'] = int(os.environ.get('EXPORT_JOBS_PROCESSES', 2))
+app.config['EXPORT_JOBS_REUSE_SECONDS'] = int(os.environ.get('EXPORT_JOBS_REUSE_SECONDS', 60))
+app.config['EXPORT_SYNC_MAX_ROWS'] = int(os.environ.get('EXPORT_SYNC_MAX_ROWS', 500))
+app.config['DECLARACOES_MAX_LOTE'] = int(os.environ.get('DECLARACOES_MAX_LOTE', 1000))
+# Acima disto o lote de declarações (uma página cada) vai para a fila de exportações.
+app.config['DECLARACOES_SYNC_MAX'] = int(os.environ.get('DECLARACOES_SYNC_MAX', 50))
+app.config['VISITAS_MAX_LOTE'] = int(os.environ.get('VISITAS_MAX_LOTE', 1000))
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# Teto de conexões da instância somando todos os workers; deve ficar abaixo do max_connections do Postgres.
+app.config['DB_MAX_CONNECTIONS'] = int(os.environ.get('DB_MAX_CONNECTIONS', 90))
+app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+app.config['DB_EXPORT_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_EXPORT_STATEMENT_TIMEOUT_MS', 300000))
+app.config['DB_QUERY_WARN_THRESHOLD'] = int(os.environ.get('DB_QUERY_WARN_THRESHOLD', 25))
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'provavida-metricas'))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['AUDIT_RETENTION_DAYS'] = int(os.environ.get('AUDIT_RETENTION_DAYS', 365))
+# Fotos e documentos ficam fora do banco (ver blobs.py): 'local' ou 's3'.
+app.config['BLOB_STORAGE'] = os.environ.get('BLOB_STORAGE', 'local')
+app.config['BLOB_DIR'] = os.environ.get('BLOB_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blobs'))
+app.config['BLOB_S3_BUCKET'] = os.environ.get('BLOB_S3_BUCKET')
+app.config['BLOB_S3_PREFIX'] = os.environ.get('BLOB_S3_PREFIX', 'blobs/')
+app.config['BLOB_S3_ENDPOINT_URL'] = os.environ.get('BLOB_S3_ENDPOINT_URL')
+app.config['BLOB_S3_REGION'] = os.environ.get('BLOB_S3_REGION')
+app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+app.config['SSE_POLL_INTERVAL'] = float(os.environ.get('SSE_POLL_INTERVAL', 2))
+app.config['SSE_HEARTBEAT_SECONDS'] = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+app.config['SSE_MAX_SECONDS'] = int(os.environ.get('SSE_MAX_SECONDS', 300))
+# Cada stream ocupa uma thread do worker enquanto está aberto (ver gunicorn.conf.py). Sem
+# SSE_MAX_STREAMS, o limite é o que sobra das threads depois das SSE_RESERVED_THREADS.
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', 0))
+app.config['SSE_RESERVED_THREADS'] = int(os.environ.get('SSE_RESERVED_THREADS', 2))
+
+# --- Métricas (expostas em /metrics) ---
+# Os valores de todos os workers da máquina são somados via METRICS_DIR (ver metrics.py).
+registro_metricas = Registro(app.config['METRICS_DIR'] or None)
+metrica_requisicoes = registro_metricas.contador('provavida_http_requisicoes_total', 'Requisições HTTP por rota, método e status.', ('rota', 'metodo', 'status'))
+metrica_latencia = registro_metricas.histograma('provavida_http_requisicao_segundos', 'Latência das requisições HTTP por rota (até o primeiro byte).', ('rota', 'metodo'))
+metrica_consultas = registro_metricas.histograma('provavida_db_consultas_por_requisicao', 'Consultas ao banco por requisição.', ('rota',), buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+metrica_espera_pool = registro_metricas.histograma('provavida_db_espera_pool_segundos', 'Espera por uma conexão do pool (inclui abrir conexões novas).', buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10))
+metrica_blob_bytes = registro_metricas.contador('provavida_blob_bytes_total', 'Bytes de fotos e documentos servidos.', ('tipo',))
+metrica_pdf = registro_metricas.histograma('provavida_pdf_renderizacao_segundos', 'Tempo de geração dos PDFs, por classe.', ('classe',))
+metrica_foto = registro_metricas.histograma('provavida_foto_processamento_segundos', 'Decodificação e normalização das fotos recebidas.')
+metrica_estatisticas = registro_metricas.histograma('provavida_estatisticas_calculo_segundos', 'Cálculo das estatísticas (só quando o cache expira).')
+metrica_exportacao_linhas = registro_metricas.contador('provavida_exportacao_linhas_total', 'Linhas exportadas em CSV.', ('exportacao',))
+
+# --- Banco de Dados: Pool de Conexões e Métricas por Requisição ---
+def _somar_metrica_db(campo, valor):
+    if has_request_context() and 'metricas_db' in g:
+        g.metricas_db[campo] += valor
+
+class QueuePoolMedido(QueuePool):
+    """QueuePool que contabiliza, por requisição, o tempo esperando por uma conexão livre."""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera = time.perf_counter() - inicio
+            _somar_metrica_db('espera_pool', espera)
+            metrica_espera_pool.observe(espera)
+
+def dimensionar_pool(pool_size, max_overflow, max_conexoes, processos):
+    """Reparte max_conexoes entre os processos do gunicorn; devolve (pool_size, max_overflow).
+
+    O pool configurado só é reduzido, nunca aumentado. Levanta RuntimeError se não sobra ao
+    menos uma conexão por processo.
+    """
+    por_processo = max_conexoes // processos
+    if por_processo < 1:
+        raise RuntimeError(f"DB_MAX_CONNECTIONS={max_conexoes} não dá uma conexão para cada um dos {processos} workers; "
+                           f"aumente DB_MAX_CONNECTIONS (e o max_connections do Postgres) ou reduza WEB_CONCURRENCY.")
+    tamanho = min(pool_size, por_processo)
+    return tamanho, min(max_overflow, por_processo - tamanho)
+
+if (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('postgresql'):
+    # Cada worker do gunicorn tem o próprio pool: workers × (pool_size + max_overflow) não pode
+    # passar do max_connections do Postgres. O gunicorn.conf.py publica o número de workers em
+    # WEB_CONCURRENCY; fora do gunicorn (flask run, CLI) há um processo só.
+    processos = max(int(os.environ.get('WEB_CONCURRENCY', 1)), 1)
+    pool_size, max_overflow = dimensionar_pool(app.config['DB_POOL_SIZE'], app.config['DB_MAX_OVERFLOW'],
+                                               app.config['DB_MAX_CONNECTIONS'], processos)
+    if (pool_size, max_overflow) != (app.config['DB_POOL_SIZE'], app.config['DB_MAX_OVERFLOW']):
+        app.logger.warning(f"Pool reduzido para pool_size={pool_size}, max_overflow={max_overflow}: "
+                           f"{processos} workers e DB_MAX_CONNECTIONS={app.config['DB_MAX_CONNECTIONS']}.")
+        app.config['DB_POOL_SIZE'], app.config['DB_MAX_OVERFLOW'] = pool_size, max_overflow
+    # pool_pre_ping descarta conexões mortas (ex.: após restart do Postgres) antes de usá-las.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': QueuePoolMedido,
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
 
 db = SQLAlchemy(app)
+# O esquema é versionado em migrations/ (flask db upgrade); create_all não é mais usado.
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+
+def _estado_pool():
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {('em_uso',): pool.checkedout(), ('livres',): pool.checkedin(), ('overflow',): max(pool.overflow(), 0), ('tamanho',): pool.size()}
+
+# Também exposto em app.extensions para as migrações, que não importam o app.py.
+armazenamento_blobs = criar_armazenamento(app.config)
+app.extensions['blobs'] = armazenamento_blobs
+
+registro_metricas.medidor('provavida_db_pool_conexoes', 'Conexões do pool do processo que respondeu.', ('estado',), _estado_pool)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _inicio_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('inicio_consulta', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _fim_consulta(conn, cursor, statement, parameters, context, executemany):
+    duracao = time.perf_counter() - conn.info['inicio_consulta'].pop()
+    _somar_metrica_db('consultas', 1)
+    _somar_metrica_db('tempo_db', duracao)
+
+# Rotas de exportação/importação varrem a tabela inteira e recebem um limite maior; o resto
+# (telas do atendimento) falha rápido em vez de segurar conexões do pool.
+PREFIXOS_ROTAS_LONGAS = ('/api/export', '/api/import')
+
+def _statement_timeout_ms():
+    if has_request_context() and not request.path.startswith(PREFIXOS_ROTAS_LONGAS):
+        return app.config['DB_STATEMENT_TIMEOUT_MS']
+    return app.config['DB_EXPORT_STATEMENT_TIMEOUT_MS']
+
+@event.listens_for(db.session, 'after_begin')
+def _aplicar_statement_timeout(session, transaction, connection):
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(_statement_timeout_ms())}")
+
+@app.before_request
+def _iniciar_metricas_db():
+    g.metricas_db = {'consultas': 0, 'tempo_db': 0.0, 'espera_pool': 0.0}
+    g.inicio_requisicao = time.perf_counter()
+
+@app.after_request
+def _registrar_metricas_requisicao(response):
+    metricas = g.get('metricas_db')
+    if metricas is None:
+        return response
+    # Em respostas em streaming só entra a parte executada antes do primeiro byte.
+    tempo_db_ms = metricas['tempo_db'] * 1000
+    espera_pool_ms = metricas['espera_pool'] * 1000
+    total_ms = (time.perf_counter() - g.inicio_requisicao) * 1000
+    response.headers['Server-Timing'] = (f'db;dur={tempo_db_ms:.1f};desc="{metricas["consultas"]} consultas", '
+                                         f'pool;dur={espera_pool_ms:.1f}, app;dur={total_ms:.1f}')
+    response.headers['X-DB-Queries'] = str(metricas['consultas'])
+    mensagem = (f"{request.method} {request.path} {response.status_code}: {metricas['consultas']} consultas, "
+                f"db {tempo_db_ms:.1f} ms, espera do pool {espera_pool_ms:.1f} ms, total {total_ms:.1f} ms")
+    if metricas['consultas'] >= app.config['DB_QUERY_WARN_THRESHOLD']:
+        app.logger.warning(f"Muitas consultas numa requisição (possível N+1): {mensagem}")
+    else:
+        app.logger.debug(mensagem)
+
+    rota = request.url_rule.rule if request.url_rule else 'sem_rota'
+    metrica_requisicoes.inc(rota=rota, metodo=request.method, status=response.status_code)
+    metrica_latencia.observe(total_ms / 1000, rota=rota, metodo=request.method)
+    metrica_consultas.observe(metricas['consultas'], rota=rota)
+    return response
 
 # --- Autenticação ---
 ADMIN_USERNAME = 'administrador'
+# Só semeia o primeiro administrador (ver criar_admin); depois vale o hash guardado no banco.
 ADMIN_PASSWORD = 'admin!alprev!'
 
+if not app.config['SECRET_KEY']:
+    # Sem SECRET_KEY fixa, os tokens só valem no processo que os emitiu (e somem no restart).
+    app.logger.warning("SECRET_KEY não definida; usando uma chave aleatória para os tokens de sessão.")
+    app.config['SECRET_KEY'] = secrets.token_hex(32)
+
+token_serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='provavida-auth')
+
+# Dados mínimos do utilizador autenticado, guardados em cache em vez do objeto ORM.
+UsuarioAutenticado = namedtuple('UsuarioAutenticado', ['id', 'username', 'permissions', 'carimbo'])
+
+class CacheLRU:
+    """Cache LRU limitado, com TTL, seguro para uso entre threads."""
+
+    def __init__(self, tamanho_maximo, ttl):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if time.monotonic() >= expira_em:
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + self.ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+
+    def remover_se(self, condicao):
+        """Remove as entradas cujo valor satisfaz `condicao`."""
+        with self._lock:
+            for chave in [c for c, (valor, _) in self._itens.items() if condicao(valor)]:
+                del self._itens[chave]
+
+# Utilizadores autenticados por id (tokens) e por credencial Basic já verificada. O TTL limita
+# quanto tempo outros workers do gunicorn podem ver permissões/senhas antigas após uma alteração.
+cache_autenticacao = CacheLRU(app.config['AUTH_CACHE_SIZE'], app.config['AUTH_CACHE_TTL'])
+
+def invalidar_cache_usuario(user_id):
+    """Descarta do cache tudo o que se refere ao utilizador (chamar após alterar senha/permissões)."""
+    cache_autenticacao.remover_se(lambda usuario: usuario.id == user_id)
+
+def gerar_hash_senha(senha):
+    return generate_password_hash(senha, method='pbkdf2:sha256')
+
+def _senha_tem_hash(valor):
+    return valor.startswith(('pbkdf2:', 'scrypt:'))
+
+def verificar_senha(user, senha):
+    """Confere a senha; senhas antigas em texto puro são convertidas para hash no primeiro acesso."""
+    if _senha_tem_hash(user.password):
+        return check_password_hash(user.password, senha)
+    if hmac.compare_digest(user.password.encode('utf-8'), senha.encode('utf-8')):
+        user.password = gerar_hash_senha(senha)
+        db.session.commit()
+        return True
+    return False
+
+def _usuario_autenticado(user):
+    # O carimbo muda sempre que a senha muda, invalidando os tokens emitidos antes.
+    carimbo = hashlib.sha256(user.password.encode('utf-8')).hexdigest()[:16]
+    return UsuarioAutenticado(user.id, user.username, user.permissions, carimbo)
+
 def check_auth(username, password):
-    """Verifica se as credenciais estão corretas e retorna o objeto do utilizador."""
+    """Verifica se as credenciais estão corretas e retorna o utilizador autenticado.
+
+    Credenciais já verificadas ficam no cache, chaveadas por um HMAC da senha, para que o hash
+    lento só seja calculado uma vez por utilizador e não a cada pedido.
+    """
+    digest = hmac.new(app.config['SECRET_KEY'].encode('utf-8'), password.encode('utf-8'), hashlib.sha256).hexdigest()
+    chave = ('basic', username, digest)
+    usuario = cache_autenticacao.obter(chave)
+    if usuario:
+        return usuario
     user = User.query.filter_by(username=username).first()
-    if user and user.password == password:
-        return user
+    if user and verificar_senha(user, password):
+        usuario = _usuario_autenticado(user)
+        cache_autenticacao.guardar(chave, usuario)
+        return usuario
+    return None
+
+def gerar_token(usuario):
+    """Emite um token de sessão assinado para o utilizador."""
+    return token_serializer.dumps({'uid': usuario.id, 'carimbo': usuario.carimbo})
+
+def validar_token(token):
+    """Retorna o utilizador do token, ou None se ele for inválido, expirado ou revogado."""
+    try:
+        dados = token_serializer.loads(token, max_age=app.config['AUTH_TOKEN_MAX_AGE'])
+    except BadSignature:
+        return None
+    chave = ('uid', dados.get('uid'))
+    usuario = cache_autenticacao.obter(chave)
+    if usuario is None:
+        user = User.query.get(dados.get('uid'))
+        if not user:
+            return None
+        usuario = _usuario_autenticado(user)
+        cache_autenticacao.guardar(chave, usuario)
+    if not hmac.compare_digest(usuario.carimbo, str(dados.get('carimbo'))):
+        return None
+    return usuario
+
+def _autenticar_requisicao():
+    """Aceita `Authorization: Bearer <token>` (emitido por /api/login) ou Basic."""
+    cabecalho = request.headers.get('Authorization', '')
+    if cabecalho.startswith('Bearer '):
+        return validar_token(cabecalho[len('Bearer '):].strip())
+    auth = request.authorization
+    if auth and auth.username and auth.password:
+        return check_auth(auth.username, auth.password)
     return None
 
 def requires_auth(f):
-    """Decorator para proteger rotas com autenticação Basic."""
+    """Decorator para proteger rotas com autenticação por token ou Basic; expõe o utilizador em g.usuario."""
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth = request.authorization
-        if not auth or not check_auth(auth.username, auth.password):
+        usuario = _autenticar_requisicao()
+        if not usuario:
             return Response('Acesso não autorizado.', 401, {'WWW-Authenticate': 'Basic realm="Login Required"'})
+        g.usuario = usuario
         return f(*args, **kwargs)
     return decorated
 
@@ -48,12 +383,24 @@ def requires_admin_auth(f):
     """Decorator para proteger rotas que exigem privilégios de administrador."""
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth = request.authorization
-        if not auth or not (auth.username == ADMIN_USERNAME and auth.password == ADMIN_PASSWORD):
+        usuario = _autenticar_requisicao()
+        if not usuario or usuario.username != ADMIN_USERNAME:
             return Response('Acesso restrito a administradores.', 403)
+        g.usuario = usuario
         return f(*args, **kwargs)
     return decorated
 
+# --- Normalização para Busca ---
+def somente_digitos(valor):
+    """Remove a máscara de CPFs e afins ('123.456.789-00' -> '12345678900')."""
+    return re.sub(r'\D', '', valor or '')
+
+def normalizar_busca(texto):
+    """Minúsculas, sem acentos e com espaços colapsados, para buscas por nome."""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(ch for ch in decomposto if not unicodedata.combining(ch))
+    return ' '.join(sem_acentos.lower().split())
+
 # --- Modelos do Banco de Dados ---
 class User(db.Model):
     __tablename__ = 'users'
@@ -71,6 +418,22 @@ class User(db.Model):
 
 class Cadastro(db.Model):
     __tablename__ = 'cadastros'
+    __table_args__ = (
+        # Suporta a paginação por chave (nome, cpf) da listagem de cadastros.
+        db.Index('ix_cadastros_nome_cpf', 'nome', 'cpf'),
+        # Buscas por prefixo (LIKE 'x%'); o pattern_ops é necessário em bancos com collation pt_BR.
+        db.Index('ix_cadastros_cpf_digitos', 'cpf_digitos', postgresql_ops={'cpf_digitos': 'varchar_pattern_ops'}),
+        db.Index('ix_cadastros_matricula', 'matricula', postgresql_ops={'matricula': 'varchar_pattern_ops'}),
+        # Listas e relatórios de visitas (status_visita = X ORDER BY nome). Parcial: a maioria
+        # dos cadastros não tem visita e não precisa ocupar o índice.
+        db.Index('ix_cadastros_status_visita_nome', 'status_visita', 'nome',
+                 postgresql_where=db.text('status_visita IS NOT NULL'), sqlite_where=db.text('status_visita IS NOT NULL')),
+        # Intervalos de data_atendimento (declarações em lote, contagem dos últimos dias).
+        db.Index('ix_cadastros_data_atendimento', 'data_atendimento'),
+        # Exportação de contatos do WhatsApp; cobre as colunas exportadas (index-only scan).
+        db.Index('ix_cadastros_whatsapp', 'nome', 'telefone',
+                 postgresql_where=db.text('is_whatsapp IS true'), sqlite_where=db.text('is_whatsapp IS 1')),
+    )
     cpf = db.Column(db.String(14), primary_key=True)
     matricula = db.Column(db.String(100), nullable=True)
     nome = db.Column(db.String(255), nullable=False)
@@ -97,20 +460,73 @@ class Cadastro(db.Model):
     curador_nome = db.Column(db.String(255), nullable=True)
     curador_cpf = db.Column(db.String(14), nullable=True)
     nome_documento = db.Column(db.String(255), nullable=True)
-    documento_pdf = db.Column(db.LargeBinary, nullable=True)
-    foto_segurado = db.Column(db.LargeBinary, nullable=True)
-
-    def to_dict(self):
-        data = {c.name: getattr(self, c.name) for c in self.__table__.columns if c.name not in ['documento_pdf', 'foto_segurado']}
-        for key, value in data.items():
+    # Incrementada a cada UPDATE; edições concorrentes falham com StaleDataError em vez de se sobrescreverem.
+    versao = db.Column(db.Integer, nullable=False, default=1)
+    # Fotos e documentos ficam no armazenamento de blobs; o cadastro guarda só o SHA-256 de
+    # cada um, que também é a ETag servida.
+    documento_hash = db.Column(db.String(64), nullable=True)
+    foto_hash = db.Column(db.String(64), nullable=True)
+    foto_miniatura_hash = db.Column(db.String(64), nullable=True)
+    has_document = db.column_property(documento_hash.isnot(None))
+    has_photo = db.column_property(foto_hash.isnot(None))
+    # Colunas derivadas, mantidas pelos validadores abaixo, usadas apenas pela busca.
+    cpf_digitos = db.Column(db.String(11), nullable=True)
+    nome_busca = db.Column(db.String(255), nullable=True)
+
+    @validates('cpf')
+    def _atualizar_cpf_digitos(self, key, value):
+        self.cpf_digitos = somente_digitos(value)
+        return value
+
+    @validates('nome')
+    def _atualizar_nome_busca(self, key, value):
+        self.nome_busca = normalizar_busca(value)
+        return value
+
+    def guardar_documento(self, conteudo):
+        self.documento_hash = armazenamento_blobs.guardar(conteudo) if conteudo else None
+
+    def guardar_foto(self, foto, miniatura):
+        self.foto_hash = armazenamento_blobs.guardar(foto) if foto else None
+        self.foto_miniatura_hash = armazenamento_blobs.guardar(miniatura) if miniatura else None
+
+    __mapper_args__ = {'version_id_col': versao}
+
+    def to_dict(self, campos=None):
+        """Serializa o cadastro; `campos` restringe a saída a uma projeção (ver CAMPOS_PROJECAO)."""
+        if campos is None:
+            campos = CAMPOS_PROJECAO
+        data = {}
+        for campo in campos:
+            value = getattr(self, campo)
             if isinstance(value, (datetime, date)):
-                data[key] = value.isoformat()
-        data['has_document'] = True if self.documento_pdf else False
-        data['has_photo'] = True if self.foto_segurado else False
+                value = value.isoformat()
+            elif campo in ('has_document', 'has_photo'):
+                value = bool(value)
+            data[campo] = value
         return data
 
+# Colunas que nunca saem na API nem nas exportações: hashes dos blobs e as derivadas da busca.
+COLUNAS_INTERNAS = ['cpf_digitos', 'nome_busca', 'documento_hash', 'foto_hash', 'foto_miniatura_hash']
+
+# Campos que podem ser pedidos em `fields` na listagem.
+CAMPOS_PROJECAO = [c.name for c in Cadastro.__table__.columns if c.name not in COLUNAS_INTERNAS] + ['has_document', 'has_photo']
+
+# Índices trigram (pg_trgm) tornam LIKE '%x%' indexável no Postgres. Em outros bancos (SQLite
+# nos testes locais) esses DDLs são ignorados e a busca continua funcionando, só que por varredura.
+event.listen(Cadastro.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+event.listen(Cadastro.__table__, 'after_create', DDL('CREATE INDEX IF NOT EXISTS ix_cadastros_cpf_digitos_trgm ON cadastros USING gin (cpf_digitos gin_trgm_ops)').execute_if(dialect='postgresql'))
+event.listen(Cadastro.__table__, 'after_create', DDL('CREATE INDEX IF NOT EXISTS ix_cadastros_nome_busca_trgm ON cadastros USING gin (nome_busca gin_trgm_ops)').execute_if(dialect='postgresql'))
+
 class AuditoriaAlteracoes(db.Model):
     __tablename__ = 'auditoria_alteracoes'
+    __table_args__ = (
+        # Histórico de um cadastro, do mais recente para o mais antigo.
+        db.Index('ix_auditoria_cpf_data', 'cadastro_cpf', 'data_alteracao'),
+        # Listagem geral, paginada por chave (data_alteracao, id).
+        db.Index('ix_auditoria_data_id', 'data_alteracao', 'id'),
+        db.Index('ix_auditoria_atendente_data', 'atendente', 'data_alteracao'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     cadastro_cpf = db.Column(db.String(14), db.ForeignKey('cadastros.cpf'), nullable=False)
     atendente = db.Column(db.String(100), nullable=False)
@@ -120,22 +536,140 @@ class AuditoriaAlteracoes(db.Model):
     valor_novo = db.Column(db.Text, nullable=True)
 
     def to_dict(self):
-        return {c.name: getattr(self, c.name).isoformat() if isinstance(getattr(self, c.name), datetime) else getattr(self, c.name) for c in self.__table__.columns}
+        dados = {coluna: getattr(self, coluna) for coluna in COLUNAS_AUDITORIA}
+        if dados['data_alteracao']:
+            dados['data_alteracao'] = dados['data_alteracao'].isoformat()
+        return dados
+
+class AuditoriaAlteracoesArquivo(db.Model):
+    """Registros de auditoria antigos, movidos pelo comando arquivar-auditoria.
+
+    Mantém o id original. Fica fora da tabela principal para que as consultas do dia a dia
+    (sempre sobre o histórico recente) não fiquem mais lentas à medida que o log cresce.
+    """
+    __tablename__ = 'auditoria_alteracoes_arquivo'
+    __table_args__ = (
+        db.Index('ix_auditoria_arquivo_cpf_data', 'cadastro_cpf', 'data_alteracao'),
+        db.Index('ix_auditoria_arquivo_data_id', 'data_alteracao', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    cadastro_cpf = db.Column(db.String(14), nullable=False)
+    atendente = db.Column(db.String(100), nullable=False)
+    data_alteracao = db.Column(db.DateTime)
+    campo_alterado = db.Column(db.String(100), nullable=False)
+    valor_antigo = db.Column(db.Text, nullable=True)
+    valor_novo = db.Column(db.Text, nullable=True)
+
+class EstatisticaDiaria(db.Model):
+    """Rollup de cadastros: quantos foram atendidos em cada dia, por combinação de dimensões.
+
+    Mantido por triggers em cadastros (migração 0006), que também pegam as escritas feitas
+    fora do ORM; o app só lê. status_visita é '' para cadastros sem visita.
+    """
+    __tablename__ = 'estatisticas_diarias'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('dia', 'qualidade', 'atendente', 'com_whatsapp', 'com_email', 'status_visita', name='pk_estatisticas_diarias'),
+    )
+    dia = db.Column(db.Date, nullable=False)
+    qualidade = db.Column(db.String(100), nullable=False)
+    atendente = db.Column(db.String(100), nullable=False)
+    com_whatsapp = db.Column(db.Boolean, nullable=False)
+    com_email = db.Column(db.Boolean, nullable=False)
+    status_visita = db.Column(db.String(50), nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+
+class AlteracaoCadastro(db.Model):
+    """Última alteração de cada CPF que já existiu (inclusive os removidos), numerada em `seq`
+    na ordem de commit. Mantida por triggers em cadastros (migração 0007); base do `since=`
+    das listagens e do stream de alterações.
+    """
+    __tablename__ = 'alteracoes_cadastros'
+    cpf = db.Column(db.String(14), primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, index=True, unique=True)
+    data_alteracao = db.Column(db.DateTime, nullable=False)
 
 # --- Classes para Geração de PDF ---
+MESES_PT = {
+    1: 'janeiro', 2: 'fevereiro', 3: 'março', 4: 'abril',
+    5: 'maio', 6: 'junho', 7: 'julho', 8: 'agosto',
+    9: 'setembro', 10: 'outubro', 11: 'novembro', 12: 'dezembro'
+}
+
+CABECALHO_LINHAS = [
+    'ESTADO DE ALAGOAS',
+    'SECRETARIA DE ESTADO DO PLANEJAMENTO, GESTÃO E PATRIMÔNIO',
+    'ALAGOAS PREVIDÊNCIA',
+]
+
+RODAPE_LINHAS = [
+    'Avenida da Paz, 1864, Empresarial Terra Brasilis - Térreo, 13º, 14º e 15º andares, Centro, Maceió-AL. CEP 57020-440',
+    'CNPJ 23.658.211/0001-11 - Telefones - Geral: (82) 3315-1831 / Call Center: (82) 3315-5707',
+]
+
+def data_por_extenso(dia):
+    """'18 de outubro de 2026.' sem depender de locale.setlocale, que é global ao processo."""
+    return f"{dia.day:02d} de {MESES_PT[dia.month]} de {dia.year}."
+
 class BasePDF(FPDF):
-    def header(self):
+    """Timbre comum a todos os PDFs.
+
+    O logo é decodificado pelo FPDF uma única vez por processo (decodificar o PNG com canal
+    alfa custa mais de um segundo) e a imagem pronta é registrada em cada novo documento.
+    """
+    NOME_LOGO = 'logo.png'
+    _logo = None
+    _logo_carregado = False
+    _logo_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._inicio_renderizacao = time.perf_counter()
+
+    def output(self, *args, **kwargs):
         try:
-            logo_path = os.path.join(app.static_folder, 'logo.png')
-            if os.path.exists(logo_path):
-                self.image(logo_path, 10, 8, 33)
-        except Exception as e:
-            app.logger.error(f"Erro ao carregar o logo no PDF: {e}")
+            return super().output(*args, **kwargs)
+        finally:
+            metrica_pdf.observe(time.perf_counter() - self._inicio_renderizacao, classe=type(self).__name__)
+
+    # O cache fica sempre em BasePDF, compartilhado por todas as subclasses.
+    @staticmethod
+    def _logo_decodificado():
+        if not BasePDF._logo_carregado:
+            with BasePDF._logo_lock:
+                if not BasePDF._logo_carregado:
+                    logo_path = os.path.join(app.static_folder, BasePDF.NOME_LOGO)
+                    try:
+                        if os.path.exists(logo_path):
+                            BasePDF._logo = FPDF()._parsepng(logo_path)
+                    except Exception as e:
+                        app.logger.error(f"Erro ao carregar o logo no PDF: {e}")
+                    BasePDF._logo_carregado = True
+        return BasePDF._logo
+
+    @staticmethod
+    def descartar_cache():
+        """Força a releitura do logo no próximo documento."""
+        with BasePDF._logo_lock:
+            BasePDF._logo = None
+            BasePDF._logo_carregado = False
+
+    def registrar_imagem(self, nome, info):
+        """Registra neste documento uma imagem já decodificada, para uso com self.image(nome, ...).
+
+        É registrada uma cópia rasa porque o FPDF apaga os dados da imagem ao gerar o arquivo.
+        """
+        if nome not in self.images:
+            self.images[nome] = dict(info, i=len(self.images) + 1)
+
+    def header(self):
+        logo = self._logo_decodificado()
+        if logo:
+            self.registrar_imagem(self.NOME_LOGO, logo)
+            self.image(self.NOME_LOGO, 10, 8, 33)
         self.set_font('Arial', 'B', 10)
         self.set_xy(50, 15)
-        self.cell(0, 5, 'ESTADO DE ALAGOAS', 0, 2, 'L')
-        self.cell(0, 5, 'SECRETARIA DE ESTADO DO PLANEJAMENTO, GESTÃO E PATRIMÔNIO', 0, 2, 'L')
-        self.cell(0, 5, 'ALAGOAS PREVIDÊNCIA', 0, 2, 'L')
+        for linha in CABECALHO_LINHAS:
+            self.cell(0, 5, linha, 0, 2, 'L')
         self.set_line_width(0.5)
         self.line(10, 45, self.w - 10, 45)
         self.ln(20)
@@ -146,8 +680,8 @@ class BasePDF(FPDF):
         self.set_line_width(0.5)
         self.line(self.get_x(), self.get_y(), self.get_x() + self.w - 20, self.get_y())
         self.ln(2)
-        self.cell(0, 5, 'Avenida da Paz, 1864, Empresarial Terra Brasilis - Térreo, 13º, 14º e 15º andares, Centro, Maceió-AL. CEP 57020-440', 0, 1, 'C')
-        self.cell(0, 5, 'CNPJ 23.658.211/0001-11 - Telefones - Geral: (82) 3315-1831 / Call Center: (82) 3315-5707', 0, 1, 'C')
+        for linha in RODAPE_LINHAS:
+            self.cell(0, 5, linha, 0, 1, 'C')
 
 class StatisticsPDF(BasePDF):
     def chapter_title(self, title):
@@ -155,6 +689,11 @@ class StatisticsPDF(BasePDF):
         self.cell(0, 10, title, 0, 1, 'C')
         self.ln(10)
 
+    def add_subtitle(self, text):
+        self.set_font('Arial', '', 11)
+        self.cell(0, 8, text, 0, 1, 'C')
+        self.ln(5)
+
     def add_kpi(self, title, value):
         self.set_font('Arial', '', 12)
         self.cell(90, 10, f'{title}:', 0, 0, 'R')
@@ -170,18 +709,58 @@ class StatisticsPDF(BasePDF):
             self.cell(50, 8, str(value), 1, 1)
         self.ln(5)
 
+ESPACOS_DE_COR_PDF = {'RGB': 'DeviceRGB', 'L': 'DeviceGray', 'CMYK': 'DeviceCMYK'}
+
+def imagem_para_pdf(dados):
+    """Converte bytes de imagem no formato interno de imagens do FPDF, sem passar pelo disco.
+
+    JPEGs (o formato gravado desde a normalização das fotos) são embutidos como estão (DCTDecode);
+    outros formatos são convertidos para JPEG antes. Lança ValueError se não for uma imagem.
+    """
+    try:
+        imagem = Image.open(io.BytesIO(dados))
+        if imagem.format != 'JPEG' or imagem.mode not in ESPACOS_DE_COR_PDF:
+            saida = io.BytesIO()
+            imagem.convert('RGB').save(saida, format='JPEG', quality=app.config['PHOTO_JPEG_QUALITY'])
+            dados = saida.getvalue()
+            imagem = Image.open(io.BytesIO(dados))
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"imagem inválida: {e}")
+    largura, altura = imagem.size
+    return {'w': largura, 'h': altura, 'cs': ESPACOS_DE_COR_PDF[imagem.mode], 'bpc': 8, 'f': 'DCTDecode', 'data': dados}
+
+# Fotos já convertidas para o FPDF, pelo foto_hash: reemitir a ficha não relê o blob.
+cache_fotos_pdf = CacheLRU(app.config['PDF_PHOTO_CACHE_SIZE'], app.config['PDF_PHOTO_CACHE_TTL'])
+
+def foto_do_cadastro_para_pdf(cadastro):
+    """Foto do cadastro pronta para CadastroPDF.set_photo, usando o cache quando possível."""
+    if not cadastro.foto_hash:
+        return None
+    info = cache_fotos_pdf.obter(cadastro.foto_hash)
+    if not info:
+        try:
+            info = imagem_para_pdf(armazenamento_blobs.ler(cadastro.foto_hash))
+        except FileNotFoundError:
+            raise ValueError(f"blob {cadastro.foto_hash} não encontrado no armazenamento")
+        cache_fotos_pdf.guardar(cadastro.foto_hash, info)
+    return info
+
 class CadastroPDF(BasePDF):
+    NOME_FOTO = 'foto_segurado.jpg'
+
     def __init__(self):
         super().__init__()
-        self.photo_path = None
+        self.photo = None
 
-    def set_photo_path(self, path):
-        self.photo_path = path
+    def set_photo(self, info):
+        """Define a foto do cabeçalho (dicionário gerado por imagem_para_pdf)."""
+        self.photo = info
 
     def header(self):
         super().header()
-        if self.photo_path:
-            self.image(self.photo_path, 160, 40, 40, 40)
+        if self.photo:
+            self.registrar_imagem(self.NOME_FOTO, self.photo)
+            self.image(self.NOME_FOTO, 160, 40, 40, 40)
         self.set_font('Arial', 'B', 14)
         self.cell(0, 10, 'Ficha de Cadastro', 0, 1, 'C')
         self.ln(5)
@@ -223,17 +802,7 @@ class DeclaracaoPDF(BasePDF):
         self.ln(20)
 
     def signature_section(self, cadastro):
-        try:
-            locale.setlocale(locale.LC_TIME, 'pt_BR.UTF-8')
-            today_str = datetime.now(pytz.timezone('America/Maceio')).strftime("%d de %B de %Y.")
-        except locale.Error:
-            now = datetime.now(pytz.timezone('America/Maceio'))
-            months_pt = {
-                1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
-                5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
-                9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
-            }
-            today_str = f"{now.day} de {months_pt[now.month]} de {now.year}."
+        today_str = data_por_extenso(datetime.now(pytz.timezone('America/Maceio')))
 
         self.set_font('Arial', '', 10)
         self.cell(0, 10, f"Maceió, {today_str}", 0, 1, 'C')
@@ -280,6 +849,9 @@ class RelatorioPDF(BasePDF):
             self.cell(col_widths[i], line_height, header_text, 1, 0, 'C')
         self.ln(line_height)
 
+        # Deslocamento de cada coluna calculado uma vez, não a cada célula.
+        offsets = [sum(col_widths[:i]) for i in range(len(col_widths))]
+
         self.set_font('Arial', '', 8)
         for row in data:
             y_start = self.get_y()
@@ -287,7 +859,7 @@ class RelatorioPDF(BasePDF):
             max_y = y_start
 
             for i, item in enumerate(row):
-                self.set_xy(x_start + sum(col_widths[:i]), y_start)
+                self.set_xy(x_start + offsets[i], y_start)
                 self.multi_cell(col_widths[i], 5, str(item), 0, 'L')
                 if self.get_y() > max_y:
                     max_y = self.get_y()
@@ -297,20 +869,292 @@ class RelatorioPDF(BasePDF):
                 self.cell(col_widths[i], max_y - y_start, '', 1, 0)
             self.ln(max_y - y_start)
 
+# --- Busca ---
+def filtro_cpf(termo):
+    """Filtro por CPF parcial, com ou sem máscara.
+
+    Até 2 dígitos usa prefixo (índice B-tree); a partir de 3 procura em qualquer posição,
+    o que no Postgres é atendido pelo índice trigram.
+    """
+    digitos = somente_digitos(termo)
+    if not digitos:
+        return None
+    if len(digitos) < 3:
+        return Cadastro.cpf_digitos.startswith(digitos, autoescape=True)
+    return Cadastro.cpf_digitos.contains(digitos, autoescape=True)
+
+def filtro_busca(termo):
+    """Filtro da busca livre: CPF ou matrícula quando o termo não tem letras, senão nome.
+
+    Nomes são comparados sem acentos e por palavra, em qualquer ordem ('jose silva'
+    encontra 'José da Silva').
+    """
+    termo = (termo or '').strip()
+    if not termo:
+        return None
+    if not any(ch.isalpha() for ch in termo):
+        condicoes = [Cadastro.matricula.startswith(termo, autoescape=True)]
+        por_cpf = filtro_cpf(termo)
+        if por_cpf is not None:
+            condicoes.append(por_cpf)
+        return or_(*condicoes)
+    palavras = normalizar_busca(termo).split()
+    return and_(*[Cadastro.nome_busca.contains(p, autoescape=True) for p in palavras])
+
+# --- Auditoria de Alterações ---
+CAMPOS_AUDITADOS = ['nome', 'telefone', 'email', 'matricula', 'is_whatsapp', 'qualidade', 'data_atendimento', 'informacao', 'obs', 'processo', 'endereco', 'assunto_visita', 'procurador_nome', 'procurador_cpf', 'curador_nome', 'curador_cpf']
+LINHAS_POR_INSERT_AUDITORIA = 1000
+
+def formatar_valor_auditoria(valor):
+    """Representação textual gravada em valor_antigo/valor_novo."""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    return str(valor)
+
+def aplicar_alteracoes(cadastro, data, campos):
+    """Copia para o cadastro os campos presentes em `data`, convertendo os tipos do formulário.
+
+    Só atribui valores que mudam de fato (None e '' são equivalentes), para que o histórico
+    de atributos do SQLAlchemy contenha apenas alterações reais. Lança ValueError em datas inválidas.
+    """
+    for campo in campos:
+        if campo not in data:
+            continue
+        valor = data[campo]
+        if campo == 'is_whatsapp':
+            valor = valor is True or str(valor).lower() == 'sim'
+        elif campo == 'data_atendimento':
+            valor = datetime.strptime(str(valor), '%Y-%m-%d').date()
+        if formatar_valor_auditoria(valor) != formatar_valor_auditoria(getattr(cadastro, campo)):
+            setattr(cadastro, campo, valor)
+
+def coletar_alteracoes(objetos, atendente, campos):
+    """Gera as linhas de auditoria a partir do histórico de atributos dos objetos.
+
+    Deve ser chamada antes do flush, enquanto o SQLAlchemy ainda guarda os valores antigos.
+    """
+    agora = datetime.utcnow()
+    linhas = []
+    for objeto in objetos:
+        estado = inspect(objeto)
+        for campo in campos:
+            historico = estado.attrs[campo].history
+            if not historico.has_changes():
+                continue
+            linhas.append({
+                'cadastro_cpf': objeto.cpf,
+                'atendente': atendente,
+                'data_alteracao': agora,
+                'campo_alterado': campo,
+                'valor_antigo': formatar_valor_auditoria(historico.deleted[0] if historico.deleted else None),
+                'valor_novo': formatar_valor_auditoria(historico.added[0] if historico.added else None),
+            })
+    return linhas
+
+def registrar_auditoria(linhas):
+    """Grava as linhas de auditoria com INSERTs de múltiplas linhas, na transação corrente."""
+    for inicio in range(0, len(linhas), LINHAS_POR_INSERT_AUDITORIA):
+        db.session.execute(AuditoriaAlteracoes.__table__.insert().values(linhas[inicio:inicio + LINHAS_POR_INSERT_AUDITORIA]))
+
+# --- Fotos ---
+def decodificar_data_url(valor):
+    """Decodifica uma foto em base64, com ou sem o prefixo 'data:image/...;base64,'."""
+    inicio = valor.find(',') + 1
+    dados = valor[inicio:] if inicio else valor
+    try:
+        return base64.b64decode(dados + '=' * (-len(dados) % 4))
+    except (ValueError, base64.binascii.Error) as e:
+        raise ValueError(f"base64 inválido: {e}")
+
+def _salvar_jpeg(imagem, lado):
+    copia = imagem.copy()
+    copia.thumbnail((lado, lado), Image.LANCZOS)
+    saida = io.BytesIO()
+    copia.save(saida, format='JPEG', quality=app.config['PHOTO_JPEG_QUALITY'], optimize=True)
+    return saida.getvalue()
+
+def processar_foto(origem):
+    """Normaliza a foto para JPEG de resolução limitada e gera a miniatura.
+
+    `origem` pode ser bytes ou um arquivo/stream (lido sob demanda pelo Pillow).
+    Retorna (foto, miniatura); lança ValueError se o conteúdo não for uma imagem.
+    """
+    if isinstance(origem, (bytes, bytearray)):
+        if not origem:
+            return None, None
+        origem = io.BytesIO(origem)
+    with metrica_foto.medir():
+        try:
+            with Image.open(origem) as imagem:
+                imagem = ImageOps.exif_transpose(imagem).convert('RGB')
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ValueError(f"imagem inválida: {e}")
+        return _salvar_jpeg(imagem, app.config['PHOTO_MAX_SIZE']), _salvar_jpeg(imagem, app.config['PHOTO_THUMB_SIZE'])
+
 # --- Rotas ---
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('Não autorizado', 401)
+    return Response(registro_metricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# --- Serialização Rápida e Compressão das Respostas ---
+# As listagens não passam pelo ORM nem pelo jsonify: as linhas vêm do Core como tuplas e
+# viram dicts com um zip, e o orjson (quando instalado) serializa date/datetime direto, no
+# mesmo formato ISO do isoformat() usado pelo to_dict.
+def _json_padrao(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} não é serializável em JSON")
+
+def codificar_json(dados):
+    """JSON (bytes, UTF-8) de `dados`, aceitando date e datetime."""
+    if orjson is not None:
+        return orjson.dumps(dados)
+    return json.dumps(dados, ensure_ascii=False, separators=(',', ':'), default=_json_padrao).encode('utf-8')
+
+def resposta_json(dados, status=200):
+    return Response(codificar_json(dados), status=status, mimetype='application/json')
+
+def corpo_json_objeto():
+    """Corpo JSON da requisição como dict ({} se ausente ou malformado); None se o JSON não for
+    um objeto (lista, texto, número), para a rota responder 400 em vez de falhar no data.get."""
+    data = request.get_json(silent=True)
+    if data is None:
+        return {}
+    return data if isinstance(data, dict) else None
+
+class Serializador:
+    """Colunas a selecionar e conversão das linhas resultantes em dicts, para uma projeção.
+
+    `extras` entram no SELECT depois dos campos (ex.: a chave do cursor) sem sair no JSON:
+    o zip com os nomes descarta o que sobra da linha.
+    """
+
+    def __init__(self, modelo, campos, extras=()):
+        self.campos = tuple(campos)
+        self.colunas = [getattr(modelo, campo) for campo in self.campos + tuple(c for c in extras if c not in self.campos)]
+
+    def __call__(self, linhas):
+        campos = self.campos
+        return [dict(zip(campos, linha)) for linha in linhas]
+
+@lru_cache(maxsize=64)
+def serializador_cadastros(campos):
+    # nome e cpf são sempre selecionados porque formam o cursor da paginação.
+    return Serializador(Cadastro, campos, extras=('nome', 'cpf'))
+
+TIPOS_COMPRIMIVEIS = {'application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/csv', 'text/css', 'application/javascript'}
+
+@app.after_request
+def _comprimir_resposta(response):
+    """Comprime com brotli (se o cliente aceitar e o pacote existir) ou gzip as respostas de
+    texto acima de COMPRESS_MIN_BYTES. Streams (que já se comprimem sozinhos) e arquivos
+    servidos por send_file ficam de fora."""
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.status_code not in (200, 201) or response.mimetype not in TIPOS_COMPRIMIVEIS):
+        return response
+    dados = response.get_data()
+    if len(dados) < app.config['COMPRESS_MIN_BYTES']:
+        return response
+    response.vary.add('Accept-Encoding')
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(dados, quality=app.config['COMPRESS_BROTLI_QUALITY']))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(dados, compresslevel=app.config['COMPRESS_GZIP_LEVEL']))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+LIMITE_MAXIMO_PAGINA = 500
+
+def _campos_pedidos(args):
+    """Projeção pedida em `fields=cpf,nome,...` (todos os campos se ausente); ValueError se houver inválidos."""
+    if not args.get('fields'):
+        return CAMPOS_PROJECAO
+    campos = [f.strip() for f in args['fields'].split(',') if f.strip()]
+    invalidos = [f for f in campos if f not in CAMPOS_PROJECAO]
+    if invalidos:
+        raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+    return campos
+
+def _codificar_cursor(valores):
+    """Gera um cursor opaco a partir dos valores da chave de ordenação."""
+    return base64.urlsafe_b64encode(json.dumps(valores).encode('utf-8')).decode('ascii')
+
+def _decodificar_cursor(cursor):
+    """Recupera os valores da chave de ordenação; lança ValueError se o cursor for inválido."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError, base64.binascii.Error):
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list):
+        raise ValueError('Cursor inválido')
+    return valores
+
 @app.route('/api/cadastros', methods=['GET'])
 @requires_auth
 def get_all_cadastros():
-    cpf_filter = request.args.get('cpf')
-    query = Cadastro.query
-    if cpf_filter:
-        query = query.filter(Cadastro.cpf.like(f"%{cpf_filter}%"))
-    todos_cadastros = query.order_by(Cadastro.nome).all()
-    return jsonify([c.to_dict() for c in todos_cadastros])
+    """Lista cadastros por ordem de nome, filtrando por `cpf` parcial ou busca livre `q`.
+
+    Sem `limit`/`cursor` devolve a lista completa (comportamento original). Com eles, pagina
+    por chave (nome, cpf): a próxima página vem no cabeçalho `X-Next-Cursor`, o total em
+    `X-Total-Count` (desligável com `count=0`) e `fields=cpf,nome,...` limita as colunas lidas.
+    Com `since`, devolve só o que mudou (ver _resposta_sincronizacao).
+    """
+    filtros = [f for f in (filtro_cpf(request.args.get('cpf')), filtro_busca(request.args.get('q'))) if f is not None]
+
+    try:
+        campos = _campos_pedidos(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    serializador = serializador_cadastros(tuple(campos))
+    if request.args.get('since') is not None:
+        return _resposta_sincronizacao(filtros, serializador)
+    consulta = select(*serializador.colunas).where(*filtros).order_by(Cadastro.nome, Cadastro.cpf)
+
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return resposta_json(serializador(db.session.execute(consulta)))
+
+    try:
+        limit = min(int(limit or LIMITE_MAXIMO_PAGINA), LIMITE_MAXIMO_PAGINA)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Parâmetro limit inválido'}), 400
+
+    headers = {}
+    if request.args.get('count', '1').lower() not in ('0', 'false', 'nao', 'não'):
+        headers['X-Total-Count'] = str(db.session.execute(select(func.count(Cadastro.cpf)).where(*filtros)).scalar())
+
+    if cursor:
+        try:
+            ultimo_nome, ultimo_cpf = _decodificar_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        consulta = consulta.where(tuple_(Cadastro.nome, Cadastro.cpf) > tuple_(ultimo_nome, ultimo_cpf))
+
+    pagina = db.session.execute(consulta.limit(limit + 1)).all()
+    if len(pagina) > limit:
+        pagina = pagina[:limit]
+        proximo = _codificar_cursor([pagina[-1].nome, pagina[-1].cpf])
+        headers['X-Next-Cursor'] = proximo
+        args = request.args.to_dict()
+        args['cursor'] = proximo
+        headers['Link'] = f'<{url_for("get_all_cadastros", **args)}>; rel="next"'
+
+    response = resposta_json(serializador(pagina))
+    response.headers.extend(headers)
+    return response
 
 @app.route('/api/cadastro', methods=['POST'])
 @requires_auth
@@ -319,20 +1163,16 @@ def criar_cadastro():
     if Cadastro.query.get(data['cpf']):
         return jsonify({'error': 'CPF já cadastrado'}), 409
 
-    foto_data = data.get('foto_segurado')
-    decoded_image = None
-    if foto_data:
-        try:
-            if ',' in foto_data:
-                image_data = foto_data.split(',', 1)[1]
-            else:
-                image_data = foto_data
-
-            image_data += '=' * (-len(image_data) % 4)
-            decoded_image = base64.b64decode(image_data)
-        except (IndexError, base64.binascii.Error) as e:
-            app.logger.error(f"Erro ao decodificar imagem: {e}")
-            return jsonify({'error': 'Formato de imagem inválido. Não foi possível processar a foto.'}), 400
+    try:
+        if request.files.get('foto_segurado'):
+            foto, miniatura = processar_foto(request.files['foto_segurado'].stream)
+        elif data.get('foto_segurado'):
+            foto, miniatura = processar_foto(decodificar_data_url(data['foto_segurado']))
+        else:
+            foto, miniatura = None, None
+    except ValueError as e:
+        app.logger.error(f"Erro ao processar imagem: {e}")
+        return jsonify({'error': 'Formato de imagem inválido. Não foi possível processar a foto.'}), 400
 
     novo_cadastro = Cadastro(
         cpf=data['cpf'], nome=data['nome'], telefone=data['telefone'],
@@ -348,9 +1188,9 @@ def criar_cadastro():
         procurador_cpf=data.get('procurador_cpf'),
         tem_curador=data.get('tem_curador') == 'on',
         curador_nome=data.get('curador_nome'),
-        curador_cpf=data.get('curador_cpf'),
-        foto_segurado=decoded_image
+        curador_cpf=data.get('curador_cpf')
     )
+    novo_cadastro.guardar_foto(foto, miniatura)
     if novo_cadastro.necessita_visita_social:
         novo_cadastro.status_visita = 'Pendente'
         novo_cadastro.processo = data.get('processo')
@@ -360,117 +1200,428 @@ def criar_cadastro():
         file = request.files['documento']
         if file.filename != '':
             novo_cadastro.nome_documento = file.filename
-            novo_cadastro.documento_pdf = file.read()
+            novo_cadastro.guardar_documento(file.read())
     db.session.add(novo_cadastro)
     db.session.commit()
+    cache_estatisticas.invalidar()
     return jsonify(novo_cadastro.to_dict()), 201
 
-@app.route('/api/cadastro/<cpf>/foto', methods=['POST'])
+@app.route('/api/cadastro/<cpf>/foto', methods=['POST', 'PUT'])
 @requires_auth
 def upload_foto(cpf):
-    """Rota para upload/atualização de foto do segurado via base64."""
+    """Rota para upload/atualização de foto do segurado.
+
+    Aceita multipart (campo `foto`), o corpo binário com Content-Type image/* ou, por
+    compatibilidade, JSON com `foto_base64`. A imagem é normalizada e ganha miniatura.
+    """
     cadastro = Cadastro.query.get_or_404(cpf)
-    data = request.get_json()
 
-    if not data or 'foto_base64' not in data:
-        return jsonify({'error': 'Dados da foto (base64) não fornecidos'}), 400
-    
-    foto_data = data['foto_base64']
-    
     try:
-        if ',' in foto_data:
-            image_data = foto_data.split(',', 1)[1]
+        if request.files.get('foto'):
+            foto, miniatura = processar_foto(request.files['foto'].stream)
+        elif request.mimetype.startswith('image/'):
+            foto, miniatura = processar_foto(request.stream)
         else:
-            image_data = foto_data
+            data = request.get_json(silent=True)
+            if not data or 'foto_base64' not in data:
+                return jsonify({'error': 'Dados da foto não fornecidos'}), 400
+            foto, miniatura = processar_foto(decodificar_data_url(data['foto_base64']))
+    except ValueError as e:
+        app.logger.error(f"Erro ao processar imagem para CPF {cpf}: {e}")
+        return jsonify({'error': 'Formato de imagem inválido.'}), 400
 
-        # Adiciona padding se necessário
-        image_data += '=' * (-len(image_data) % 4)
-        decoded_image = base64.b64decode(image_data)
-        
-        cadastro.foto_segurado = decoded_image
-        db.session.commit()
-        
-        return jsonify({'success': True, 'message': 'Foto atualizada com sucesso!'}), 200
+    cadastro.guardar_foto(foto, miniatura)
+    db.session.commit()
 
-    except (IndexError, base64.binascii.Error) as e:
-        app.logger.error(f"Erro ao decodificar imagem para CPF {cpf}: {e}")
-        return jsonify({'error': 'Formato de imagem inválido.'}), 400
+    # A troca de foto incrementa a versão: o formulário de edição aberto precisa da nova
+    # para não receber 409 contra a própria alteração.
+    return jsonify({'success': True, 'message': 'Foto atualizada com sucesso!', 'versao': cadastro.versao}), 200
 
 
 @app.route('/api/cadastro/<cpf>', methods=['PUT'])
 @requires_auth
 def editar_cadastro(cpf):
+    """Edita o cadastro, registrando cada campo alterado na auditoria.
+
+    Se o corpo trouxer `versao` e ela não for a atual, o cadastro foi alterado por outra
+    pessoa desde que foi aberto e a edição é recusada com 409.
+    """
     cadastro = Cadastro.query.get_or_404(cpf)
     data = request.get_json()
     atendente = data.get('atendente')
     if not atendente: return jsonify({'error': 'Nome do atendente é obrigatório para editar'}), 400
-    campos_para_comparar = ['nome', 'telefone', 'email', 'matricula', 'is_whatsapp', 'qualidade', 'data_atendimento', 'informacao', 'obs', 'processo', 'endereco', 'assunto_visita', 'procurador_nome', 'procurador_cpf', 'curador_nome', 'curador_cpf']
-    for campo in campos_para_comparar:
-        if campo in data:
-            valor_novo_str = str(data.get(campo, ''))
-            if campo == 'is_whatsapp':
-                valor_novo_bool = valor_novo_str.lower() == 'sim'
-                if valor_novo_bool != cadastro.is_whatsapp:
-                    log = AuditoriaAlteracoes(cadastro_cpf=cpf, atendente=atendente, campo_alterado=campo, valor_antigo='Sim' if cadastro.is_whatsapp else 'Não', valor_novo='Sim' if valor_novo_bool else 'Não')
-                    db.session.add(log)
-                    cadastro.is_whatsapp = valor_novo_bool
-            elif campo == 'data_atendimento':
-                valor_novo_date = datetime.strptime(valor_novo_str, '%Y-%m-%d').date()
-                if valor_novo_date != cadastro.data_atendimento:
-                    log = AuditoriaAlteracoes(cadastro_cpf=cpf, atendente=atendente, campo_alterado=campo, valor_antigo=str(cadastro.data_atendimento), valor_novo=str(valor_novo_date))
-                    db.session.add(log)
-                    cadastro.data_atendimento = valor_novo_date
-            else:
-                valor_antigo_str = str(getattr(cadastro, campo) or '')
-                if valor_novo_str != valor_antigo_str:
-                    log = AuditoriaAlteracoes(cadastro_cpf=cpf, atendente=atendente, campo_alterado=campo, valor_antigo=valor_antigo_str, valor_novo=valor_novo_str)
-                    db.session.add(log)
-                    setattr(cadastro, campo, data.get(campo))
+    conflito = jsonify({'error': 'Este cadastro foi alterado por outro atendente. Recarregue-o antes de salvar.'}), 409
+    if data.get('versao') is not None and str(data['versao']) != str(cadastro.versao):
+        return conflito
+    try:
+        aplicar_alteracoes(cadastro, data, CAMPOS_AUDITADOS)
+    except ValueError:
+        return jsonify({'error': 'Data de atendimento inválida'}), 400
+    alteracoes = coletar_alteracoes([cadastro], atendente, CAMPOS_AUDITADOS)
+    if not alteracoes:
+        # Salvar sem mudar nada não toca a linha, nem a versão que outros atendentes têm abertas.
+        return jsonify(cadastro.to_dict())
+    registrar_auditoria(alteracoes)
     cadastro.atendente_modificacao = atendente
-    db.session.commit()
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return conflito
+    cache_estatisticas.invalidar()
     return jsonify(cadastro.to_dict())
 
+class RespostaNaoModificada(Response):
+    """304 que mantém o Last-Modified: o Werkzeug o remove junto com os cabeçalhos de entidade,
+    e sem ele o navegador que revalida por data perde a referência da versão guardada."""
+
+    def __init__(self, etag, ultima_modificacao):
+        super().__init__(status=304)
+        self.set_etag(etag)
+        self.ultima_modificacao = ultima_modificacao
+
+    def get_wsgi_headers(self, environ):
+        headers = super().get_wsgi_headers(environ)
+        if self.ultima_modificacao:
+            headers['Last-Modified'] = http_date(self.ultima_modificacao)
+        return headers
+
+def _resposta_blob(cpf, coluna_hash, sufixo_etag='', tipo='blob', coluna_nome=None, **send_file_args):
+    """Serve um blob do cadastro com ETag/Last-Modified, 304 e suporte a Range.
+
+    O hash do conteúdo (`coluna_hash`) é a ETag, então um GET condicional que resulta em 304
+    nem chega ao armazenamento de blobs. Com `coluna_nome`, o nome do arquivo vem na mesma
+    consulta e, se preenchido, substitui o `download_name` padrão.
+    """
+    meta = db.session.query(coluna_hash, func.coalesce(Cadastro.data_modificacao, Cadastro.data_criacao),
+                            coluna_nome if coluna_nome is not None else null()).filter(Cadastro.cpf == cpf).first()
+    if not meta or not meta[0]:
+        return None
+    conteudo_hash, ultima_modificacao, nome_arquivo = meta
+    if nome_arquivo:
+        send_file_args['download_name'] = nome_arquivo
+    if ultima_modificacao:
+        ultima_modificacao = ultima_modificacao.replace(tzinfo=timezone.utc, microsecond=0)
+
+    etag = conteudo_hash + sufixo_etag
+    if not is_resource_modified(request.environ, etag=etag, last_modified=ultima_modificacao):
+        response = RespostaNaoModificada(etag, ultima_modificacao)
+    else:
+        try:
+            # No backend local o arquivo é servido direto do disco, sem passar pela memória.
+            arquivo = armazenamento_blobs.caminho_local(conteudo_hash) or io.BytesIO(armazenamento_blobs.ler(conteudo_hash))
+        except FileNotFoundError:
+            app.logger.error(f"Blob {conteudo_hash} do CPF {cpf} não encontrado no armazenamento")
+            return None
+        response = send_file(arquivo, etag=etag, last_modified=ultima_modificacao, conditional=True, max_age=None, **send_file_args)
+    if response.status_code in (200, 206):
+        metrica_blob_bytes.inc(response.content_length or 0, tipo=tipo)
+    # Dados pessoais: só o navegador guarda, e sempre revalida (barato graças ao 304).
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/api/documento/<cpf>', methods=['GET'])
 def get_documento(cpf):
-    cadastro = Cadastro.query.get(cpf)
-    if not cadastro or not cadastro.documento_pdf: return "Documento não encontrado", 404
-    return send_file(io.BytesIO(cadastro.documento_pdf), mimetype='application/pdf', as_attachment=False, download_name=cadastro.nome_documento or 'documento.pdf')
+    response = _resposta_blob(cpf, Cadastro.documento_hash, tipo='documento_pdf', coluna_nome=Cadastro.nome_documento,
+                              mimetype='application/pdf', as_attachment=False, download_name='documento.pdf')
+    if response is None: return "Documento não encontrado", 404
+    return response
 
 @app.route('/api/foto/<cpf>', methods=['GET'])
 def get_foto(cpf):
-    cadastro = Cadastro.query.get(cpf)
-    if not cadastro or not cadastro.foto_segurado: return "Foto não encontrada", 404
-    return send_file(io.BytesIO(cadastro.foto_segurado), mimetype='image/jpeg')
+    """Serve a foto do segurado; `?size=thumb` devolve a miniatura, usada nas listagens."""
+    if request.args.get('size') == 'thumb':
+        # Cadastros anteriores às miniaturas caem para a foto completa.
+        response = _resposta_blob(cpf, func.coalesce(Cadastro.foto_miniatura_hash, Cadastro.foto_hash), '-thumb', tipo='foto_miniatura', mimetype='image/jpeg')
+    else:
+        response = _resposta_blob(cpf, Cadastro.foto_hash, tipo='foto_segurado', mimetype='image/jpeg')
+    if response is None: return "Foto não encontrada", 404
+    return response
 
 @app.route('/api/visitas/<status>', methods=['GET'])
 @requires_auth
 def get_visitas(status):
-    if status == 'pendentes':
-        visitas = Cadastro.query.filter_by(status_visita='Pendente').order_by(Cadastro.nome).all()
-    elif status == 'realizadas':
-        visitas = Cadastro.query.filter_by(status_visita='Realizada').order_by(Cadastro.nome).all()
-    else:
+    """Cadastros com visita pendente ou realizada; com `since`, só o que mudou na lista."""
+    if status not in STATUS_VISITA_EXPORTACAO:
         return jsonify({'error': 'Status inválido'}), 400
-    return jsonify([v.to_dict() for v in visitas])
+    serializador = serializador_cadastros(tuple(CAMPOS_PROJECAO))
+    if request.args.get('since') is not None:
+        return _resposta_sincronizacao([Cadastro.status_visita == STATUS_VISITA_EXPORTACAO[status]], serializador)
+    consulta = select(*serializador.colunas).where(Cadastro.status_visita == STATUS_VISITA_EXPORTACAO[status]).order_by(Cadastro.nome)
+    return resposta_json(serializador(db.session.execute(consulta)))
+
+def realizar_visitas(condicao, atendente):
+    """Passa de Pendente para Realizada, numa instrução só, as visitas dos cadastros que
+    atendem a `condicao`, e grava a auditoria na mesma transação (o commit fica com quem chama).
+
+    Retorna os CPFs que mudaram de status. O `status_visita = 'Pendente'` no WHERE garante que
+    duas requisições simultâneas não realizam (nem auditam) a mesma visita duas vezes.
+    """
+    tabela = Cadastro.__table__
+    agora = datetime.utcnow()
+    atualizar = tabela.update().where(tabela.c.status_visita == 'Pendente', condicao).values(
+        status_visita='Realizada', atendente_modificacao=atendente, data_modificacao=agora, versao=tabela.c.versao + 1)
+    if db.engine.dialect.name == 'postgresql':
+        cpfs = db.session.execute(atualizar.returning(tabela.c.cpf)).scalars().all()
+    else:
+        # O SQLAlchemy 1.4 não gera RETURNING para o SQLite. Depois do UPDATE a transação tem
+        # o lock de escrita do banco, então as linhas marcadas com este data_modificacao são
+        # exatamente as que ele alterou.
+        db.session.execute(atualizar)
+        cpfs = db.session.execute(select(tabela.c.cpf).where(
+            condicao, tabela.c.status_visita == 'Realizada', tabela.c.data_modificacao == agora,
+            tabela.c.atendente_modificacao == atendente)).scalars().all()
+    registrar_auditoria([{
+        'cadastro_cpf': cpf, 'atendente': atendente, 'data_alteracao': agora,
+        'campo_alterado': 'status_visita', 'valor_antigo': 'Pendente', 'valor_novo': 'Realizada',
+    } for cpf in cpfs])
+    return cpfs
 
 @app.route('/api/visita/realizar/<cpf>', methods=['POST'])
 @requires_auth
 def marcar_visita_realizada(cpf):
-    cadastro = Cadastro.query.get(cpf)
-    if not cadastro: return jsonify({'error': 'Cadastro não encontrado'}), 404
-    cadastro.status_visita = 'Realizada'
+    realizada = realizar_visitas(Cadastro.cpf == cpf, g.usuario.username)
     db.session.commit()
+    if not realizada:
+        status_visita = db.session.query(Cadastro.status_visita).filter(Cadastro.cpf == cpf).first()
+        if not status_visita: return jsonify({'error': 'Cadastro não encontrado'}), 404
+        if status_visita[0] != 'Realizada': return jsonify({'error': 'Este cadastro não tem visita pendente'}), 409
+    cache_estatisticas.invalidar()
     return jsonify({'success': True, 'message': 'Visita marcada como realizada.'})
 
+@app.route('/api/visitas/realizar', methods=['POST'])
+@requires_auth
+def marcar_visitas_realizadas():
+    """Marca como realizadas, de uma vez, as visitas pendentes de uma lista de CPFs (`cpfs`) ou
+    dos cadastros atendidos num período (`data_inicio`/`data_fim`, AAAA-MM-DD).
+
+    Responde com o resultado de cada CPF: `realizada`, `ja_realizada`, `sem_visita` ou
+    `nao_encontrado` (no modo período, só aparecem as realizadas). Cada visita realizada
+    entra na auditoria em nome de `atendente` (padrão: o utilizador autenticado).
+    """
+    data = corpo_json_objeto()
+    if data is None:
+        return jsonify({'error': 'O corpo deve ser um objeto JSON'}), 400
+    atendente = data.get('atendente') or g.usuario.username
+    limite = app.config['VISITAS_MAX_LOTE']
+    cpfs = data.get('cpfs')
+    if cpfs is not None:
+        if not isinstance(cpfs, list) or not cpfs or not all(isinstance(cpf, str) for cpf in cpfs):
+            return jsonify({'error': "'cpfs' deve ser uma lista de CPFs"}), 400
+        cpfs = list(dict.fromkeys(cpfs))
+        if len(cpfs) > limite:
+            return jsonify({'error': f'No máximo {limite} visitas por requisição'}), 400
+        condicao = Cadastro.cpf.in_(cpfs)
+    else:
+        try:
+            inicio = datetime.strptime(data['data_inicio'], '%Y-%m-%d').date()
+            fim = datetime.strptime(data.get('data_fim') or data['data_inicio'], '%Y-%m-%d').date()
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': "Informe 'cpfs' ou 'data_inicio'/'data_fim' (AAAA-MM-DD)"}), 400
+        condicao = Cadastro.data_atendimento.between(inicio, fim)
+        pendentes = db.session.query(func.count(Cadastro.cpf)).filter(condicao, Cadastro.status_visita == 'Pendente').scalar()
+        if pendentes > limite:
+            return jsonify({'error': f'O período tem mais de {limite} visitas pendentes; reduza o intervalo'}), 400
+
+    realizadas = realizar_visitas(condicao, atendente)
+    resultados = dict.fromkeys(realizadas, 'realizada')
+    if cpfs is not None:
+        restantes = [cpf for cpf in cpfs if cpf not in resultados]
+        status_atual = dict(db.session.query(Cadastro.cpf, Cadastro.status_visita).filter(Cadastro.cpf.in_(restantes))) if restantes else {}
+        for cpf in restantes:
+            if cpf not in status_atual:
+                resultados[cpf] = 'nao_encontrado'
+            else:
+                resultados[cpf] = 'ja_realizada' if status_atual[cpf] == 'Realizada' else 'sem_visita'
+    db.session.commit()
+    if realizadas:
+        cache_estatisticas.invalidar()
+    ordem = cpfs if cpfs is not None else sorted(resultados)
+    return jsonify({
+        'realizadas': len(realizadas),
+        'resultados': [{'cpf': cpf, 'resultado': resultados[cpf]} for cpf in ordem],
+    })
+
+# --- Sincronização Incremental ---
+# Clientes que guardam uma cópia local das listas pedem só o que mudou desde a última vez
+# (`since=<cursor>` em /api/cadastros e /api/visitas/<status>) ou recebem as mudanças por
+# server-sent events em /api/cadastros/stream. O cursor é o `seq` de alteracoes_cadastros,
+# que os triggers da migração 0007 numeram na ordem de commit.
+LIMITE_SINCRONIZACAO = 5000
+
+def _seq_do_since(valor):
+    """`seq` a partir do qual sincronizar: o cursor de uma resposta anterior ou um instante ISO 8601."""
+    if valor.isdigit():
+        return int(valor)
+    try:
+        instante = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('Parâmetro since inválido: use o cursor da sincronização anterior ou uma data ISO 8601')
+    if instante.tzinfo:
+        instante = instante.astimezone(timezone.utc).replace(tzinfo=None)
+    # Numa consulta só (mesmo snapshot): antes da primeira alteração a partir do instante ou,
+    # se não houve nenhuma, a última alteração existente.
+    log = AlteracaoCadastro.__table__
+    primeira = select(func.min(log.c.seq) - 1).where(log.c.data_alteracao >= instante).scalar_subquery()
+    return db.session.execute(select(func.coalesce(primeira, func.max(log.c.seq), 0))).scalar()
+
+def consultar_alteracoes(filtros, serializador, seq, limite=LIMITE_SINCRONIZACAO):
+    """Cadastros alterados depois de `seq`, na ordem das alterações.
+
+    `cadastros` traz os que atendem a `filtros`; `removidos`, os CPFs apagados ou que deixaram
+    de atender (ex.: a visita saiu de Pendente). `cursor` é o `since` da próxima chamada e
+    `mais` indica que há alterações além de `limite`. Com seq 0 (cópia vazia) não há removidos.
+    """
+    log = AlteracaoCadastro.__table__
+    presente = and_(Cadastro.cpf.isnot(None), *filtros)
+    consulta = (select(*serializador.colunas, log.c.seq, log.c.cpf.label('cpf_alterado'), presente.label('presente'))
+                .select_from(log.outerjoin(Cadastro.__table__, Cadastro.cpf == log.c.cpf))
+                .where(log.c.seq > seq).order_by(log.c.seq).limit(limite + 1))
+    if seq == 0:
+        consulta = consulta.where(presente)
+    linhas = db.session.execute(consulta).all()
+    mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    return {
+        'cadastros': serializador([linha for linha in linhas if linha.presente]),
+        'removidos': [linha.cpf_alterado for linha in linhas if not linha.presente],
+        'cursor': str(linhas[-1].seq if linhas else seq),
+        'mais': mais,
+    }
+
+def _resposta_sincronizacao(filtros, serializador):
+    """Resposta de `since=` nas listagens; `limit` (até LIMITE_SINCRONIZACAO) limita as alterações por chamada."""
+    try:
+        limite = min(int(request.args.get('limit') or LIMITE_SINCRONIZACAO), LIMITE_SINCRONIZACAO)
+        if limite < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Parâmetro limit inválido'}), 400
+    try:
+        seq = _seq_do_since(request.args['since'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return resposta_json(consultar_alteracoes(filtros, serializador, seq, limite))
+
+class VigiaAlteracoes:
+    """Maior `seq` do log de alterações, consultado no máximo uma vez por intervalo em cada
+    processo: o custo do polling não cresce com o número de streams abertos."""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._valor = 0
+        self._consultado_em = float('-inf')
+
+    def ultima(self):
+        with self._lock:
+            if time.monotonic() - self._consultado_em < self.intervalo:
+                return self._valor
+            # Reserva a próxima consulta; até ela terminar, os outros threads usam o valor atual.
+            self._consultado_em = time.monotonic()
+        valor = db.session.execute(select(func.max(AlteracaoCadastro.seq))).scalar() or 0
+        with self._lock:
+            self._valor = max(self._valor, valor)
+            return self._valor
+
+vigia_alteracoes = VigiaAlteracoes(app.config['SSE_POLL_INTERVAL'])
+
+def vagas_para_streams(classe_worker, threads, conexoes, reservadas):
+    """Streams simultâneos por processo: as threads do gthread (ou as conexões do gevent, em
+    que cada stream é um greenlet) menos as `reservadas` às demais rotas, no mínimo 1."""
+    capacidade = conexoes if classe_worker == 'gevent' else threads
+    return max(capacidade - reservadas, 1)
+
+if not app.config['SSE_MAX_STREAMS']:
+    # O gunicorn.conf.py publica a configuração do worker; fora do gunicorn valem os mesmos padrões.
+    app.config['SSE_MAX_STREAMS'] = vagas_para_streams(
+        os.environ.get('GUNICORN_WORKER_CLASS', 'gthread'), int(os.environ.get('GUNICORN_THREADS', 4)),
+        int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100)), app.config['SSE_RESERVED_THREADS'])
+
+# Streams abertos neste processo. Acima do limite, /api/cadastros/stream responde 503 em vez
+# de ocupar as threads que atendem as demais rotas.
+vagas_streams = threading.BoundedSemaphore(app.config['SSE_MAX_STREAMS'])
+
+def _gerar_eventos_alteracoes(filtros, serializador, seq):
+    intervalo = app.config['SSE_POLL_INTERVAL']
+    fim = time.monotonic() + app.config['SSE_MAX_SECONDS']
+    ultimo_envio = time.monotonic()
+    yield f"retry: {int(intervalo * 1000)}\n\n"
+    try:
+        while time.monotonic() < fim:
+            if vigia_alteracoes.ultima() > seq:
+                dados = consultar_alteracoes(filtros, serializador, seq)
+                seq = int(dados['cursor'])
+                if dados['cadastros'] or dados['removidos']:
+                    yield f"id: {seq}\nevent: alteracoes\ndata: {codificar_json(dados).decode('utf-8')}\n\n"
+                    ultimo_envio = time.monotonic()
+                if dados['mais']:
+                    continue
+            # A conexão volta ao pool durante a espera; um stream aberto não prende nenhuma.
+            db.session.remove()
+            if time.monotonic() - ultimo_envio >= app.config['SSE_HEARTBEAT_SECONDS']:
+                # Comentário SSE: mantém a conexão viva em proxies que derrubam conexões ociosas.
+                yield ": ping\n\n"
+                ultimo_envio = time.monotonic()
+            time.sleep(intervalo)
+    finally:
+        db.session.remove()
+
+@app.route('/api/cadastros/stream', methods=['GET'])
+@requires_auth
+def stream_alteracoes():
+    """Server-sent events com as alterações dos cadastros, para manter uma cópia local em dia.
+
+    Cada evento `alteracoes` traz o mesmo JSON do `since=` das listagens e tem o cursor como
+    id. Começa em `since` ou no Last-Event-ID que o EventSource reenvia ao reconectar; sem
+    nenhum dos dois, só o que mudar daqui em diante. Aceita `status` (pendentes ou
+    realizadas) para acompanhar uma lista de visitas e `fields` como /api/cadastros. A
+    conexão é encerrada após SSE_MAX_SECONDS e o EventSource reconecta de onde parou.
+
+    Cada processo mantém no máximo SSE_MAX_STREAMS streams; acima disso responde 503 com
+    Retry-After, e o cliente pode recorrer ao `since=` das listagens.
+    """
+    filtros = []
+    status = request.args.get('status')
+    if status is not None:
+        if status not in STATUS_VISITA_EXPORTACAO:
+            return jsonify({'error': 'Status inválido'}), 400
+        filtros.append(Cadastro.status_visita == STATUS_VISITA_EXPORTACAO[status])
+    try:
+        campos = _campos_pedidos(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    inicio = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        seq = _seq_do_since(inicio) if inicio else (db.session.execute(select(func.max(AlteracaoCadastro.seq))).scalar() or 0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.remove()
+    if not vagas_streams.acquire(blocking=False):
+        return jsonify({'error': 'Limite de streams abertos atingido; tente novamente em instantes'}), 503, {'Retry-After': '30'}
+    try:
+        eventos = _gerar_eventos_alteracoes(filtros, serializador_cadastros(tuple(campos)), seq)
+        resposta = Response(stream_with_context(eventos), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception:
+        vagas_streams.release()
+        raise
+    # O servidor fecha a resposta mesmo quando o cliente cai antes do primeiro evento.
+    resposta.call_on_close(vagas_streams.release)
+    return resposta
+
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     if not data or not data.get('username') or not data.get('password'):
         return jsonify({'error': 'Utilizador e senha são obrigatórios'}), 400
 
-    user = User.query.filter_by(username=data['username']).first()
-    if user and user.password == data['password']:
-        return jsonify({"success": True, "user": user.to_dict()})
+    usuario = check_auth(data['username'], data['password'])
+    if usuario:
+        user_data = {"id": usuario.id, "username": usuario.username, "permissions": usuario.permissions}
+        return jsonify({"success": True, "user": user_data, "token": gerar_token(usuario)})
 
     return jsonify({'success': False, 'error': 'Credenciais inválidas'}), 401
 
@@ -479,25 +1630,25 @@ def login():
 def change_password():
     """Rota para alteração de senha do usuário"""
     data = request.get_json()
-    auth = request.authorization
 
     if not data or not data.get('new_password'):
         return jsonify({'error': 'Nova senha é obrigatória'}), 400
 
     # Verificar se é um usuário normal tentando alterar sua própria senha
-    if auth.username != ADMIN_USERNAME:
+    if g.usuario.username != ADMIN_USERNAME:
         if not data.get('current_password'):
             return jsonify({'error': 'Senha atual é obrigatória'}), 400
 
         # Verificar senha atual
-        user = User.query.filter_by(username=auth.username).first()
-        if not user or user.password != data['current_password']:
+        user = User.query.get(g.usuario.id)
+        if not user or not verificar_senha(user, data['current_password']):
             return jsonify({'error': 'Senha atual incorreta'}), 400
 
-        # Alterar senha
-        user.password = data['new_password']
+        # Alterar senha (os tokens emitidos antes deixam de valer)
+        user.password = gerar_hash_senha(data['new_password'])
         db.session.commit()
-        return jsonify({'success': True, 'message': 'Senha alterada com sucesso!'})
+        invalidar_cache_usuario(user.id)
+        return jsonify({'success': True, 'message': 'Senha alterada com sucesso!', 'token': gerar_token(_usuario_autenticado(user))})
 
     return jsonify({'error': 'Operação não permitida'}), 403
 
@@ -518,8 +1669,9 @@ def reset_password():
     if user.username == ADMIN_USERNAME:
         return jsonify({'error': 'Não é possível resetar a senha do administrador'}), 403
 
-    user.password = data['new_password']
+    user.password = gerar_hash_senha(data['new_password'])
     db.session.commit()
+    invalidar_cache_usuario(user.id)
 
     return jsonify({'success': True, 'message': 'Senha resetada com sucesso!'})
 
@@ -541,7 +1693,7 @@ def create_user():
 
     new_user = User(
         username=data['username'],
-        password=data['password'],
+        password=gerar_hash_senha(data['password']),
         permissions=data.get('permissions', {})
     )
     db.session.add(new_user)
@@ -556,6 +1708,7 @@ def update_user_permissions(user_id):
     if 'permissions' in data:
         user.permissions = data['permissions']
         db.session.commit()
+        invalidar_cache_usuario(user.id)
         return jsonify(user.to_dict())
     return jsonify({'error': 'Nenhuma permissão fornecida'}), 400
 
@@ -570,60 +1723,313 @@ def delete_user(user_id):
 
     db.session.delete(user)
     db.session.commit()
+    invalidar_cache_usuario(user_id)
     return jsonify({'success': True, 'message': 'Utilizador apagado com sucesso.'})
 
+# --- Log de Auditoria ---
+COLUNAS_AUDITORIA = ['id', 'cadastro_cpf', 'atendente', 'data_alteracao', 'campo_alterado', 'valor_antigo', 'valor_novo']
+LINHAS_POR_LOTE_ARQUIVAMENTO = 5000
+
+# Linhas do Core, na ordem de COLUNAS_AUDITORIA; as datas ficam para o codificar_json.
+serializar_auditoria = Serializador(AuditoriaAlteracoes, COLUNAS_AUDITORIA)
+
+def _ler_data_filtro(valor, fim=False):
+    """AAAA-MM-DD ou data/hora ISO. Uma data sem hora em `fim` inclui o dia inteiro."""
+    if not valor:
+        return None
+    try:
+        if len(valor) == 10:
+            dia = datetime.strptime(valor, '%Y-%m-%d')
+            return dia + timedelta(days=1) if fim else dia
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f"Data inválida: {valor}")
+
+def _consultas_auditoria(args):
+    """Consultas (Core) do log, mais recentes primeiro: a tabela principal e, com
+    `arquivo=1`, em seguida a de arquivo, cujos registros são todos mais antigos."""
+    inicio = _ler_data_filtro(args.get('de'))
+    fim = _ler_data_filtro(args.get('ate'), fim=True)
+    filtro = filtro_cpf(args.get('cpf'))
+    tabelas = [AuditoriaAlteracoes.__table__]
+    if args.get('arquivo', '').lower() in ('1', 'true', 'sim'):
+        tabelas.append(AuditoriaAlteracoesArquivo.__table__)
+
+    consultas = []
+    for tabela in tabelas:
+        consulta = select(*[tabela.c[coluna] for coluna in COLUNAS_AUDITORIA])
+        if filtro is not None:
+            consulta = consulta.where(tabela.c.cadastro_cpf.in_(select(Cadastro.cpf).where(filtro)))
+        if args.get('atendente'):
+            consulta = consulta.where(tabela.c.atendente == args['atendente'])
+        if inicio:
+            consulta = consulta.where(tabela.c.data_alteracao >= inicio)
+        if fim:
+            consulta = consulta.where(tabela.c.data_alteracao < fim)
+        consultas.append(consulta.order_by(tabela.c.data_alteracao.desc(), tabela.c.id.desc()))
+    return consultas
+
+def _gerar_ndjson_auditoria(consultas):
+    buffer = io.BytesIO()
+    total = 0
+    try:
+        for consulta in consultas:
+            resultado = db.session.execute(consulta.execution_options(stream_results=True, yield_per=LINHAS_POR_LOTE_EXPORTACAO))
+            for lote in resultado.partitions():
+                for registro in serializar_auditoria(lote):
+                    buffer.write(codificar_json(registro))
+                    buffer.write(b'\n')
+                total += len(lote)
+                if buffer.tell() >= TAMANHO_BLOCO_CSV:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        metrica_exportacao_linhas.inc(total, exportacao='auditoria_ndjson')
+
 @app.route('/api/audit_logs', methods=['GET'])
 @requires_auth
 def get_audit_logs():
-    cpf_filter = request.args.get('cpf')
-    query = AuditoriaAlteracoes.query
-    if cpf_filter:
-        query = query.filter(AuditoriaAlteracoes.cadastro_cpf.like(f"%{cpf_filter}%"))
-    logs = query.order_by(AuditoriaAlteracoes.data_alteracao.desc()).all()
-    return jsonify([log.to_dict() for log in logs])
-
-def _get_statistics_data():
-    """Helper function to fetch statistics data."""
-    total_cadastros = db.session.query(func.count(Cadastro.cpf)).scalar() or 0
-    visitas_pendentes = Cadastro.query.filter_by(status_visita='Pendente').count()
-    visitas_realizadas = Cadastro.query.filter_by(status_visita='Realizada').count()
-    
-    qualidade_counts = db.session.query(Cadastro.qualidade, func.count(Cadastro.qualidade)).group_by(Cadastro.qualidade).all()
-    qualidade_data = {q: c for q, c in qualidade_counts}
-    
-    today = date.today()
-    last_7_days = [today - timedelta(days=i) for i in range(7)]
-    daily_counts_query = db.session.query(func.cast(Cadastro.data_atendimento, db.Date), func.count(Cadastro.data_atendimento)).filter(func.cast(Cadastro.data_atendimento, db.Date).in_(last_7_days)).group_by(func.cast(Cadastro.data_atendimento, db.Date)).all()
-    daily_data_from_db = {d.strftime('%Y-%m-%d'): c for d, c in daily_counts_query}
-    daily_data = {day.strftime('%d/%m'): daily_data_from_db.get(day.strftime('%Y-%m-%d'), 0) for day in reversed(last_7_days)}
-
-    com_whatsapp = Cadastro.query.filter_by(is_whatsapp=True).count()
-    whatsapp_data = {
-        "Com WhatsApp": com_whatsapp,
-        "Sem WhatsApp": total_cadastros - com_whatsapp
-    }
-    
-    com_email = Cadastro.query.filter(and_(Cadastro.email.isnot(None), Cadastro.email != '')).count()
-    email_data = {
-        "Com Email": com_email,
-        "Sem Email": total_cadastros - com_email
-    }
-    
+    """Log de auditoria, do mais recente para o mais antigo.
+
+    Filtros: `cpf` (parcial), `atendente`, `de`/`ate` (data ou data/hora ISO) e `arquivo=1`
+    para incluir os registros arquivados. Sem `limit`/`cursor` devolve tudo o que passar nos
+    filtros (comportamento original); com eles pagina por chave (data_alteracao, id), com a
+    próxima página em `X-Next-Cursor`. `formato=ndjson` exporta em streaming, um JSON por linha.
+    """
+    try:
+        consultas = _consultas_auditoria(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('formato') == 'ndjson':
+        blocos = _gerar_ndjson_auditoria(consultas)
+        headers = {'Content-Disposition': f"attachment; filename=auditoria_{datetime.now().strftime('%Y%m%d')}.ndjson", 'Vary': 'Accept-Encoding'}
+        if request.accept_encodings['gzip']:
+            blocos = _comprimir_gzip(blocos)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(blocos), mimetype='application/x-ndjson', headers=headers)
+
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return resposta_json([registro for consulta in consultas for registro in serializar_auditoria(db.session.execute(consulta))])
+
+    try:
+        limit = min(int(limit or LIMITE_MAXIMO_PAGINA), LIMITE_MAXIMO_PAGINA)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Parâmetro limit inválido'}), 400
+    if cursor:
+        try:
+            ultima_data, ultimo_id = _decodificar_cursor(cursor)
+            ultima_data = datetime.fromisoformat(ultima_data)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Cursor inválido'}), 400
+
+    pagina = []
+    for consulta in consultas:
+        if cursor:
+            tabela = consulta.selected_columns.id.table
+            consulta = consulta.where(tuple_(tabela.c.data_alteracao, tabela.c.id) < tuple_(ultima_data, ultimo_id))
+        pagina.extend(db.session.execute(consulta.limit(limit + 1 - len(pagina))).all())
+        if len(pagina) > limit:
+            break
+
+    headers = {}
+    if len(pagina) > limit:
+        pagina = pagina[:limit]
+        proximo = _codificar_cursor([pagina[-1].data_alteracao.isoformat(), pagina[-1].id])
+        headers['X-Next-Cursor'] = proximo
+        args = request.args.to_dict()
+        args['cursor'] = proximo
+        headers['Link'] = f'<{url_for("get_audit_logs", **args)}>; rel="next"'
+
+    response = resposta_json(serializar_auditoria(pagina))
+    response.headers.extend(headers)
+    return response
+
+def arquivar_auditoria(corte, lote=LINHAS_POR_LOTE_ARQUIVAMENTO):
+    """Move para auditoria_alteracoes_arquivo os registros anteriores a `corte`, em lotes
+    (uma transação por lote, para não segurar locks na tabela principal). Retorna o total movido."""
+    principal = AuditoriaAlteracoes.__table__
+    arquivo = AuditoriaAlteracoesArquivo.__table__
+    total = 0
+    while True:
+        ids = db.session.execute(select(principal.c.id).where(principal.c.data_alteracao < corte).order_by(principal.c.id).limit(lote)).scalars().all()
+        if not ids:
+            break
+        db.session.execute(arquivo.insert().from_select(COLUNAS_AUDITORIA, select(*[principal.c[c] for c in COLUNAS_AUDITORIA]).where(principal.c.id.in_(ids))))
+        db.session.execute(principal.delete().where(principal.c.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+    return total
+
+class CacheEstatisticas:
+    """Cache em memória (por processo) do último resultado de _get_statistics_data.
+
+    As rotas que alteram cadastros chamam invalidar(); o TTL limita a defasagem vista por
+    outros workers do gunicorn, que mantêm cada um o seu próprio cache.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._chave = None
+        self._valor = None
+        self._expira_em = 0.0
+        self._geracao = 0
+
+    def obter(self, chave, calcular):
+        with self._lock:
+            if self._chave == chave and time.monotonic() < self._expira_em:
+                return self._valor
+            geracao = self._geracao
+        valor = calcular()
+        with self._lock:
+            # Se houve invalidar() durante o cálculo, o valor pode ser anterior à escrita:
+            # serve a quem pediu, mas não fica no cache.
+            if self._geracao == geracao:
+                self._chave, self._valor = chave, valor
+                self._expira_em = time.monotonic() + self.ttl
+        return valor
+
+    def invalidar(self):
+        with self._lock:
+            self._geracao += 1
+            self._chave = None
+            self._valor = None
+
+cache_estatisticas = CacheEstatisticas(app.config['STATISTICS_CACHE_TTL'])
+
+GRANULARIDADES = ('day', 'week', 'month')
+
+def _inicio_do_periodo(dia, granularidade):
+    if granularidade == 'week':
+        return dia - timedelta(days=dia.weekday())
+    if granularidade == 'month':
+        return dia.replace(day=1)
+    return dia
+
+def _proximo_periodo(inicio, granularidade):
+    if granularidade == 'week':
+        return inicio + timedelta(days=7)
+    if granularidade == 'month':
+        return (inicio + timedelta(days=32)).replace(day=1)
+    return inicio + timedelta(days=1)
+
+def _rotulo_periodo(inicio, granularidade):
+    return inicio.strftime('%Y-%m') if granularidade == 'month' else inicio.isoformat()
+
+def _totais_estatisticas(de, ate):
+    """Totais dos cadastros atendidos entre `de` e `ate` (None = sem limite), lidos do rollup.
+
+    O custo depende só do número de linhas do rollup no período (dias x combinações de
+    dimensões), não do tamanho da tabela cadastros.
+    """
+    e = EstatisticaDiaria
+    dimensoes = [e.qualidade, e.atendente, e.com_whatsapp, e.com_email, e.status_visita]
+    consulta = db.session.query(*dimensoes, func.sum(e.total)).group_by(*dimensoes)
+    if de:
+        consulta = consulta.filter(e.dia >= de)
+    if ate:
+        consulta = consulta.filter(e.dia <= ate)
+
+    qualidade_data, atendente_data = {}, {}
+    total_cadastros = visitas_pendentes = visitas_realizadas = com_whatsapp = com_email = 0
+    for qualidade, atendente, whatsapp, email, status_visita, soma in consulta:
+        if not soma:
+            continue
+        qualidade_data[qualidade] = qualidade_data.get(qualidade, 0) + soma
+        atendente_data[atendente] = atendente_data.get(atendente, 0) + soma
+        total_cadastros += soma
+        com_whatsapp += soma if whatsapp else 0
+        com_email += soma if email else 0
+        visitas_pendentes += soma if status_visita == 'Pendente' else 0
+        visitas_realizadas += soma if status_visita == 'Realizada' else 0
+
     return {
         'total_cadastros': total_cadastros,
         'visitas_pendentes': visitas_pendentes,
         'visitas_realizadas': visitas_realizadas,
-        'qualidade_data': qualidade_data,
-        'daily_data': daily_data,
-        'whatsapp_data': whatsapp_data,
-        'email_data': email_data
+        'qualidade_data': dict(sorted(qualidade_data.items())),
+        'atendente_data': dict(sorted(atendente_data.items())),
+        'whatsapp_data': {
+            "Com WhatsApp": com_whatsapp,
+            "Sem WhatsApp": total_cadastros - com_whatsapp
+        },
+        'email_data': {
+            "Com Email": com_email,
+            "Sem Email": total_cadastros - com_email
+        }
     }
 
+def _serie_cadastros(de, ate, granularidade, rotular):
+    """Cadastros atendidos por período entre `de` e `ate`, com zero nos períodos vazios."""
+    serie = {}
+    inicio = _inicio_do_periodo(de, granularidade)
+    while inicio <= ate:
+        serie[rotular(inicio)] = 0
+        inicio = _proximo_periodo(inicio, granularidade)
+    e = EstatisticaDiaria
+    for dia, soma in db.session.query(e.dia, func.sum(e.total)).filter(e.dia.between(de, ate)).group_by(e.dia):
+        serie[rotular(_inicio_do_periodo(dia, granularidade))] += soma
+    return serie
+
+def _ler_periodo_estatisticas(args):
+    """(de, ate, granularidade) de `from`/`to` (AAAA-MM-DD) e `granularity`; ValueError se inválidos."""
+    granularidade = args.get('granularity')
+    if granularidade is not None and granularidade not in GRANULARIDADES:
+        raise ValueError(f"granularity inválida: use {', '.join(GRANULARIDADES)}")
+    try:
+        de = datetime.strptime(args['from'], '%Y-%m-%d').date() if args.get('from') else None
+        ate = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else None
+    except ValueError:
+        raise ValueError('Datas inválidas: use from/to no formato AAAA-MM-DD')
+    if de and ate and de > ate:
+        raise ValueError('from deve ser anterior a to')
+    return de, ate, granularidade
+
+def _calcular_estatisticas(today, de, ate, granularidade):
+    if de is None and ate is None and granularidade is None:
+        # Sem período: totais de todo o histórico e os últimos 7 dias, como sempre foi.
+        dados = _totais_estatisticas(None, None)
+        dados['daily_data'] = _serie_cadastros(today - timedelta(days=6), today, 'day', lambda dia: dia.strftime('%d/%m'))
+        return dados
+    granularidade = granularidade or 'day'
+    ate = ate or today
+    de = de or db.session.query(func.min(EstatisticaDiaria.dia)).scalar() or ate
+    dados = _totais_estatisticas(de, ate)
+    # Com período, daily_data traz um ponto por dia, semana (a partir da segunda) ou mês.
+    dados['daily_data'] = _serie_cadastros(de, ate, granularidade, lambda inicio: _rotulo_periodo(inicio, granularidade))
+    dados['periodo'] = {'de': de.isoformat(), 'ate': ate.isoformat(), 'granularidade': granularidade}
+    return dados
+
+def _get_statistics_data(de=None, ate=None, granularidade=None):
+    """Helper function to fetch statistics data (cached, see CacheEstatisticas)."""
+    today = date.today()
+
+    def calcular():
+        with metrica_estatisticas.medir():
+            return _calcular_estatisticas(today, de, ate, granularidade)
+    return cache_estatisticas.obter((today, de, ate, granularidade), calcular)
+
 @app.route('/api/statistics', methods=['GET'])
 @requires_auth
 def get_statistics():
+    """Estatísticas dos cadastros. Sem parâmetros: todo o histórico e os últimos 7 dias.
+
+    `from`/`to` (AAAA-MM-DD) restringem ao período de atendimento e `granularity`
+    (day, week ou month) define os pontos de `daily_data`.
+    """
+    try:
+        de, ate, granularidade = _ler_periodo_estatisticas(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
-        stats_data = _get_statistics_data()
+        stats_data = _get_statistics_data(de, ate, granularidade)
         return jsonify(stats_data)
     except Exception as e:
         app.logger.error(f"Erro ao buscar estatísticas: {e}")
@@ -632,12 +2038,20 @@ def get_statistics():
 @app.route('/api/export/statistics/pdf', methods=['GET'])
 @requires_auth
 def export_statistics_pdf():
+    """PDF das estatísticas; aceita os mesmos `from`, `to` e `granularity` de /api/statistics."""
+    try:
+        de, ate, granularidade = _ler_periodo_estatisticas(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
-        stats_data = _get_statistics_data()
+        stats_data = _get_statistics_data(de, ate, granularidade)
         
         pdf = StatisticsPDF()
         pdf.add_page()
         pdf.chapter_title('Relatório de Estatísticas')
+        periodo = stats_data.get('periodo')
+        if periodo:
+            pdf.add_subtitle(f"Período: {date.fromisoformat(periodo['de']).strftime('%d/%m/%Y')} a {date.fromisoformat(periodo['ate']).strftime('%d/%m/%Y')}")
         
         pdf.add_kpi('Total de Cadastros', stats_data['total_cadastros'])
         pdf.add_kpi('Visitas Sociais Pendentes', stats_data['visitas_pendentes'])
@@ -647,6 +2061,9 @@ def export_statistics_pdf():
         pdf.add_data_table('Distribuição por Qualidade', stats_data['qualidade_data'])
         pdf.add_data_table('Uso de WhatsApp', stats_data['whatsapp_data'])
         pdf.add_data_table('Uso de Email', stats_data['email_data'])
+        if periodo:
+            titulos = {'day': 'Cadastros por Dia', 'week': 'Cadastros por Semana', 'month': 'Cadastros por Mês'}
+            pdf.add_data_table(titulos[periodo['granularidade']], stats_data['daily_data'])
         
         return Response(pdf.output(dest='S').encode('latin-1'),
                         mimetype='application/pdf',
@@ -656,63 +2073,336 @@ def export_statistics_pdf():
         app.logger.error(f"Erro ao gerar PDF de estatísticas: {e}")
         return jsonify({'error': str(e)}), 500
 
+# --- Exportação CSV em streaming ---
+LINHAS_POR_LOTE_EXPORTACAO = 1000
+TAMANHO_BLOCO_CSV = 64 * 1024
+
+def _gerar_csv(header, linhas, exportacao):
+    """Gera o CSV em blocos de ~64 KB, sem nunca montar o arquivo inteiro em memória."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    total = 0
+    try:
+        for linha in linhas:
+            writer.writerow(linha)
+            total += 1
+            if buffer.tell() >= TAMANHO_BLOCO_CSV:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+    finally:
+        metrica_exportacao_linhas.inc(total, exportacao=exportacao)
+
+def _comprimir_gzip(blocos):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for bloco in blocos:
+        comprimido = compressor.compress(bloco)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
+
+def _resposta_csv(header, query, filename):
+    """Resposta CSV em streaming sobre um cursor do lado do servidor.
+
+    `query` deve selecionar só as colunas exportadas (não objetos ORM); as linhas são
+    buscadas em lotes com yield_per, então a memória não cresce com o tamanho da tabela.
+    Clientes que aceitam gzip recebem o conteúdo comprimido em streaming.
+    """
+    linhas = query.execution_options(stream_results=True).yield_per(LINHAS_POR_LOTE_EXPORTACAO)
+    blocos = _gerar_csv(header, linhas, request.endpoint)
+    headers = {"Content-disposition": f"attachment; filename={filename}", "Vary": "Accept-Encoding"}
+    if request.accept_encodings['gzip']:
+        blocos = _comprimir_gzip(blocos)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(blocos), mimetype="text/csv", headers=headers)
+
+def _consulta_exportacao_total():
+    keys = [c.name for c in Cadastro.__table__.columns if c.name not in COLUNAS_INTERNAS + ['nome_documento', 'versao']]
+    return keys, db.session.query(*[getattr(Cadastro, k) for k in keys])
+
+def _consulta_exportacao_whatsapp():
+    return ['Nome', 'Telefone'], db.session.query(Cadastro.nome, Cadastro.telefone).filter(Cadastro.is_whatsapp.is_(True))
+
+STATUS_VISITA_EXPORTACAO = {'pendentes': 'Pendente', 'realizadas': 'Realizada'}
+
+def _consulta_visitas_csv(status_visita):
+    header = ['CPF', 'Nome', 'Telefone', 'Endereço', 'Assunto', 'Processo']
+    query = db.session.query(Cadastro.cpf, Cadastro.nome, Cadastro.telefone, Cadastro.endereco, Cadastro.assunto_visita, Cadastro.processo) \
+        .filter(Cadastro.status_visita == status_visita).order_by(Cadastro.nome)
+    return header, query
+
+def _linhas_relatorio_visitas(status_visita):
+    visitas = db.session.query(Cadastro.cpf, Cadastro.nome, Cadastro.endereco, Cadastro.assunto_visita) \
+        .filter(Cadastro.status_visita == status_visita).order_by(Cadastro.nome).all()
+    return [[v.cpf, v.nome, v.endereco or 'N/A', v.assunto_visita or 'N/A'] for v in visitas]
+
+def renderizar_relatorio_visitas(status, data):
+    """Monta o PDF do relatório de visitas. Não acessa o banco, então pode rodar no pool de processos."""
+    pdf = RelatorioPDF(orientation='L', unit='mm', format='A4')
+    pdf.add_page()
+    pdf.chapter_title(f'Relatório de Visitas {status.capitalize()}')
+    pdf.table(['CPF', 'Nome', 'Endereço', 'Assunto'], data)
+    return pdf.output(dest='S').encode('latin-1')
+
 @app.route('/api/export/all', methods=['GET'])
 @requires_auth
 def exportar_tudo_csv():
-    cadastros = Cadastro.query.all()
-    if not cadastros: return "Nenhum cadastro para exportar", 404
-    output = io.StringIO()
-    writer = csv.writer(output)
-    keys = [c.name for c in Cadastro.__table__.columns if c.name not in ['documento_pdf', 'nome_documento', 'foto_segurado']]
-    writer.writerow(keys)
-    for cadastro in cadastros:
-        writer.writerow([getattr(cadastro, k) for k in keys])
-    return Response(output.getvalue(), mimetype="text/csv", headers={"Content-disposition": f"attachment; filename=export_total_{datetime.now().strftime('%Y%m%d')}.csv"})
+    keys, query = _consulta_exportacao_total()
+    if not db.session.query(query.exists()).scalar(): return "Nenhum cadastro para exportar", 404
+    return _resposta_csv(keys, query, f"export_total_{datetime.now().strftime('%Y%m%d')}.csv")
 
 @app.route('/api/export/whatsapp', methods=['GET'])
 @requires_auth
 def exportar_whatsapp_csv():
-    cadastros_whatsapp = Cadastro.query.filter_by(is_whatsapp=True).all()
-    if not cadastros_whatsapp: return "Nenhum cadastro com WhatsApp para exportar", 404
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Nome', 'Telefone'])
-    for cadastro in cadastros_whatsapp: writer.writerow([cadastro.nome, cadastro.telefone])
-    return Response(output.getvalue(), mimetype="text/csv", headers={"Content-disposition": f"attachment; filename=contatos_whatsapp_{datetime.now().strftime('%Y%m%d')}.csv"})
+    header, query = _consulta_exportacao_whatsapp()
+    if not db.session.query(query.exists()).scalar(): return "Nenhum cadastro com WhatsApp para exportar", 404
+    return _resposta_csv(header, query, f"contatos_whatsapp_{datetime.now().strftime('%Y%m%d')}.csv")
 
 @app.route('/api/export/visitas/<status>/<format>', methods=['GET'])
 @requires_auth
 def exportar_visitas(status, format):
-    if status == 'pendentes':
-        visitas = Cadastro.query.filter_by(status_visita='Pendente').order_by(Cadastro.nome).all()
-    elif status == 'realizadas':
-        visitas = Cadastro.query.filter_by(status_visita='Realizada').order_by(Cadastro.nome).all()
-    else:
+    status_visita = STATUS_VISITA_EXPORTACAO.get(status)
+    if not status_visita:
         return "Status inválido", 400
 
-    if not visitas:
+    base = db.session.query(Cadastro).filter(Cadastro.status_visita == status_visita)
+    if not db.session.query(base.exists()).scalar():
         return f"Nenhuma visita {status} para exportar", 404
 
     if format == 'csv':
-        output = io.StringIO()
-        writer = csv.writer(output)
-        header = ['CPF', 'Nome', 'Telefone', 'Endereço', 'Assunto', 'Processo']
-        writer.writerow(header)
-        for visita in visitas:
-            writer.writerow([visita.cpf, visita.nome, visita.telefone, visita.endereco, visita.assunto_visita, visita.processo])
-        return Response(output.getvalue(), mimetype="text/csv", headers={"Content-disposition": f"attachment; filename=visitas_{status}.csv"})
+        header, query = _consulta_visitas_csv(status_visita)
+        return _resposta_csv(header, query, f"visitas_{status}.csv")
 
     elif format == 'pdf':
-        pdf = RelatorioPDF(orientation='L', unit='mm', format='A4')
-        pdf.add_page()
-        pdf.chapter_title(f'Relatório de Visitas {status.capitalize()}')
-        header = ['CPF', 'Nome', 'Endereço', 'Assunto']
-        data = [[v.cpf, v.nome, v.endereco or 'N/A', v.assunto_visita or 'N/A'] for v in visitas]
-        pdf.table(header, data)
-        return Response(pdf.output(dest='S').encode('latin-1'), mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename=visitas_{status}.pdf'})
+        # PDFs grandes não cabem no timeout do worker: acima do limite vão para a fila de exportações.
+        limite = app.config['EXPORT_SYNC_MAX_ROWS']
+        if base.limit(limite + 1).count() > limite:
+            return _submeter_exportacao('visitas', {'status': status, 'formato': 'pdf'})
+        conteudo = renderizar_relatorio_visitas(status, _linhas_relatorio_visitas(status_visita))
+        return Response(conteudo, mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename=visitas_{status}.pdf'})
 
     return "Formato inválido", 400
 
+# --- Exportações em Segundo Plano ---
+# Relatórios grandes não cabem no timeout de um worker síncrono: o cliente submete a
+# exportação, acompanha o status e baixa o arquivo quando ficar pronto.
+fila_exportacoes = FilaRelatorios(
+    app.config['EXPORT_JOBS_DIR'], app.config['EXPORT_JOBS_MAX_BYTES'],
+    threads=app.config['EXPORT_JOBS_THREADS'], processos=app.config['EXPORT_JOBS_PROCESSES'],
+    reaproveitar_por=app.config['EXPORT_JOBS_REUSE_SECONDS'], logger=app.logger,
+)
+
+def _gravar_csv(caminho, header, query, exportacao):
+    linhas = query.execution_options(stream_results=True).yield_per(LINHAS_POR_LOTE_EXPORTACAO)
+    with open(caminho, 'wb') as arquivo:
+        for bloco in _gerar_csv(header, linhas, exportacao):
+            arquivo.write(bloco)
+
+def _tarefa_csv(exportacao, consulta, *args):
+    def tarefa(caminho):
+        with app.app_context():
+            header, query = consulta(*args)
+            _gravar_csv(caminho, header, query, exportacao)
+    return tarefa
+
+def _tarefa_relatorio_visitas(status, status_visita):
+    def tarefa(caminho):
+        with app.app_context():
+            data = _linhas_relatorio_visitas(status_visita)
+        conteudo = fila_exportacoes.executar_em_processo(renderizar_relatorio_visitas, status, data)
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(conteudo)
+    return tarefa
+
+def _preparar_exportacao(tipo, parametros):
+    """Devolve (parâmetros normalizados, tarefa, nome do arquivo, mimetype) ou levanta ValueError."""
+    hoje = datetime.now().strftime('%Y%m%d')
+    if tipo == 'cadastros':
+        return {}, _tarefa_csv('job_cadastros', _consulta_exportacao_total), f"export_total_{hoje}.csv", 'text/csv'
+    if tipo == 'whatsapp':
+        return {}, _tarefa_csv('job_whatsapp', _consulta_exportacao_whatsapp), f"contatos_whatsapp_{hoje}.csv", 'text/csv'
+    if tipo == 'visitas':
+        status = parametros.get('status')
+        formato = parametros.get('formato', 'pdf')
+        status_visita = STATUS_VISITA_EXPORTACAO.get(status)
+        if not status_visita:
+            raise ValueError("Status inválido")
+        normalizados = {'status': status, 'formato': formato}
+        if formato == 'csv':
+            return normalizados, _tarefa_csv('job_visitas', _consulta_visitas_csv, status_visita), f"visitas_{status}.csv", 'text/csv'
+        if formato == 'pdf':
+            return normalizados, _tarefa_relatorio_visitas(status, status_visita), f"visitas_{status}.pdf", 'application/pdf'
+        raise ValueError("Formato inválido")
+    if tipo == 'declaracoes':
+        formato = parametros.get('formato', 'pdf')
+        if formato not in ('pdf', 'zip'):
+            raise ValueError("Formato inválido")
+        if parametros.get('cpfs') is not None:
+            cpfs = parametros['cpfs']
+            normalizados = {'cpfs': list(dict.fromkeys(cpfs)) if isinstance(cpfs, list) else cpfs}
+        else:
+            normalizados = {'data_inicio': parametros.get('data_inicio'), 'data_fim': parametros.get('data_fim') or parametros.get('data_inicio')}
+        normalizados['formato'] = formato
+        mimetype = 'application/zip' if formato == 'zip' else 'application/pdf'
+        return normalizados, _tarefa_declaracoes(normalizados), f"declaracoes_{hoje}.{formato}", mimetype
+    raise ValueError("Tipo de exportação inválido")
+
+def _status_exportacao_json(status):
+    dados = {k: status.get(k) for k in ('id', 'estado', 'tipo', 'parametros', 'nome_arquivo', 'tamanho', 'erro')}
+    for campo in ('criado_em', 'concluido_em'):
+        dados[campo] = datetime.fromtimestamp(status[campo], timezone.utc).isoformat() if status.get(campo) else None
+    dados['status_url'] = url_for('status_exportacao', job_id=status['id'])
+    if status['estado'] == CONCLUIDO:
+        dados['download_url'] = url_for('download_exportacao', job_id=status['id'])
+    return dados
+
+def _status_exportacao_ou_404(job_id):
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    return fila_exportacoes.status(job_id)
+
+def _submeter_exportacao(tipo, data):
+    try:
+        parametros, tarefa, nome_arquivo, mimetype = _preparar_exportacao(tipo, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    status = fila_exportacoes.submeter(tipo, parametros, tarefa, nome_arquivo, mimetype)
+    dados = _status_exportacao_json(status)
+    return jsonify(dados), 202, {'Location': dados['status_url']}
+
+@app.route('/api/export/jobs', methods=['POST'])
+@requires_auth
+def submeter_exportacao():
+    data = corpo_json_objeto()
+    if data is None:
+        return jsonify({'error': 'O corpo deve ser um objeto JSON'}), 400
+    return _submeter_exportacao(data.get('tipo'), data)
+
+@app.route('/api/export/jobs/<job_id>', methods=['GET'])
+@requires_auth
+def status_exportacao(job_id):
+    status = _status_exportacao_ou_404(job_id)
+    if not status:
+        return jsonify({'error': 'Exportação não encontrada'}), 404
+    return jsonify(_status_exportacao_json(status))
+
+@app.route('/api/export/jobs/<job_id>/download', methods=['GET'])
+@requires_auth
+def download_exportacao(job_id):
+    status = _status_exportacao_ou_404(job_id)
+    if not status:
+        return jsonify({'error': 'Exportação não encontrada'}), 404
+    if status['estado'] != CONCLUIDO:
+        return jsonify({'error': 'Exportação ainda não concluída', 'estado': status['estado']}), 409
+    caminho = fila_exportacoes.caminho_arquivo(job_id)
+    if not os.path.exists(caminho):
+        return jsonify({'error': 'Arquivo expirou do cache; submeta a exportação novamente'}), 410
+    return send_file(caminho, mimetype=status['mimetype'], as_attachment=True, download_name=status['nome_arquivo'])
+
+# --- Declarações ---
+CAMPOS_DECLARACAO = ['cpf', 'nome', 'qualidade', 'atendente_criacao', 'tem_procurador', 'procurador_nome', 'procurador_cpf', 'tem_curador', 'curador_nome', 'curador_cpf']
+# Só os campos usados na declaração, num formato que pode ser enviado ao pool de processos.
+DadosDeclaracao = namedtuple('DadosDeclaracao', CAMPOS_DECLARACAO)
+DECLARACOES_POR_PROCESSO = 25
+
+def renderizar_declaracoes(cadastros):
+    """Todas as declarações num único PDF, uma por página (o logo é embutido uma vez só)."""
+    pdf = DeclaracaoPDF()
+    for cadastro in cadastros:
+        pdf.add_page()
+        pdf.body_text(cadastro)
+        pdf.signature_section(cadastro)
+    return pdf.output(dest='S').encode('latin-1')
+
+def renderizar_declaracoes_separadas(cadastros):
+    return [(f"declaracao_{c.cpf}.pdf", renderizar_declaracoes([c])) for c in cadastros]
+
+class _SaidaZip:
+    """Destino não-posicionável para o ZipFile: acumula os bytes para o streaming."""
+    def __init__(self):
+        self.blocos = []
+
+    def write(self, dados):
+        self.blocos.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.blocos)
+        self.blocos = []
+        return dados
+
+def _gerar_zip_declaracoes(cadastros):
+    """ZIP com uma declaração por CPF, gerado em streaming.
+
+    Lotes grandes são renderizados em paralelo no pool de processos; a ordem é mantida.
+    """
+    lotes = [cadastros[i:i + DECLARACOES_POR_PROCESSO] for i in range(0, len(cadastros), DECLARACOES_POR_PROCESSO)]
+    if len(lotes) > 1:
+        renderizados = fila_exportacoes.mapear_em_processos(renderizar_declaracoes_separadas, lotes)
+    else:
+        renderizados = map(renderizar_declaracoes_separadas, lotes)
+
+    saida = _SaidaZip()
+    # PDFs do fpdf já têm as páginas comprimidas; comprimir de novo só gastaria CPU.
+    with zipfile.ZipFile(saida, 'w', zipfile.ZIP_STORED) as zf:
+        for arquivos in renderizados:
+            for nome, conteudo in arquivos:
+                zf.writestr(nome, conteudo)
+            yield saida.esvaziar()
+    yield saida.esvaziar()
+
+def _cadastros_para_declaracao(data):
+    """Busca numa consulta só os cadastros pedidos (lista de CPFs ou intervalo de data_atendimento).
+
+    Retorna (cadastros, erro); `erro` é uma tupla (mensagem, status HTTP).
+    """
+    colunas = [getattr(Cadastro, campo) for campo in CAMPOS_DECLARACAO]
+    limite = app.config['DECLARACOES_MAX_LOTE']
+    cpfs = data.get('cpfs')
+    if cpfs is not None:
+        if not isinstance(cpfs, list) or not cpfs or not all(isinstance(cpf, str) for cpf in cpfs):
+            return None, ({'error': "'cpfs' deve ser uma lista de CPFs"}, 400)
+        cpfs = list(dict.fromkeys(cpfs))
+        if len(cpfs) > limite:
+            return None, ({'error': f'No máximo {limite} declarações por requisição'}, 400)
+        encontrados = {linha.cpf: linha for linha in db.session.query(*colunas).filter(Cadastro.cpf.in_(cpfs))}
+        faltando = [cpf for cpf in cpfs if cpf not in encontrados]
+        if faltando:
+            return None, ({'error': 'Cadastro não encontrado', 'cpfs': faltando}, 404)
+        return [DadosDeclaracao(*encontrados[cpf]) for cpf in cpfs], None
+
+    try:
+        inicio = datetime.strptime(data['data_inicio'], '%Y-%m-%d').date()
+        fim = datetime.strptime(data.get('data_fim') or data['data_inicio'], '%Y-%m-%d').date()
+    except (KeyError, TypeError, ValueError):
+        return None, ({'error': "Informe 'cpfs' ou 'data_inicio'/'data_fim' (AAAA-MM-DD)"}, 400)
+    linhas = db.session.query(*colunas).filter(Cadastro.data_atendimento.between(inicio, fim)) \
+        .order_by(Cadastro.data_atendimento, Cadastro.nome).limit(limite + 1).all()
+    if not linhas:
+        return None, ({'error': 'Nenhum cadastro atendido no período'}, 404)
+    if len(linhas) > limite:
+        return None, ({'error': f'O período tem mais de {limite} cadastros; reduza o intervalo'}, 400)
+    return [DadosDeclaracao(*linha) for linha in linhas], None
+
+def _tarefa_declaracoes(parametros):
+    def tarefa(caminho):
+        with app.app_context():
+            cadastros, erro = _cadastros_para_declaracao(parametros)
+        if erro:
+            raise ValueError(erro[0]['error'])
+        with open(caminho, 'wb') as arquivo:
+            if parametros['formato'] == 'zip':
+                for bloco in _gerar_zip_declaracoes(cadastros):
+                    arquivo.write(bloco)
+            else:
+                arquivo.write(fila_exportacoes.executar_em_processo(renderizar_declaracoes, cadastros))
+    return tarefa
+
 @app.route('/api/export/declaracao/<cpf>', methods=['GET'])
 @requires_auth
 def exportar_declaracao_pdf(cpf):
@@ -720,12 +2410,28 @@ def exportar_declaracao_pdf(cpf):
     if not cadastro:
         return "Cadastro não encontrado", 404
 
-    pdf = DeclaracaoPDF()
-    pdf.add_page()
-    pdf.body_text(cadastro)
-    pdf.signature_section(cadastro)
+    return Response(renderizar_declaracoes([cadastro]), mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename=declaracao_{cadastro.cpf}.pdf'})
 
-    return Response(pdf.output(dest='S').encode('latin-1'), mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename=declaracao_{cadastro.cpf}.pdf'})
+@app.route('/api/export/declaracoes', methods=['POST'])
+@requires_auth
+def exportar_declaracoes_lote():
+    data = corpo_json_objeto()
+    if data is None:
+        return jsonify({'error': 'O corpo deve ser um objeto JSON'}), 400
+    formato = data.get('formato', 'pdf')
+    if formato not in ('pdf', 'zip'):
+        return jsonify({'error': 'Formato inválido'}), 400
+    cadastros, erro = _cadastros_para_declaracao(data)
+    if erro:
+        return jsonify(erro[0]), erro[1]
+    # Lotes grandes não cabem no timeout do worker: vão para a fila, como o PDF de visitas.
+    if len(cadastros) > app.config['DECLARACOES_SYNC_MAX']:
+        return _submeter_exportacao('declaracoes', data)
+
+    nome = f"declaracoes_{datetime.now().strftime('%Y%m%d')}"
+    if formato == 'zip':
+        return Response(_gerar_zip_declaracoes(cadastros), mimetype='application/zip', headers={'Content-Disposition': f'attachment;filename={nome}.zip'})
+    return Response(renderizar_declaracoes(cadastros), mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename={nome}.pdf'})
 
 @app.route('/api/export/cadastro/<cpf>/pdf', methods=['GET'])
 @requires_auth
@@ -734,14 +2440,11 @@ def exportar_cadastro_pdf(cpf):
     if not cadastro:
         return "Cadastro não encontrado", 404
 
-    temp_photo_path = None
-    if cadastro.foto_segurado:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
-            temp.write(cadastro.foto_segurado)
-            temp_photo_path = temp.name
-
     pdf = CadastroPDF()
-    pdf.set_photo_path(temp_photo_path)
+    try:
+        pdf.set_photo(foto_do_cadastro_para_pdf(cadastro))
+    except ValueError as e:
+        app.logger.error(f"Foto do CPF {cpf} ignorada na ficha: {e}")
     pdf.add_page()
 
     pdf.add_section_title('Dados do Segurado')
@@ -776,25 +2479,422 @@ def exportar_cadastro_pdf(cpf):
 
     pdf_output = pdf.output(dest='S').encode('latin-1')
 
-    if temp_photo_path:
-        os.remove(temp_photo_path)
-
     return Response(pdf_output, mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename=cadastro_{cadastro.cpf}.pdf'})
 
+# --- Importação em Lote ---
+LINHAS_POR_LOTE_IMPORTACAO = 500
+MAXIMO_ERROS_RELATADOS = 1000
+CAMPOS_OBRIGATORIOS_IMPORTACAO = ['cpf', 'nome', 'telefone', 'qualidade', 'data_atendimento']
+CAMPOS_TEXTO_IMPORTACAO = ['cpf', 'nome', 'telefone', 'qualidade', 'matricula', 'email', 'informacao', 'obs', 'processo', 'endereco', 'assunto_visita', 'procurador_nome', 'procurador_cpf', 'curador_nome', 'curador_cpf']
+CAMPOS_BOOLEANOS_IMPORTACAO = ['is_whatsapp', 'necessita_visita_social']
+
+def _valor_booleano(valor):
+    return valor is True or str(valor).strip().lower() in ('sim', 's', 'true', '1', 'on')
+
+def _validar_registro_importacao(registro, atendente_padrao):
+    """Converte um registro do arquivo nas colunas de `cadastros`; lança ValueError se inválido."""
+    registro = {k.strip(): v for k, v in registro.items() if k}
+    faltando = [c for c in CAMPOS_OBRIGATORIOS_IMPORTACAO if not str(registro.get(c) or '').strip()]
+    if faltando:
+        raise ValueError(f"campos obrigatórios ausentes: {', '.join(faltando)}")
+
+    linha = {}
+    for campo in CAMPOS_TEXTO_IMPORTACAO:
+        if campo in registro:
+            valor = str(registro[campo]).strip() if registro[campo] is not None else None
+            limite = Cadastro.__table__.c[campo].type.length
+            if valor and limite and len(valor) > limite:
+                raise ValueError(f"{campo} excede {limite} caracteres")
+            linha[campo] = valor or None
+    for campo in CAMPOS_BOOLEANOS_IMPORTACAO:
+        if campo in registro:
+            linha[campo] = _valor_booleano(registro[campo])
+    linha.setdefault('is_whatsapp', False)
+
+    data_texto = str(registro['data_atendimento']).strip()
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            linha['data_atendimento'] = datetime.strptime(data_texto, formato).date()
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"data_atendimento inválida: {data_texto}")
+
+    if linha.get('necessita_visita_social'):
+        linha['status_visita'] = 'Pendente'
+    linha['atendente_criacao'] = str(registro.get('atendente') or atendente_padrao)[:100]
+    linha['cpf_digitos'] = somente_digitos(linha['cpf'])
+    linha['nome_busca'] = normalizar_busca(linha['nome'])
+    return linha
+
+def ler_registros_importacao(arquivo, formato):
+    """Lê o arquivo (CSV com cabeçalho ou JSON Lines) sob demanda, gerando (número da linha, registro).
+
+    Linhas que não podem ser lidas geram (número, ValueError) em vez do registro.
+    """
+    # iterdecode em vez de TextIOWrapper: funciona com qualquer iterável de bytes (uploads
+    # em SpooledTemporaryFile, request.stream, arquivos abertos pela CLI).
+    texto = codecs.iterdecode(arquivo, 'utf-8-sig')
+    if formato == 'csv':
+        leitor = csv.DictReader(texto)
+        for registro in leitor:
+            yield leitor.line_num, registro
+    elif formato == 'jsonl':
+        for numero, conteudo in enumerate(texto, 1):
+            if not conteudo.strip():
+                continue
+            try:
+                registro = json.loads(conteudo)
+                if not isinstance(registro, dict):
+                    raise ValueError('a linha não é um objeto JSON')
+            except ValueError as e:
+                yield numero, ValueError(f"JSON inválido: {e}")
+                continue
+            yield numero, registro
+    else:
+        raise ValueError(f"Formato de importação desconhecido: {formato}")
+
+def _auditoria_importacao(linhas, agora):
+    """Linhas de auditoria do que o upsert vai mudar nos cadastros que já existem.
+
+    Os valores atuais são lidos com FOR UPDATE (no Postgres), na mesma transação do upsert,
+    para que ninguém os altere entre a leitura e a gravação.
+    """
+    campos = [c for c in CAMPOS_AUDITADOS + ['status_visita'] if c in linhas[0]]
+    if not campos:
+        return []
+    consulta = select(Cadastro.cpf, *[getattr(Cadastro, c) for c in campos]) \
+        .where(Cadastro.cpf.in_([linha['cpf'] for linha in linhas])).with_for_update()
+    existentes = {atual.cpf: atual for atual in db.session.execute(consulta)}
+    auditoria = []
+    for linha in linhas:
+        atual = existentes.get(linha['cpf'])
+        if atual is None:
+            continue
+        for campo in campos:
+            antigo, novo = getattr(atual, campo), linha[campo]
+            if campo == 'status_visita' and antigo is not None:
+                novo = antigo  # ver _upsert_cadastros: o status de uma visita existente é mantido
+            if formatar_valor_auditoria(antigo) != formatar_valor_auditoria(novo):
+                auditoria.append({
+                    'cadastro_cpf': linha['cpf'], 'atendente': linha['atendente_criacao'], 'data_alteracao': agora,
+                    'campo_alterado': campo, 'valor_antigo': formatar_valor_auditoria(antigo), 'valor_novo': formatar_valor_auditoria(novo),
+                })
+    return auditoria
+
+def _upsert_cadastros(linhas):
+    """INSERT ... ON CONFLICT (cpf) DO UPDATE de várias linhas com as mesmas colunas.
+
+    Em conflito, atualiza só as colunas presentes no arquivo; criação e atendente original são
+    preservados, e as alterações entram na auditoria. `status_visita` só é preenchido em
+    cadastros sem visita: reimportar um arquivo não faz uma visita Realizada voltar a Pendente.
+    """
+    tabela = Cadastro.__table__
+    dialeto = db.engine.dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Importação em lote não suportada para o banco {dialeto}")
+    agora = datetime.utcnow()
+    auditoria = _auditoria_importacao(linhas, agora)
+    stmt = insert(tabela).values([dict(linha, data_criacao=agora, versao=1) for linha in linhas])
+    atualizar = {c: stmt.excluded[c] for c in linhas[0] if c not in ('cpf', 'atendente_criacao')}
+    if 'status_visita' in atualizar:
+        atualizar['status_visita'] = func.coalesce(tabela.c.status_visita, stmt.excluded.status_visita)
+    atualizar.update({
+        'atendente_modificacao': stmt.excluded.atendente_criacao,
+        'data_modificacao': agora,
+        'versao': tabela.c.versao + 1,
+    })
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['cpf'], set_=atualizar))
+    registrar_auditoria(auditoria)
+
+def _gravar_lote_importacao(lote, relatorio):
+    """Grava um lote (linha -> colunas); se o banco recusar o lote, grava linha a linha para apontar a culpada."""
+    por_colunas = {}
+    for numero, linha in lote:
+        por_colunas.setdefault(tuple(sorted(linha)), []).append(linha)
+    try:
+        for linhas in por_colunas.values():
+            _upsert_cadastros(linhas)
+        db.session.commit()
+        relatorio['gravados'] += len(lote)
+        return
+    except SQLAlchemyError:
+        db.session.rollback()
+    for numero, linha in lote:
+        try:
+            _upsert_cadastros([linha])
+            db.session.commit()
+            relatorio['gravados'] += 1
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            _registrar_erro_importacao(relatorio, numero, linha.get('cpf'), str(getattr(e, 'orig', e)).strip())
+
+def _registrar_erro_importacao(relatorio, numero, cpf, erro):
+    relatorio['total_erros'] += 1
+    if len(relatorio['erros']) < MAXIMO_ERROS_RELATADOS:
+        relatorio['erros'].append({'linha': numero, 'cpf': cpf, 'erro': erro})
+
+def importar_cadastros(registros, atendente_padrao):
+    """Valida e grava (upsert por CPF) os registros em lotes, devolvendo o relatório da importação.
+
+    Cada lote é uma transação: um erro afeta só as linhas culpadas, e o que já foi gravado permanece.
+    """
+    relatorio = {'total_linhas': 0, 'gravados': 0, 'total_erros': 0, 'erros': []}
+    lote = {}
+    for numero, registro in registros:
+        relatorio['total_linhas'] += 1
+        if isinstance(registro, Exception):
+            _registrar_erro_importacao(relatorio, numero, None, str(registro))
+            continue
+        try:
+            linha = _validar_registro_importacao(registro, atendente_padrao)
+        except ValueError as e:
+            _registrar_erro_importacao(relatorio, numero, registro.get('cpf'), str(e))
+            continue
+        # O mesmo CPF duas vezes no lote quebraria o ON CONFLICT: prevalece a última ocorrência.
+        anterior = lote.pop(linha['cpf'], None)
+        if anterior:
+            _registrar_erro_importacao(relatorio, anterior[0], linha['cpf'], f"CPF repetido no arquivo; prevalece a linha {numero}")
+        lote[linha['cpf']] = (numero, linha)
+        if len(lote) >= LINHAS_POR_LOTE_IMPORTACAO:
+            _gravar_lote_importacao(list(lote.values()), relatorio)
+            lote = {}
+    if lote:
+        _gravar_lote_importacao(list(lote.values()), relatorio)
+    cache_estatisticas.invalidar()
+    return relatorio
+
+def _formato_importacao(nome_arquivo, mimetype):
+    formato = request.args.get('formato')
+    if formato:
+        return formato.lower()
+    if (nome_arquivo or '').lower().endswith(('.jsonl', '.ndjson')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'jsonl'
+    return 'csv'
+
+@app.route('/api/import/cadastros', methods=['POST'])
+@requires_auth
+def importar_cadastros_api():
+    """Importa cadastros de um CSV (com cabeçalho) ou JSON Lines, com upsert por CPF.
+
+    O arquivo vem no campo multipart `arquivo` ou como corpo da requisição (text/csv ou
+    application/x-ndjson). As colunas seguem os nomes do modelo; `atendente` é opcional e,
+    se ausente, fica o utilizador autenticado.
+    """
+    if request.files.get('arquivo'):
+        arquivo = request.files['arquivo']
+        stream, formato = arquivo.stream, _formato_importacao(arquivo.filename, arquivo.mimetype)
+    else:
+        stream, formato = request.stream, _formato_importacao(None, request.mimetype)
+    if formato not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Formato inválido; use csv ou jsonl'}), 400
+    atendente = request.args.get('atendente') or g.usuario.username
+    relatorio = importar_cadastros(ler_registros_importacao(stream, formato), atendente)
+    return jsonify(relatorio), 200
+
+def atualizar_cadastros_em_lote(atualizacoes):
+    """UPDATE em lote (executemany) de colunas de manutenção, chaveado por `cpf`.
+
+    Não passa pelo ORM: versao e data_modificacao ficam como estão, pois não são edições de atendentes.
+    """
+    tabela = Cadastro.__table__
+    colunas = [c for c in atualizacoes[0] if c != 'cpf']
+    valores = {c: bindparam(f'novo_{c}') for c in colunas}
+    valores['data_modificacao'] = tabela.c.data_modificacao
+    db.session.execute(
+        tabela.update().where(tabela.c.cpf == bindparam('chave_cpf')).values(valores),
+        [{'chave_cpf': a['cpf'], **{f'novo_{c}': a[c] for c in colunas}} for a in atualizacoes]
+    )
+
+PERMISSOES_ADMIN = {
+    "cadastro": True, "consulta": True, "editar": True, "visitas-pendentes": True,
+    "visitas-realizadas": True, "estatisticas": True, "audit": True, "usuarios": True
+}
+
+def garantir_admin():
+    """Cria o utilizador administrador, com a senha inicial ADMIN_PASSWORD, se ele não existir."""
+    if User.query.filter_by(username=ADMIN_USERNAME).first():
+        return False
+    db.session.add(User(username=ADMIN_USERNAME, password=gerar_hash_senha(ADMIN_PASSWORD), permissions=PERMISSOES_ADMIN))
+    db.session.commit()
+    return True
+
+@app.cli.command('criar-admin')
+def criar_admin():
+    """Cria o administrador se não existir (roda no deploy, depois das migrações)."""
+    print("Administrador criado." if garantir_admin() else "Administrador já existe.")
+
+@app.cli.command('reindexar-busca')
+def reindexar_busca():
+    """Preenche as colunas de busca (cpf_digitos, nome_busca) de cadastros antigos."""
+    total = 0
+    while True:
+        pendentes = db.session.query(Cadastro.cpf, Cadastro.nome).filter(or_(Cadastro.cpf_digitos.is_(None), Cadastro.nome_busca.is_(None))).limit(1000).all()
+        if not pendentes:
+            break
+        atualizar_cadastros_em_lote([
+            {'cpf': cpf, 'cpf_digitos': somente_digitos(cpf), 'nome_busca': normalizar_busca(nome)} for cpf, nome in pendentes
+        ])
+        db.session.commit()
+        total += len(pendentes)
+    print(f"{total} cadastros reindexados.")
+
+@app.cli.command('recalcular-estatisticas')
+def recalcular_estatisticas():
+    """Refaz a tabela estatisticas_diarias a partir dos cadastros (depois os triggers a mantêm)."""
+    tabela = EstatisticaDiaria.__table__
+    if db.engine.dialect.name == 'postgresql':
+        # Bloqueia escritas em cadastros até o commit, para nenhuma ficar fora da recontagem.
+        db.session.execute(db.text('LOCK TABLE cadastros IN SHARE MODE'))
+    dimensoes = [
+        Cadastro.data_atendimento, Cadastro.qualidade, Cadastro.atendente_criacao, Cadastro.is_whatsapp,
+        func.coalesce(Cadastro.email, '') != '', func.coalesce(Cadastro.status_visita, ''),
+    ]
+    db.session.execute(tabela.delete())
+    db.session.execute(tabela.insert().from_select(
+        [c.name for c in tabela.columns],
+        db.session.query(*dimensoes, func.count()).group_by(*dimensoes)
+    ))
+    db.session.commit()
+    total = db.session.query(func.count()).select_from(tabela).scalar()
+    print(f"{total} linhas de estatísticas recalculadas.")
+
+@app.cli.command('gerar-miniaturas')
+def gerar_miniaturas():
+    """Normaliza as fotos antigas e gera as miniaturas que ainda não existem."""
+    total = 0
+    while True:
+        pendentes = db.session.query(Cadastro.cpf, Cadastro.foto_hash).filter(Cadastro.foto_hash.isnot(None), Cadastro.foto_miniatura_hash.is_(None)).limit(100).all()
+        if not pendentes:
+            break
+        atualizacoes = []
+        for cpf, foto_hash in pendentes:
+            try:
+                nova_foto, miniatura = processar_foto(armazenamento_blobs.ler(foto_hash))
+                atualizacoes.append({'cpf': cpf, 'foto_hash': armazenamento_blobs.guardar(nova_foto), 'foto_miniatura_hash': armazenamento_blobs.guardar(miniatura)})
+            except (ValueError, FileNotFoundError) as e:
+                # Mantém a foto original e usa ela mesma como miniatura, para não reprocessar.
+                print(f"CPF {cpf}: {e}")
+                atualizacoes.append({'cpf': cpf, 'foto_hash': foto_hash, 'foto_miniatura_hash': foto_hash})
+        atualizar_cadastros_em_lote(atualizacoes)
+        db.session.commit()
+        total += len(pendentes)
+    print(f"{total} fotos processadas.")
+
+@app.cli.command('limpar-blobs')
+@click.option('--remover', is_flag=True, help='Sem esta opção, só informa o que seria removido.')
+@click.option('--idade-minima', type=int, default=24, help='Ignora blobs gravados há menos de N horas.')
+def limpar_blobs(remover, idade_minima):
+    """Remove do armazenamento os blobs que nenhum cadastro referencia mais.
+
+    Blobs recentes são preservados: um upload em andamento grava o blob antes de o cadastro
+    ser salvo, e não pode ser confundido com lixo.
+    """
+    referenciados = set()
+    for coluna in (Cadastro.documento_hash, Cadastro.foto_hash, Cadastro.foto_miniatura_hash):
+        for (conteudo_hash,) in db.session.query(coluna).filter(coluna.isnot(None)).distinct().yield_per(10000):
+            referenciados.add(conteudo_hash)
+    limite = time.time() - idade_minima * 3600
+    orfaos = [conteudo_hash for conteudo_hash, gravado_em in armazenamento_blobs.listar() if conteudo_hash not in referenciados and gravado_em < limite]
+    if remover:
+        for conteudo_hash in orfaos:
+            armazenamento_blobs.remover(conteudo_hash)
+    print(f"{len(referenciados)} blobs referenciados, {len(orfaos)} órfãos {'removidos' if remover else 'encontrados (use --remover para apagá-los)'}.")
+
+@app.cli.command('importar-cadastros')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--formato', type=click.Choice(['csv', 'jsonl']), default=None, help='Padrão: deduzido da extensão.')
+@click.option('--atendente', default='importacao', help='Atendente gravado nos registros sem a coluna atendente.')
+def importar_cadastros_cli(arquivo, formato, atendente):
+    """Importa cadastros de um CSV ou JSON Lines (upsert por CPF)."""
+    if formato is None:
+        formato = 'jsonl' if arquivo.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    inicio = time.perf_counter()
+    with open(arquivo, 'rb') as f:
+        relatorio = importar_cadastros(ler_registros_importacao(f, formato), atendente)
+    duracao = time.perf_counter() - inicio
+    for erro in relatorio['erros']:
+        print(f"linha {erro['linha']} (CPF {erro['cpf']}): {erro['erro']}")
+    print(f"{relatorio['gravados']} de {relatorio['total_linhas']} linhas gravadas, {relatorio['total_erros']} com erro, em {duracao:.1f}s.")
+
+@app.cli.command('arquivar-auditoria')
+@click.option('--dias', type=int, default=None, help='Arquiva registros com mais de N dias (padrão: AUDIT_RETENTION_DAYS).')
+@click.option('--lote', type=int, default=LINHAS_POR_LOTE_ARQUIVAMENTO, help='Registros movidos por transação.')
+def arquivar_auditoria_cli(dias, lote):
+    """Move o log de auditoria antigo para a tabela de arquivo (rodar periodicamente, ex.: cron diário)."""
+    dias = dias if dias is not None else app.config['AUDIT_RETENTION_DAYS']
+    corte = datetime.utcnow() - timedelta(days=dias)
+    inicio = time.perf_counter()
+    total = arquivar_auditoria(corte, lote)
+    print(f"{total} registros anteriores a {corte:%Y-%m-%d} arquivados em {time.perf_counter() - inicio:.1f}s.")
+
+# --- Verificação de Planos de Consulta ---
+def _consultas_criticas():
+    """Consultas dos caminhos mais usados e o índice que cada uma deve usar."""
+    hoje = date.today()
+    consultas = [
+        ('visitas por status', db.session.query(Cadastro.cpf, Cadastro.nome).filter(Cadastro.status_visita == 'Pendente').order_by(Cadastro.nome), 'ix_cadastros_status_visita_nome'),
+        ('cadastros por data de atendimento', db.session.query(Cadastro.cpf).filter(Cadastro.data_atendimento.between(hoje - timedelta(days=6), hoje)), 'ix_cadastros_data_atendimento'),
+        ('contatos do WhatsApp', db.session.query(Cadastro.nome, Cadastro.telefone).filter(Cadastro.is_whatsapp.is_(True)), 'ix_cadastros_whatsapp'),
+        ('auditoria de um CPF', db.session.query(AuditoriaAlteracoes.id).filter(AuditoriaAlteracoes.cadastro_cpf == '000.000.000-00').order_by(AuditoriaAlteracoes.data_alteracao.desc()), 'ix_auditoria_cpf_data'),
+        ('auditoria geral', db.session.query(AuditoriaAlteracoes.id).order_by(AuditoriaAlteracoes.data_alteracao.desc(), AuditoriaAlteracoes.id.desc()).limit(100), 'ix_auditoria_data_id'),
+        ('auditoria por atendente', db.session.query(AuditoriaAlteracoes.id).filter(AuditoriaAlteracoes.atendente == 'x').order_by(AuditoriaAlteracoes.data_alteracao.desc()), 'ix_auditoria_atendente_data'),
+        ('listagem paginada', db.session.query(Cadastro.cpf).order_by(Cadastro.nome, Cadastro.cpf).limit(50), 'ix_cadastros_nome_cpf'),
+        ('listagem, página seguinte', db.session.query(Cadastro.cpf).filter(tuple_(Cadastro.nome, Cadastro.cpf) > tuple_('Maria', '000.000.000-00')).order_by(Cadastro.nome, Cadastro.cpf).limit(50), 'ix_cadastros_nome_cpf'),
+    ]
+    if db.engine.dialect.name == 'postgresql':
+        # LIKE por prefixo (varchar_pattern_ops) e em qualquer posição (trigram) só têm índice no Postgres.
+        consultas += [
+            ('busca por nome', db.session.query(Cadastro.cpf).filter(filtro_busca('jose silva')).order_by(Cadastro.nome, Cadastro.cpf), 'ix_cadastros_nome_busca_trgm'),
+            ('busca por CPF parcial', db.session.query(Cadastro.cpf).filter(filtro_cpf('123.45')).order_by(Cadastro.nome, Cadastro.cpf), 'ix_cadastros_cpf_digitos_trgm'),
+            ('busca por prefixo de CPF', db.session.query(Cadastro.cpf).filter(filtro_cpf('12')), 'ix_cadastros_cpf_digitos'),
+            ('busca por matrícula', db.session.query(Cadastro.cpf).filter(Cadastro.matricula.startswith('2024', autoescape=True)), 'ix_cadastros_matricula'),
+        ]
+    return consultas
+
+def _plano_de_execucao(query):
+    dialeto = db.engine.dialect
+    if dialeto.name == 'postgresql':
+        # Parâmetros vão para o driver: o psycopg2 não sabe renderizar datas como literais no SQL.
+        compilada = query.statement.compile(dialect=dialeto)
+        return json.dumps(db.session.connection().exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compilada}', compilada.params).scalar())
+    sql = str(query.statement.compile(dialect=dialeto, compile_kwargs={'literal_binds': True}))
+    return '\n'.join(linha[-1] for linha in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')))
+
+def usa_indice(plano, indice):
+    """Se o plano cita o índice (pelo nome exato: ix_x não casa com ix_x_trgm)."""
+    return re.search(rf'\b{re.escape(indice)}\b', plano) is not None
+
+@app.cli.command('verificar-planos')
+def verificar_planos():
+    """Confere via EXPLAIN que as consultas críticas usam os índices esperados.
+
+    Sai com código 1 se alguma regrediu para varredura completa (ex.: índice removido ou
+    consulta reescrita de um jeito que o índice não atende). Pode rodar no CI ou após o deploy.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        # Em tabelas pequenas o Postgres prefere seq scan mesmo com o índice; aqui só
+        # interessa saber se o índice é utilizável.
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+    falhas = 0
+    for descricao, query, indice in _consultas_criticas():
+        plano = _plano_de_execucao(query)
+        if usa_indice(plano, indice):
+            print(f"OK      {descricao}: {indice}")
+        else:
+            falhas += 1
+            print(f"FALHOU  {descricao}: esperado {indice}\n{plano}")
+    db.session.rollback()
+    if falhas:
+        raise SystemExit(1)
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-        # Cria o utilizador administrador se não existir
-        if not User.query.filter_by(username=ADMIN_USERNAME).first():
-            admin_user = User(
-                username=ADMIN_USERNAME,
-                password=ADMIN_PASSWORD,
-                permissions={
-                    "cadastro": True, "consulta": True, "editar": True, "visitas-pendentes": True,
-                    "visitas-realizadas": True, "estatisticas": True, "audit": True, "usuarios": True
-                }
-            )
-            db.session.add(admin_user)
-            db.session.commit()
+        upgrade()
+        garantir_admin()
         app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,96 @@
+"""Micro-benchmark da renderização de PDFs (declaração e ficha de cadastro).
+
+Não precisa de banco: usa um cadastro em memória e chama as mesmas classes de PDF das rotas.
+
+    python bench/bench_pdf.py --n 200
+    python bench/bench_pdf.py --n 200 --sem-cache   # descarta o logo decodificado a cada documento
+    python bench/bench_pdf.py --n 200 --threads 8   # renderiza em paralelo e confere o resultado
+
+O modo --threads reproduz o worker gthread do gunicorn: várias threads gerando PDFs ao
+mesmo tempo, compartilhando os caches do módulo. Cada documento precisa sair idêntico ao
+gerado por uma thread só; se não sair, alguma premissa de thread-safety do app.py quebrou.
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as provavida  # noqa: E402
+
+# Fora do contêiner o logo fica em ../frontend, e não em backend/frontend.
+FRONTEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'frontend')
+if not os.path.exists(os.path.join(provavida.app.static_folder, 'logo.png')) and os.path.isdir(FRONTEND):
+    provavida.app.static_folder = os.path.abspath(FRONTEND)
+
+CADASTRO = SimpleNamespace(
+    cpf='123.456.789-00', nome='Maria José da Conceição', qualidade='Aposentado(a)',
+    tem_procurador=True, procurador_nome='João Antônio Pereira', procurador_cpf='987.654.321-00',
+    tem_curador=False, curador_nome=None, curador_cpf=None,
+    atendente_criacao='Atendente Teste', data_atendimento=date.today(),
+)
+
+def renderizar_declaracao(cadastro):
+    pdf = provavida.DeclaracaoPDF()
+    pdf.add_page()
+    pdf.body_text(cadastro)
+    pdf.signature_section(cadastro)
+    return pdf.output(dest='S').encode('latin-1')
+
+def medir(funcao, n, sem_cache):
+    funcao()  # aquecimento
+    tempos = []
+    for _ in range(n):
+        if sem_cache:
+            provavida.BasePDF.descartar_cache()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return {
+        'media_ms': statistics.mean(tempos) * 1000,
+        'p50_ms': tempos[len(tempos) // 2] * 1000,
+        'p95_ms': tempos[int(len(tempos) * 0.95) - 1] * 1000,
+        'docs_por_s': n / sum(tempos),
+    }
+
+def _sem_data_de_criacao(conteudo):
+    return re.sub(rb'/CreationDate \(D:\d+\)', b'', conteudo)
+
+def verificar_concorrencia(n, threads):
+    """Renderiza n declarações em `threads` threads e compara com a renderização sequencial."""
+    esperado = _sem_data_de_criacao(renderizar_declaracao(CADASTRO))
+    provavida.BasePDF.descartar_cache()  # força as threads a disputarem a primeira carga do logo
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        resultados = list(executor.map(lambda _: renderizar_declaracao(CADASTRO), range(n)))
+    duracao = time.perf_counter() - inicio
+    divergentes = sum(1 for r in resultados if _sem_data_de_criacao(r) != esperado)
+    return divergentes, n / duracao
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--n', type=int, default=100, help='documentos por medição')
+    parser.add_argument('--sem-cache', action='store_true', help='simula o comportamento sem o cache do timbre')
+    parser.add_argument('--threads', type=int, default=0, help='renderiza em paralelo e confere se o resultado é idêntico')
+    args = parser.parse_args()
+    if args.sem_cache and not hasattr(provavida.BasePDF, 'descartar_cache'):
+        parser.error('esta versão do app.py não tem cache de timbre')
+    resultado = medir(lambda: renderizar_declaracao(CADASTRO), args.n, args.sem_cache)
+    print(f"declaração: média {resultado['media_ms']:.2f} ms, p50 {resultado['p50_ms']:.2f} ms, "
+          f"p95 {resultado['p95_ms']:.2f} ms, {resultado['docs_por_s']:.0f} docs/s")
+    if args.threads:
+        divergentes, docs_por_s = verificar_concorrencia(args.n, args.threads)
+        print(f"{args.threads} threads: {docs_por_s:.0f} docs/s, {divergentes} de {args.n} documentos divergentes")
+        if divergentes:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
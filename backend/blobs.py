@@ -0,0 +1,197 @@
+"""Armazenamento de fotos e documentos endereçado pelo conteúdo.
+
+Cada blob é gravado sob o SHA-256 do próprio conteúdo, que é também o que o cadastro guarda
+(documento_hash, foto_hash, foto_miniatura_hash). Conteúdos repetidos (a mesma foto enviada
+duas vezes, o mesmo PDF anexado a vários cadastros) ocupam espaço uma vez só, e um blob
+gravado nunca muda: o hash serve direto como ETag.
+
+Dois backends, escolhidos por BLOB_STORAGE:
+  - 'local': diretório no disco (BLOB_DIR), em subpastas pelos primeiros caracteres do hash.
+    Em contêiner, o diretório precisa estar num volume persistente.
+  - 's3': qualquer serviço compatível com S3 (BLOB_S3_BUCKET, BLOB_S3_PREFIX e, para MinIO
+    ou outro serviço que não a AWS, BLOB_S3_ENDPOINT_URL). Precisa do pacote boto3; as
+    credenciais vêm das variáveis padrão da AWS (AWS_ACCESS_KEY_ID etc.). Para testar sem a
+    AWS, basta apontar o endpoint para um MinIO ou um `moto_server` local.
+
+Blobs não são apagados quando o cadastro troca de foto, já que outro cadastro pode usar o
+mesmo conteúdo; o comando `flask limpar-blobs` remove os que não são mais referenciados.
+"""
+import hashlib
+import os
+import re
+import threading
+
+HASH_VALIDO = re.compile(r'[0-9a-f]{64}')
+
+
+def hash_conteudo(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def _validar_hash(conteudo_hash):
+    # O hash vira nome de arquivo/chave: nada fora do formato passa, nem por engano.
+    if not conteudo_hash or not HASH_VALIDO.fullmatch(conteudo_hash):
+        raise ValueError(f"hash de blob inválido: {conteudo_hash!r}")
+    return conteudo_hash
+
+
+class Armazenamento:
+    """Interface comum dos backends. Blobs inexistentes lançam FileNotFoundError."""
+
+    def guardar(self, conteudo):
+        """Grava o conteúdo (se ainda não existir) e retorna o seu hash."""
+        conteudo_hash = hash_conteudo(conteudo)
+        if not self.existe(conteudo_hash):
+            self._gravar(conteudo_hash, conteudo)
+        return conteudo_hash
+
+    def existe(self, conteudo_hash):
+        raise NotImplementedError
+
+    def ler(self, conteudo_hash):
+        raise NotImplementedError
+
+    def caminho_local(self, conteudo_hash):
+        """Caminho do blob no disco, para servi-lo sem copiar para a memória (None se não houver)."""
+        return None
+
+    def remover(self, conteudo_hash):
+        raise NotImplementedError
+
+    def listar(self):
+        """Itera sobre (hash, timestamp da gravação) de todos os blobs gravados."""
+        raise NotImplementedError
+
+    def _gravar(self, conteudo_hash, conteudo):
+        raise NotImplementedError
+
+
+class ArmazenamentoLocal(Armazenamento):
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+
+    def _caminho(self, conteudo_hash):
+        _validar_hash(conteudo_hash)
+        return os.path.join(self.diretorio, conteudo_hash[:2], conteudo_hash[2:4], conteudo_hash)
+
+    def existe(self, conteudo_hash):
+        return os.path.exists(self._caminho(conteudo_hash))
+
+    def _gravar(self, conteudo_hash, conteudo):
+        caminho = self._caminho(conteudo_hash)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        # Grava ao lado e renomeia: quem lê nunca vê um blob pela metade, e duas gravações
+        # simultâneas do mesmo conteúdo terminam no mesmo arquivo.
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, 'wb') as f:
+            f.write(conteudo)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+
+    def ler(self, conteudo_hash):
+        with open(self._caminho(conteudo_hash), 'rb') as f:
+            return f.read()
+
+    def caminho_local(self, conteudo_hash):
+        caminho = self._caminho(conteudo_hash)
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(caminho)
+        return caminho
+
+    def remover(self, conteudo_hash):
+        try:
+            os.remove(self._caminho(conteudo_hash))
+        except FileNotFoundError:
+            pass
+
+    def listar(self):
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if HASH_VALIDO.fullmatch(nome):
+                    try:
+                        yield nome, os.path.getmtime(os.path.join(raiz, nome))
+                    except FileNotFoundError:
+                        continue
+
+
+class ArmazenamentoS3(Armazenamento):
+    def __init__(self, bucket, prefixo='', **opcoes_cliente):
+        self.bucket = bucket
+        self.prefixo = prefixo
+        self.opcoes_cliente = opcoes_cliente
+        self._lock = threading.Lock()
+        self._cliente = None
+        self._pid = None
+
+    # Como os executores da fila de exportações, o cliente é criado sob demanda e recriado
+    # após um fork: conexões abertas no mestre do gunicorn não servem aos workers.
+    @property
+    def cliente(self):
+        with self._lock:
+            if self._cliente is None or self._pid != os.getpid():
+                try:
+                    import boto3
+                except ImportError:
+                    raise RuntimeError("BLOB_STORAGE=s3 precisa do pacote boto3 (pip install boto3).")
+                self._cliente = boto3.session.Session().client('s3', **self.opcoes_cliente)
+                self._pid = os.getpid()
+            return self._cliente
+
+    def _chave(self, conteudo_hash):
+        return f"{self.prefixo}{_validar_hash(conteudo_hash)}"
+
+    @staticmethod
+    def _nao_encontrado(erro):
+        return erro.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def existe(self, conteudo_hash):
+        from botocore.exceptions import ClientError
+        try:
+            self.cliente.head_object(Bucket=self.bucket, Key=self._chave(conteudo_hash))
+        except ClientError as e:
+            if self._nao_encontrado(e):
+                return False
+            raise
+        return True
+
+    def _gravar(self, conteudo_hash, conteudo):
+        self.cliente.put_object(Bucket=self.bucket, Key=self._chave(conteudo_hash), Body=conteudo)
+
+    def ler(self, conteudo_hash):
+        from botocore.exceptions import ClientError
+        try:
+            resposta = self.cliente.get_object(Bucket=self.bucket, Key=self._chave(conteudo_hash))
+        except ClientError as e:
+            if self._nao_encontrado(e):
+                raise FileNotFoundError(self._chave(conteudo_hash))
+            raise
+        return resposta['Body'].read()
+
+    def remover(self, conteudo_hash):
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._chave(conteudo_hash))
+
+    def listar(self):
+        paginas = self.cliente.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefixo)
+        for pagina in paginas:
+            for objeto in pagina.get('Contents', []):
+                nome = objeto['Key'][len(self.prefixo):]
+                if HASH_VALIDO.fullmatch(nome):
+                    yield nome, objeto['LastModified'].timestamp()
+
+
+def criar_armazenamento(config):
+    """Backend configurado em `config` (o app.config do Flask)."""
+    tipo = config['BLOB_STORAGE']
+    if tipo == 'local':
+        return ArmazenamentoLocal(config['BLOB_DIR'])
+    if tipo == 's3':
+        if not config['BLOB_S3_BUCKET']:
+            raise RuntimeError("BLOB_STORAGE=s3 precisa de BLOB_S3_BUCKET.")
+        opcoes = {}
+        if config['BLOB_S3_ENDPOINT_URL']:
+            opcoes['endpoint_url'] = config['BLOB_S3_ENDPOINT_URL']
+        if config['BLOB_S3_REGION']:
+            opcoes['region_name'] = config['BLOB_S3_REGION']
+        return ArmazenamentoS3(config['BLOB_S3_BUCKET'], config['BLOB_S3_PREFIX'], **opcoes)
+    raise RuntimeError(f"BLOB_STORAGE desconhecido: {tipo!r} (use 'local' ou 's3').")
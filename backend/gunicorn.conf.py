@@ -0,0 +1,94 @@
+# Configuração do Gunicorn para produção.
+#
+# Todos os valores podem ser ajustados por variáveis de ambiente no painel, sem rebuild:
+#   WEB_CONCURRENCY         número de processos (padrão: 2 x núcleos + 1)
+#   GUNICORN_WORKER_CLASS   'gthread' (padrão) ou 'gevent' (precisa de gevent e psycogreen instalados)
+#   GUNICORN_THREADS        threads por processo no gthread (padrão: 4)
+#   GUNICORN_WORKER_CONNECTIONS  conexões simultâneas por processo no gevent (padrão: 100)
+#   GUNICORN_TIMEOUT        segundos até um worker travado ser reiniciado (padrão: 120)
+#   GUNICORN_MAX_REQUESTS   requisições até o worker ser reciclado (padrão: 1000, 0 desliga)
+#
+# Conexões com o Postgres: cada worker tem o próprio pool (DB_POOL_SIZE + DB_MAX_OVERFLOW,
+# padrão 5 + 10). O app.py reparte DB_MAX_CONNECTIONS (padrão: 90, abaixo dos 100 do
+# max_connections padrão do Postgres) entre os WEB_CONCURRENCY workers e reduz o pool de
+# cada um se preciso; se não couber nem uma conexão por worker, o app não sobe. Ao aumentar
+# os workers numa máquina maior, confira o max_connections do banco e ajuste DB_MAX_CONNECTIONS.
+#
+# Server-sent events (/api/cadastros/stream): cada stream aberto ocupa uma thread do worker
+# por até SSE_MAX_SECONDS. Por isso cada processo aceita no máximo SSE_MAX_STREAMS streams e
+# responde 503 aos excedentes. Sem SSE_MAX_STREAMS, o limite é GUNICORN_THREADS menos
+# SSE_RESERVED_THREADS (padrão: 2 threads sempre livres para as demais rotas), ou seja, 2
+# streams com as 4 threads padrão; no gevent, em que cada stream é um greenlet, a conta usa
+# GUNICORN_WORKER_CONNECTIONS. A instância comporta WEB_CONCURRENCY × esse limite; para mais
+# streams, aumente GUNICORN_THREADS (cada thread a mais vira uma vaga) ou use o gevent.
+#
+# Com gevent o app não é pré-carregado (ver preload_app abaixo).
+#
+# Premissas de thread-safety do app.py (válidas para gthread e gevent):
+#   - Nada de estado global mutável por requisição: a data por extenso dos PDFs usa
+#     MESES_PT em vez de locale.setlocale, que é global ao processo.
+#   - Os caches em memória (CacheLRU de autenticação e de fotos, CacheEstatisticas, logo
+#     do BasePDF) são protegidos por lock e nunca fazem I/O de rede com o lock preso, então
+#     também não bloqueiam o loop do gevent.
+#   - Cada instância de FPDF é local à requisição; o logo decodificado é compartilhado só
+#     para leitura e cada documento recebe uma cópia rasa (fpdf apaga 'data' ao gravar).
+#   - A sessão do Flask-SQLAlchemy é escopada por thread/greenlet.
+#   - A fila de exportações (jobs.py) cria as threads e o pool de processos sob demanda,
+#     já dentro do worker, então o preload não herda threads do processo mestre.
+import multiprocessing
+import os
+import secrets
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Lido pelo app.py (importado depois desta configuração, no preload) para dimensionar o pool.
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+# Também lidos pelo app.py, para o limite de streams SSE por processo.
+os.environ['GUNICORN_WORKER_CLASS'] = worker_class
+os.environ['GUNICORN_THREADS'] = str(threads)
+os.environ['GUNICORN_WORKER_CONNECTIONS'] = str(worker_connections)
+
+# O import do app (Flask, SQLAlchemy, fpdf, Pillow) acontece uma vez no mestre e é
+# compartilhado por copy-on-write. Também garante a mesma SECRET_KEY aleatória em todos
+# os workers quando a variável não está definida.
+#
+# Com gevent não: o worker só aplica o monkey-patching ao iniciar, e os locks, o CacheLRU e
+# o semáforo dos streams criados no mestre ficariam com as primitivas de thread nativas,
+# travando o loop inteiro em vez de só o greenlet. Cada worker importa o app depois do
+# patch; a chave aleatória é sorteada aqui para continuar a mesma em todos.
+preload_app = worker_class != 'gevent'
+if not preload_app:
+    os.environ.setdefault('SECRET_KEY', secrets.token_hex(32))
+
+# Reciclagem gradual dos workers: limita vazamentos de memória (ex.: fragmentação após
+# PDFs grandes) sem que todos reiniciem ao mesmo tempo.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', max(max_requests // 10, 1) if max_requests else 0))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Conexões abertas no mestre não podem ser compartilhadas entre processos: cada
+    # worker começa com o pool de conexões vazio. Sem preload não há o que descartar, e
+    # importar o app aqui, antes do patch do gevent, desfaria o motivo de não pré-carregar.
+    if preload_app:
+        from app import app, db
+        with app.app_context():
+            db.engine.dispose()
+
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen não instalado: consultas ao Postgres vão bloquear o worker gevent.")
@@ -0,0 +1,209 @@
+"""Fila local de tarefas de exportação (relatórios PDF/CSV grandes).
+
+As tarefas rodam numa thread de fundo do próprio worker, e a parte pesada de CPU (montar
+o PDF) vai para um pool de processos. Assim o worker do gunicorn responde na hora e não
+esbarra no timeout.
+
+O estado de cada tarefa fica em disco, em `<diretorio>/<id>.json`, e o arquivo pronto em
+`<id>.bin`. Assim qualquer worker da mesma máquina consegue consultar o andamento ou
+servir o download, não só o que recebeu o pedido. O id é derivado do tipo e dos parâmetros,
+de modo que pedidos idênticos feitos ao mesmo tempo compartilham a mesma tarefa.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+
+
+class FilaRelatorios:
+    def __init__(self, diretorio, max_bytes, threads=2, processos=2, reaproveitar_por=60, tempo_limite=900, logger=None):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.threads = threads
+        self.processos = processos
+        self.reaproveitar_por = reaproveitar_por
+        self.tempo_limite = tempo_limite
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pool = None
+        self._pid = None
+
+    # Os executores são criados sob demanda e recriados após um fork (preload_app do
+    # gunicorn): threads e pools herdados do processo mestre não funcionam no filho.
+    def _executores(self):
+        with self._lock:
+            if self._pid != os.getpid() or self._executor is None:
+                os.makedirs(self.diretorio, exist_ok=True)
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='relatorios')
+                self._pool = None
+                self._pid = os.getpid()
+            return self._executor
+
+    def _pool_processos(self):
+        self._executores()
+        with self._lock:
+            if self._pool is None:
+                # spawn em vez de fork: o worker tem várias threads, e fazer fork de um
+                # processo com threads pode herdar locks presos.
+                self._pool = ProcessPoolExecutor(max_workers=self.processos, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def executar_em_processo(self, funcao, *args):
+        """Executa `funcao(*args)` no pool de processos e espera o resultado.
+
+        `funcao` precisa ser importável pelo nome (definida no nível do módulo).
+        """
+        try:
+            return self._pool_processos().submit(funcao, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+            return self._pool_processos().submit(funcao, *args).result()
+
+    def mapear_em_processos(self, funcao, itens):
+        """Como map(), mas distribuindo os itens pelo pool de processos (mantém a ordem)."""
+        try:
+            yield from self._pool_processos().map(funcao, itens)
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+            raise
+
+    @staticmethod
+    def gerar_id(tipo, parametros):
+        chave = json.dumps({'tipo': tipo, 'parametros': parametros}, sort_keys=True)
+        return hashlib.sha256(chave.encode('utf-8')).hexdigest()[:32]
+
+    def _caminho(self, job_id, extensao):
+        return os.path.join(self.diretorio, f"{job_id}.{extensao}")
+
+    def caminho_arquivo(self, job_id):
+        return self._caminho(job_id, 'bin')
+
+    def status(self, job_id):
+        """Estado da tarefa, ou None se ela não existe (ou já saiu do cache)."""
+        try:
+            with open(self._caminho(job_id, 'json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _gravar_status(self, job_id, status):
+        status['atualizado_em'] = time.time()
+        temporario = self._caminho(job_id, f"json.{os.getpid()}.{threading.get_ident()}")
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(temporario, self._caminho(job_id, 'json'))
+        return status
+
+    def _reaproveitavel(self, status):
+        if status is None:
+            return False
+        if status['estado'] in (PENDENTE, EXECUTANDO):
+            # Tarefa de um worker que morreu no meio fica "presa"; depois do limite é refeita.
+            return time.time() - status['atualizado_em'] < self.tempo_limite
+        if status['estado'] == CONCLUIDO:
+            return (time.time() - status['concluido_em'] < self.reaproveitar_por
+                    and os.path.exists(self.caminho_arquivo(status['id'])))
+        return False
+
+    def submeter(self, tipo, parametros, tarefa, nome_arquivo, mimetype):
+        """Agenda a tarefa, ou devolve a já existente para o mesmo tipo e parâmetros.
+
+        `tarefa(caminho)` roda numa thread de fundo e deve gravar o resultado em `caminho`.
+        Retorna o status da tarefa.
+        """
+        self._executores()
+        job_id = self.gerar_id(tipo, parametros)
+        atual = self.status(job_id)
+        if self._reaproveitavel(atual):
+            return atual
+
+        # O lock em disco evita que dois workers iniciem a mesma tarefa ao mesmo tempo.
+        trava = self._caminho(job_id, 'lock')
+        try:
+            descritor = os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if time.time() - os.path.getmtime(trava) < self.tempo_limite:
+                return self.status(job_id) or {'id': job_id, 'estado': PENDENTE, 'tipo': tipo, 'parametros': parametros}
+            os.remove(trava)
+            return self.submeter(tipo, parametros, tarefa, nome_arquivo, mimetype)
+        os.close(descritor)
+
+        status = self._gravar_status(job_id, {
+            'id': job_id, 'estado': PENDENTE, 'tipo': tipo, 'parametros': parametros,
+            'nome_arquivo': nome_arquivo, 'mimetype': mimetype,
+            'criado_em': time.time(), 'concluido_em': None, 'tamanho': None, 'erro': None,
+        })
+        self._executores().submit(self._executar, job_id, tarefa)
+        return status
+
+    def _executar(self, job_id, tarefa):
+        status = self.status(job_id)
+        if status is None:
+            # Sem o status não há onde registrar o andamento: a tarefa é descartada e o
+            # próximo pedido igual a agenda de novo.
+            if self.logger:
+                self.logger.warning(f"Status da tarefa de exportação {job_id} sumiu antes da execução; tarefa descartada")
+            self._liberar(job_id)
+            return
+        temporario = self._caminho(job_id, f"bin.{os.getpid()}.tmp")
+        try:
+            self._gravar_status(job_id, dict(status, estado=EXECUTANDO))
+            tarefa(temporario)
+            os.replace(temporario, self.caminho_arquivo(job_id))
+            self._gravar_status(job_id, dict(status, estado=CONCLUIDO, concluido_em=time.time(),
+                                             tamanho=os.path.getsize(self.caminho_arquivo(job_id))))
+        except Exception as e:
+            if self.logger:
+                self.logger.exception(f"Erro na tarefa de exportação {job_id}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            self._gravar_status(job_id, dict(status, estado=ERRO, erro=str(e)))
+        finally:
+            self._liberar(job_id)
+            self._limitar_cache()
+
+    def _liberar(self, job_id):
+        try:
+            os.remove(self._caminho(job_id, 'lock'))
+        except FileNotFoundError:
+            pass
+
+    def _limitar_cache(self):
+        """Remove os arquivos prontos mais antigos até o cache caber em max_bytes.
+
+        Tarefas pendentes ou em execução ficam de fora: uma tarefa refeita ainda tem o arquivo
+        da execução anterior, e apagar o status junto deixaria a execução sem ele.
+        """
+        arquivos = []
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith('.bin'):
+                status = self.status(nome[:-len('.bin')])
+                if status and status['estado'] in (PENDENTE, EXECUTANDO):
+                    continue
+                caminho = os.path.join(self.diretorio, nome)
+                try:
+                    arquivos.append((os.path.getmtime(caminho), os.path.getsize(caminho), caminho))
+                except FileNotFoundError:
+                    continue
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.max_bytes:
+                break
+            for extensao in ('.bin', '.json'):
+                try:
+                    os.remove(caminho[:-len('.bin')] + extensao)
+                except FileNotFoundError:
+                    pass
+            total -= tamanho
@@ -0,0 +1,271 @@
+"""Métricas no formato de texto do Prometheus, sem dependências externas.
+
+Cada processo (worker do gunicorn, processo do pool de exportações) acumula suas métricas em
+memória. Quando `diretorio` é informado, o processo grava um retrato em `<diretorio>/<pid>.json`
+no máximo a cada `intervalo_gravacao` (alterações dentro do intervalo são gravadas por um timer
+ao fim dele), e quem responde ao /metrics soma os retratos de todos os processos da máquina. Assim o Prometheus vê os totais da instância, não os de um worker sorteado.
+Retratos de processos encerrados (ex.: reciclados pelo max_requests) são incorporados a
+`acumulado.json`, então os contadores nunca regridem.
+
+Medidores (gauges) são calculados na hora da coleta e refletem só o processo que respondeu.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores)) + (extra or [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _formatar_numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, registro, nome, ajuda, rotulos=()):
+        self.registro = registro
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def retrato(self):
+        with self._lock:
+            return {chave: json.loads(json.dumps(valor)) for chave, valor in self._valores.items()}
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+        self.registro._alterado()
+
+    @staticmethod
+    def somar(a, b):
+        return a + b
+
+    def linhas(self, valores):
+        for chave, valor in sorted(valores.items()):
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}"
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, registro, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        super().__init__(registro, nome, ajuda, rotulos)
+        self.buckets = tuple(buckets)
+
+    def observe(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            # [contagem por bucket (não cumulativa, a última posição é o +Inf), soma, total]
+            estado = self._valores.setdefault(chave, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            estado[0][indice] += 1
+            estado[1] += valor
+            estado[2] += 1
+        self.registro._alterado()
+
+    @contextmanager
+    def medir(self, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **rotulos)
+
+    @staticmethod
+    def somar(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def linhas(self, valores):
+        for chave, (contagens, soma, total) in sorted(valores.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float('inf'),), contagens):
+                acumulado += contagem
+                yield f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, [('le', _formatar_numero(limite))])} {acumulado}"
+            yield f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(soma)}"
+            yield f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {total}"
+
+
+class Medidor(_Metrica):
+    """Gauge calculado na coleta: `funcao()` retorna {tupla de rótulos: valor}."""
+    tipo = 'gauge'
+
+    def __init__(self, registro, nome, ajuda, rotulos, funcao):
+        super().__init__(registro, nome, ajuda, rotulos)
+        self.funcao = funcao
+
+    def linhas(self, valores):
+        for chave, valor in sorted(valores.items()):
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}"
+
+
+class Registro:
+    def __init__(self, diretorio=None, intervalo_gravacao=1.0):
+        self.diretorio = diretorio
+        self.intervalo_gravacao = intervalo_gravacao
+        self._metricas = []
+        self._ultima_gravacao = 0.0
+        self._lock_gravacao = threading.Lock()
+        self._lock_agendamento = threading.Lock()
+        self._agendada = None
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+            atexit.register(self.persistir)
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(self, nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        return self._registrar(Histograma(self, nome, ajuda, rotulos, buckets))
+
+    def medidor(self, nome, ajuda, rotulos, funcao):
+        return self._registrar(Medidor(self, nome, ajuda, rotulos, funcao))
+
+    def _registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def _acumulaveis(self):
+        return [m for m in self._metricas if not isinstance(m, Medidor)]
+
+    # --- Retratos em disco (agregação entre processos) ---
+    def _alterado(self):
+        if not self.diretorio:
+            return
+        restante = self.intervalo_gravacao - (time.monotonic() - self._ultima_gravacao)
+        if restante <= 0:
+            self.persistir()
+        else:
+            self._agendar(restante)
+
+    def _agendar(self, atraso):
+        # Sem o timer, a última alteração antes de o processo ficar ocioso só chegaria ao
+        # disco (e ao /metrics dos outros workers) na próxima alteração.
+        agendada = self._agendada
+        if agendada is not None and agendada.is_alive():
+            return
+        with self._lock_agendamento:
+            # Depois de um fork, o timer herdado do pai não existe no filho (is_alive() é False).
+            if self._agendada is not None and self._agendada.is_alive():
+                return
+            self._agendada = threading.Timer(atraso, self._gravar_agendada)
+            self._agendada.daemon = True
+            self._agendada.start()
+
+    def _gravar_agendada(self):
+        # Liberado antes de gravar: uma alteração durante a gravação agenda outra.
+        with self._lock_agendamento:
+            self._agendada = None
+        self.persistir()
+
+    def persistir(self):
+        if not self.diretorio:
+            return
+        with self._lock_gravacao:
+            self._ultima_gravacao = time.monotonic()
+            retrato = {m.nome: [[list(chave), valor] for chave, valor in m.retrato().items()] for m in self._acumulaveis()}
+            caminho = os.path.join(self.diretorio, f"{os.getpid()}.json")
+            temporario = f"{caminho}.{threading.get_ident()}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(retrato, f)
+            os.replace(temporario, caminho)
+
+    @staticmethod
+    def _processo_ativo(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _ler(self, caminho):
+        try:
+            with open(caminho, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _somar_retrato(self, totais, retrato):
+        for metrica in self._acumulaveis():
+            destino = totais.setdefault(metrica.nome, {})
+            for chave, valor in retrato.get(metrica.nome, []):
+                chave = tuple(chave)
+                destino[chave] = metrica.somar(destino[chave], valor) if chave in destino else valor
+        return totais
+
+    def _valores_agregados(self):
+        if not self.diretorio:
+            return {m.nome: m.retrato() for m in self._acumulaveis()}
+
+        self.persistir()
+        with open(os.path.join(self.diretorio, '.lock'), 'w') as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            caminho_acumulado = os.path.join(self.diretorio, 'acumulado.json')
+            acumulado = self._somar_retrato({}, self._ler(caminho_acumulado))
+            encerrados = []
+            totais = self._somar_retrato({}, self._ler(caminho_acumulado))
+            for nome in os.listdir(self.diretorio):
+                if not nome.endswith('.json') or not nome[:-len('.json')].isdigit():
+                    continue
+                caminho = os.path.join(self.diretorio, nome)
+                retrato = self._ler(caminho)
+                self._somar_retrato(totais, retrato)
+                if not self._processo_ativo(int(nome[:-len('.json')])):
+                    self._somar_retrato(acumulado, retrato)
+                    encerrados.append(caminho)
+            if encerrados:
+                serializado = {nome: [[list(chave), valor] for chave, valor in valores.items()] for nome, valores in acumulado.items()}
+                with open(caminho_acumulado + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(serializado, f)
+                os.replace(caminho_acumulado + '.tmp', caminho_acumulado)
+                for caminho in encerrados:
+                    os.remove(caminho)
+        return totais
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        valores = self._valores_agregados()
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            if isinstance(metrica, Medidor):
+                try:
+                    atuais = metrica.funcao()
+                except Exception:
+                    atuais = {}
+                linhas.extend(metrica.linhas(atuais))
+            else:
+                linhas.extend(metrica.linhas(valores.get(metrica.nome, {})))
+        return '\n'.join(linhas) + '\n'
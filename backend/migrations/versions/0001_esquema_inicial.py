@@ -0,0 +1,84 @@
+"""Esquema inicial (users, cadastros, auditoria_alteracoes)
+
+Bancos criados antes das migrações (via db.create_all) já têm essas tabelas; nesse caso
+esta revisão não faz nada e só passa a ser registrada em alembic_version.
+
+Revision ID: 0001_esquema_inicial
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_esquema_inicial'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _tabelas():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    tabelas = _tabelas()
+    if 'users' not in tabelas:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('username', sa.String(80), nullable=False, unique=True),
+            sa.Column('password', sa.String(120), nullable=False),
+            sa.Column('permissions', sa.JSON()),
+        )
+    if 'cadastros' not in tabelas:
+        op.create_table(
+            'cadastros',
+            sa.Column('cpf', sa.String(14), primary_key=True),
+            sa.Column('matricula', sa.String(100), nullable=True),
+            sa.Column('nome', sa.String(255), nullable=False),
+            sa.Column('telefone', sa.String(20), nullable=False),
+            sa.Column('email', sa.String(255), nullable=True),
+            sa.Column('is_whatsapp', sa.Boolean(), nullable=False),
+            sa.Column('qualidade', sa.String(100), nullable=False),
+            sa.Column('data_atendimento', sa.Date(), nullable=False),
+            sa.Column('informacao', sa.Text(), nullable=True),
+            sa.Column('obs', sa.Text(), nullable=True),
+            sa.Column('atendente_criacao', sa.String(100), nullable=False),
+            sa.Column('data_criacao', sa.DateTime(), nullable=True),
+            sa.Column('atendente_modificacao', sa.String(100), nullable=True),
+            sa.Column('data_modificacao', sa.DateTime(), nullable=True),
+            sa.Column('necessita_visita_social', sa.Boolean(), nullable=True),
+            sa.Column('status_visita', sa.String(50), nullable=True),
+            sa.Column('processo', sa.String(100), nullable=True),
+            sa.Column('endereco', sa.Text(), nullable=True),
+            sa.Column('assunto_visita', sa.Text(), nullable=True),
+            sa.Column('tem_procurador', sa.Boolean(), nullable=True),
+            sa.Column('procurador_nome', sa.String(255), nullable=True),
+            sa.Column('procurador_cpf', sa.String(14), nullable=True),
+            sa.Column('tem_curador', sa.Boolean(), nullable=True),
+            sa.Column('curador_nome', sa.String(255), nullable=True),
+            sa.Column('curador_cpf', sa.String(14), nullable=True),
+            sa.Column('nome_documento', sa.String(255), nullable=True),
+            sa.Column('documento_pdf', sa.LargeBinary(), nullable=True),
+            sa.Column('foto_segurado', sa.LargeBinary(), nullable=True),
+        )
+    if 'auditoria_alteracoes' not in tabelas:
+        op.create_table(
+            'auditoria_alteracoes',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('cadastro_cpf', sa.String(14), sa.ForeignKey('cadastros.cpf'), nullable=False),
+            sa.Column('atendente', sa.String(100), nullable=False),
+            sa.Column('data_alteracao', sa.DateTime(), nullable=True),
+            sa.Column('campo_alterado', sa.String(100), nullable=False),
+            sa.Column('valor_antigo', sa.Text(), nullable=True),
+            sa.Column('valor_novo', sa.Text(), nullable=True),
+        )
+
+
+def downgrade():
+    op.drop_table('auditoria_alteracoes')
+    op.drop_table('cadastros')
+    op.drop_table('users')
@@ -0,0 +1,110 @@
+"""Colunas de busca, hashes, miniatura e versão do cadastro, com seus índices
+
+Colunas que entraram no modelo depois do esquema inicial. Cada passo confere se a coluna
+ou o índice já existe, então a revisão também serve para bancos em que db.create_all já
+criou parte delas.
+
+Revision ID: 0002_colunas_busca_e_versao
+Revises: 0001_esquema_inicial
+Create Date: 2026-10-18 12:00:00
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_colunas_busca_e_versao'
+down_revision = '0001_esquema_inicial'
+branch_labels = None
+depends_on = None
+
+LINHAS_POR_LOTE = 1000
+
+
+def _colunas(tabela):
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns(tabela)}
+
+
+def _indices(tabela):
+    return {i['name'] for i in sa.inspect(op.get_bind()).get_indexes(tabela)}
+
+
+# Cópias de somente_digitos/normalizar_busca do app.py: a migração não deve depender do
+# código atual da aplicação, que pode mudar depois.
+def _somente_digitos(valor):
+    return re.sub(r'\D', '', valor or '')
+
+
+def _normalizar_busca(texto):
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(ch for ch in decomposto if not unicodedata.combining(ch))
+    return ' '.join(sem_acentos.lower().split())
+
+
+def _preencher_colunas_busca():
+    conexao = op.get_bind()
+    cadastros = sa.table('cadastros', sa.column('cpf'), sa.column('nome'), sa.column('cpf_digitos'), sa.column('nome_busca'))
+    atualizar = cadastros.update().where(cadastros.c.cpf == sa.bindparam('b_cpf')).values(
+        cpf_digitos=sa.bindparam('b_cpf_digitos'), nome_busca=sa.bindparam('b_nome_busca'))
+    ultimo = ''
+    while True:
+        lote = conexao.execute(
+            sa.select(cadastros.c.cpf, cadastros.c.nome)
+            .where(cadastros.c.cpf > ultimo, sa.or_(cadastros.c.cpf_digitos.is_(None), cadastros.c.nome_busca.is_(None)))
+            .order_by(cadastros.c.cpf).limit(LINHAS_POR_LOTE)
+        ).all()
+        if not lote:
+            break
+        conexao.execute(atualizar, [
+            {'b_cpf': cpf, 'b_cpf_digitos': _somente_digitos(cpf), 'b_nome_busca': _normalizar_busca(nome)}
+            for cpf, nome in lote
+        ])
+        ultimo = lote[-1].cpf
+
+
+def upgrade():
+    colunas = _colunas('cadastros')
+    novas = [
+        sa.Column('versao', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('foto_miniatura', sa.LargeBinary(), nullable=True),
+        sa.Column('documento_hash', sa.String(64), nullable=True),
+        sa.Column('foto_hash', sa.String(64), nullable=True),
+        sa.Column('cpf_digitos', sa.String(11), nullable=True),
+        sa.Column('nome_busca', sa.String(255), nullable=True),
+    ]
+    for coluna in novas:
+        if coluna.name not in colunas:
+            op.add_column('cadastros', coluna)
+
+    # Os hashes dos blobs não são preenchidos aqui: a 0005_blobs_fora_do_banco os grava ao
+    # mover cada foto e documento para o armazenamento de blobs.
+    _preencher_colunas_busca()
+
+    indices = _indices('cadastros')
+    if 'ix_cadastros_nome_cpf' not in indices:
+        op.create_index('ix_cadastros_nome_cpf', 'cadastros', ['nome', 'cpf'])
+    if 'ix_cadastros_cpf_digitos' not in indices:
+        op.create_index('ix_cadastros_cpf_digitos', 'cadastros', ['cpf_digitos'], postgresql_ops={'cpf_digitos': 'varchar_pattern_ops'})
+    if 'ix_cadastros_matricula' not in indices:
+        op.create_index('ix_cadastros_matricula', 'cadastros', ['matricula'], postgresql_ops={'matricula': 'varchar_pattern_ops'})
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX IF NOT EXISTS ix_cadastros_cpf_digitos_trgm ON cadastros USING gin (cpf_digitos gin_trgm_ops)')
+        op.execute('CREATE INDEX IF NOT EXISTS ix_cadastros_nome_busca_trgm ON cadastros USING gin (nome_busca gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_cadastros_nome_busca_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_cadastros_cpf_digitos_trgm')
+    op.drop_index('ix_cadastros_matricula', table_name='cadastros')
+    op.drop_index('ix_cadastros_cpf_digitos', table_name='cadastros')
+    op.drop_index('ix_cadastros_nome_cpf', table_name='cadastros')
+    with op.batch_alter_table('cadastros') as batch:
+        for coluna in ('nome_busca', 'cpf_digitos', 'foto_hash', 'documento_hash', 'foto_miniatura', 'versao'):
+            batch.drop_column(coluna)
@@ -0,0 +1,67 @@
+"""Índices compostos e parciais para visitas, estatísticas, WhatsApp e auditoria
+
+No Postgres os índices são criados com CREATE INDEX CONCURRENTLY, sem bloquear escritas
+na tabela durante o deploy.
+
+Revision ID: 0003_indices_filtros
+Revises: 0002_colunas_busca_e_versao
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_indices_filtros'
+down_revision = '0002_colunas_busca_e_versao'
+branch_labels = None
+depends_on = None
+
+# (nome, tabela, colunas, condição do índice parcial). A condição precisa ser escrita como o
+# SQLAlchemy gera o filtro em cada banco, senão o SQLite não reconhece o índice parcial.
+INDICES = [
+    ('ix_cadastros_status_visita_nome', 'cadastros', ['status_visita', 'nome'], 'status_visita IS NOT NULL'),
+    ('ix_cadastros_data_atendimento', 'cadastros', ['data_atendimento'], None),
+    ('ix_cadastros_whatsapp', 'cadastros', ['nome', 'telefone'], {'postgresql': 'is_whatsapp IS true', 'sqlite': 'is_whatsapp IS 1'}),
+    ('ix_auditoria_cpf_data', 'auditoria_alteracoes', ['cadastro_cpf', 'data_alteracao'], None),
+    ('ix_auditoria_data_alteracao', 'auditoria_alteracoes', ['data_alteracao'], None),
+]
+
+# Índice simples criado por versões anteriores do modelo (index=True); o composto
+# ix_auditoria_cpf_data o substitui.
+INDICE_SUBSTITUIDO = ('ix_auditoria_alteracoes_cadastro_cpf', 'auditoria_alteracoes')
+
+
+def _indices(tabela):
+    return {i['name'] for i in sa.inspect(op.get_bind()).get_indexes(tabela)}
+
+
+def _condicao(condicao, dialeto):
+    if isinstance(condicao, dict):
+        condicao = condicao.get(dialeto)
+    return sa.text(condicao) if condicao else None
+
+
+def upgrade():
+    dialeto = op.get_bind().dialect.name
+    postgres = dialeto == 'postgresql'
+    existentes = {tabela: _indices(tabela) for tabela in ('cadastros', 'auditoria_alteracoes')}
+    with op.get_context().autocommit_block():
+        for nome, tabela, colunas, condicao in INDICES:
+            if nome in existentes[tabela]:
+                continue
+            where = _condicao(condicao, dialeto)
+            op.create_index(nome, tabela, colunas, postgresql_where=where, sqlite_where=where, postgresql_concurrently=postgres)
+        nome, tabela = INDICE_SUBSTITUIDO
+        if nome in existentes[tabela]:
+            op.drop_index(nome, table_name=tabela, postgresql_concurrently=postgres)
+
+
+def downgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        nome, tabela = INDICE_SUBSTITUIDO
+        op.create_index(nome, tabela, ['cadastro_cpf'], postgresql_concurrently=postgres)
+        for nome, tabela, _, _ in reversed(INDICES):
+            op.drop_index(nome, table_name=tabela, postgresql_concurrently=postgres)
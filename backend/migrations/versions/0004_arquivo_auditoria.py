@@ -0,0 +1,67 @@
+"""Tabela de arquivo do log de auditoria e índices da paginação por (data_alteracao, id)
+
+Revision ID: 0004_arquivo_auditoria
+Revises: 0003_indices_filtros
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_arquivo_auditoria'
+down_revision = '0003_indices_filtros'
+branch_labels = None
+depends_on = None
+
+INDICES = [
+    ('ix_auditoria_data_id', 'auditoria_alteracoes', ['data_alteracao', 'id']),
+    ('ix_auditoria_atendente_data', 'auditoria_alteracoes', ['atendente', 'data_alteracao']),
+]
+
+# Substituído por ix_auditoria_data_id, que também atende a ordenação por id.
+INDICE_SUBSTITUIDO = ('ix_auditoria_data_alteracao', 'auditoria_alteracoes')
+
+
+def _indices(tabela):
+    return {i['name'] for i in sa.inspect(op.get_bind()).get_indexes(tabela)}
+
+
+def upgrade():
+    if 'auditoria_alteracoes_arquivo' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'auditoria_alteracoes_arquivo',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column('cadastro_cpf', sa.String(14), nullable=False),
+            sa.Column('atendente', sa.String(100), nullable=False),
+            sa.Column('data_alteracao', sa.DateTime(), nullable=True),
+            sa.Column('campo_alterado', sa.String(100), nullable=False),
+            sa.Column('valor_antigo', sa.Text(), nullable=True),
+            sa.Column('valor_novo', sa.Text(), nullable=True),
+        )
+    arquivo = _indices('auditoria_alteracoes_arquivo')
+    if 'ix_auditoria_arquivo_cpf_data' not in arquivo:
+        op.create_index('ix_auditoria_arquivo_cpf_data', 'auditoria_alteracoes_arquivo', ['cadastro_cpf', 'data_alteracao'])
+    if 'ix_auditoria_arquivo_data_id' not in arquivo:
+        op.create_index('ix_auditoria_arquivo_data_id', 'auditoria_alteracoes_arquivo', ['data_alteracao', 'id'])
+
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    existentes = _indices('auditoria_alteracoes')
+    with op.get_context().autocommit_block():
+        for nome, tabela, colunas in INDICES:
+            if nome not in existentes:
+                op.create_index(nome, tabela, colunas, postgresql_concurrently=postgres)
+        nome, tabela = INDICE_SUBSTITUIDO
+        if nome in existentes:
+            op.drop_index(nome, table_name=tabela, postgresql_concurrently=postgres)
+
+
+def downgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        nome, tabela = INDICE_SUBSTITUIDO
+        op.create_index(nome, tabela, ['data_alteracao'], postgresql_concurrently=postgres)
+        for nome, tabela, _ in reversed(INDICES):
+            op.drop_index(nome, table_name=tabela, postgresql_concurrently=postgres)
+    op.drop_table('auditoria_alteracoes_arquivo')
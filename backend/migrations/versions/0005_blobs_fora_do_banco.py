@@ -0,0 +1,87 @@
+"""Fotos e documentos saem da tabela cadastros para o armazenamento de blobs
+
+Cada blob é gravado no armazenamento configurado (BLOB_STORAGE, ver blobs.py) sob o seu
+SHA-256, que fica na coluna de hash correspondente; depois as colunas binárias são
+removidas. Rodar de novo após uma falha é seguro: o armazenamento não duplica conteúdo.
+
+No Postgres o espaço das colunas removidas só volta ao sistema depois de um VACUUM FULL
+(ou pg_repack) da tabela cadastros.
+
+Revision ID: 0005_blobs_fora_do_banco
+Revises: 0004_arquivo_auditoria
+Create Date: 2026-10-18 13:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_blobs_fora_do_banco'
+down_revision = '0004_arquivo_auditoria'
+branch_labels = None
+depends_on = None
+
+# Poucas linhas por vez: cada uma pode trazer até MAX_CONTENT_LENGTH de documento.
+LINHAS_POR_LOTE = 50
+
+# (coluna binária, coluna com o hash do conteúdo)
+BLOBS = [
+    ('documento_pdf', 'documento_hash'),
+    ('foto_segurado', 'foto_hash'),
+    ('foto_miniatura', 'foto_miniatura_hash'),
+]
+
+
+def _colunas(tabela):
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns(tabela)}
+
+
+def _copiar(origem, destino, filtro, converter):
+    """Percorre os cadastros em lotes e grava converter(valor de origem) na coluna destino."""
+    conexao = op.get_bind()
+    cadastros = sa.table('cadastros', sa.column('cpf'), *[sa.column(c) for c in origem + destino])
+    atualizar = cadastros.update().where(cadastros.c.cpf == sa.bindparam('b_cpf')).values(
+        {c: sa.bindparam(f'b_{c}') for c in destino})
+    ultimo = ''
+    while True:
+        lote = conexao.execute(
+            sa.select(cadastros.c.cpf, *[cadastros.c[c] for c in origem])
+            .where(cadastros.c.cpf > ultimo, sa.or_(*[cadastros.c[c].isnot(None) for c in filtro]))
+            .order_by(cadastros.c.cpf).limit(LINHAS_POR_LOTE)
+        ).all()
+        if not lote:
+            break
+        conexao.execute(atualizar, [
+            {'b_cpf': linha.cpf, **{f'b_{d}': converter(linha[o]) if linha[o] else None for o, d in zip(origem, destino)}}
+            for linha in lote
+        ])
+        ultimo = lote[-1].cpf
+
+
+def upgrade():
+    colunas = _colunas('cadastros')
+    if 'foto_miniatura_hash' not in colunas:
+        op.add_column('cadastros', sa.Column('foto_miniatura_hash', sa.String(64), nullable=True))
+
+    binarias = [(blob, coluna_hash) for blob, coluna_hash in BLOBS if blob in colunas]
+    if not binarias:
+        return
+    armazenamento = current_app.extensions['blobs']
+    origem = [blob for blob, _ in binarias]
+    _copiar(origem, [coluna_hash for _, coluna_hash in binarias], origem, armazenamento.guardar)
+    with op.batch_alter_table('cadastros') as batch:
+        for blob in origem:
+            batch.drop_column(blob)
+
+
+def downgrade():
+    with op.batch_alter_table('cadastros') as batch:
+        for blob, _ in BLOBS:
+            batch.add_column(sa.Column(blob, sa.LargeBinary(), nullable=True))
+    armazenamento = current_app.extensions['blobs']
+    hashes = [coluna_hash for _, coluna_hash in BLOBS]
+    _copiar(hashes, [blob for blob, _ in BLOBS], hashes, armazenamento.ler)
+    with op.batch_alter_table('cadastros') as batch:
+        batch.drop_column('foto_miniatura_hash')
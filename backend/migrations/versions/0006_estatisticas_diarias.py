@@ -0,0 +1,129 @@
+"""Tabela de estatísticas diárias (rollup de cadastros) mantida por triggers
+
+Cada linha conta os cadastros de um dia de atendimento com a mesma combinação de qualidade,
+atendente, WhatsApp, email e status da visita. Triggers em cadastros mantêm as contagens a
+cada INSERT, UPDATE e DELETE, inclusive os feitos fora do ORM (importação em lote, UPDATEs
+em massa). A tabela é preenchida aqui a partir dos cadastros existentes; `flask
+recalcular-estatisticas` refaz esse preenchimento se algum dia as contagens divergirem.
+
+Revision ID: 0006_estatisticas_diarias
+Revises: 0005_blobs_fora_do_banco
+Create Date: 2026-10-18 13:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_estatisticas_diarias'
+down_revision = '0005_blobs_fora_do_banco'
+branch_labels = None
+depends_on = None
+
+DIMENSOES = 'dia, qualidade, atendente, com_whatsapp, com_email, status_visita'
+CAMPOS_MONITORADOS = 'data_atendimento, qualidade, atendente_criacao, is_whatsapp, email, status_visita'
+
+
+def _valores(registro):
+    return (f"{registro}.data_atendimento, {registro}.qualidade, {registro}.atendente_criacao, {registro}.is_whatsapp, "
+            f"COALESCE({registro}.email, '') <> '', COALESCE({registro}.status_visita, '')")
+
+
+def _incrementar(registro):
+    return (f"INSERT INTO estatisticas_diarias ({DIMENSOES}, total) VALUES ({_valores(registro)}, 1) "
+            f"ON CONFLICT ({DIMENSOES}) DO UPDATE SET total = estatisticas_diarias.total + 1;")
+
+
+def _decrementar(registro):
+    return (f"UPDATE estatisticas_diarias SET total = total - 1 "
+            f"WHERE ({DIMENSOES}) = ({_valores(registro)});")
+
+
+# Só interessa quando alguma dimensão muda; edições de outros campos não tocam no rollup.
+DIMENSAO_MUDOU = ' OR '.join(
+    f"OLD.{campo} IS DISTINCT FROM NEW.{campo}" for campo in ('data_atendimento', 'qualidade', 'atendente_criacao', 'is_whatsapp', 'status_visita')
+) + " OR (COALESCE(OLD.email, '') <> '') IS DISTINCT FROM (COALESCE(NEW.email, '') <> '')"
+
+POSTGRES = [
+    f"""
+    CREATE OR REPLACE FUNCTION atualizar_estatisticas_diarias() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {_decrementar('OLD')}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_incrementar('NEW')}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "CREATE TRIGGER tg_estatisticas_insercao AFTER INSERT OR DELETE ON cadastros "
+    "FOR EACH ROW EXECUTE PROCEDURE atualizar_estatisticas_diarias()",
+    f"CREATE TRIGGER tg_estatisticas_edicao AFTER UPDATE OF {CAMPOS_MONITORADOS} ON cadastros "
+    f"FOR EACH ROW WHEN ({DIMENSAO_MUDOU}) EXECUTE PROCEDURE atualizar_estatisticas_diarias()",
+]
+
+# No SQLite `IS NOT` é a comparação que trata NULL como valor.
+SQLITE = [
+    f"CREATE TRIGGER tg_estatisticas_insercao AFTER INSERT ON cadastros BEGIN {_incrementar('NEW')} END",
+    f"CREATE TRIGGER tg_estatisticas_remocao AFTER DELETE ON cadastros BEGIN {_decrementar('OLD')} END",
+    f"CREATE TRIGGER tg_estatisticas_edicao AFTER UPDATE OF {CAMPOS_MONITORADOS} ON cadastros "
+    f"WHEN {DIMENSAO_MUDOU.replace('IS DISTINCT FROM', 'IS NOT')} BEGIN {_decrementar('OLD')} {_incrementar('NEW')} END",
+]
+
+
+TRIGGERS_POSTGRES = ['tg_estatisticas_insercao', 'tg_estatisticas_edicao']
+TRIGGERS_SQLITE = ['tg_estatisticas_insercao', 'tg_estatisticas_remocao', 'tg_estatisticas_edicao']
+
+
+def _remover_triggers():
+    if op.get_bind().dialect.name == 'postgresql':
+        for trigger in TRIGGERS_POSTGRES:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger} ON cadastros')
+    else:
+        for trigger in TRIGGERS_SQLITE:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def _preencher():
+    op.execute('DELETE FROM estatisticas_diarias')
+    op.execute(f"""
+        INSERT INTO estatisticas_diarias ({DIMENSOES}, total)
+        SELECT data_atendimento, qualidade, atendente_criacao, is_whatsapp, COALESCE(email, '') <> '', COALESCE(status_visita, ''), COUNT(*)
+        FROM cadastros
+        GROUP BY data_atendimento, qualidade, atendente_criacao, is_whatsapp, COALESCE(email, '') <> '', COALESCE(status_visita, '')
+    """)
+
+
+def upgrade():
+    if 'estatisticas_diarias' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'estatisticas_diarias',
+            sa.Column('dia', sa.Date(), nullable=False),
+            sa.Column('qualidade', sa.String(100), nullable=False),
+            sa.Column('atendente', sa.String(100), nullable=False),
+            sa.Column('com_whatsapp', sa.Boolean(), nullable=False),
+            sa.Column('com_email', sa.Boolean(), nullable=False),
+            sa.Column('status_visita', sa.String(50), nullable=False),
+            sa.Column('total', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('dia', 'qualidade', 'atendente', 'com_whatsapp', 'com_email', 'status_visita', name='pk_estatisticas_diarias'),
+        )
+    if op.get_bind().dialect.name == 'postgresql':
+        # Sem escritas em cadastros entre o preenchimento e a criação dos triggers.
+        op.execute('LOCK TABLE cadastros IN SHARE MODE')
+        comandos = POSTGRES
+    else:
+        comandos = SQLITE
+    _remover_triggers()
+    _preencher()
+    for comando in comandos:
+        op.execute(comando)
+
+
+def downgrade():
+    _remover_triggers()
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP FUNCTION IF EXISTS atualizar_estatisticas_diarias()')
+    op.drop_table('estatisticas_diarias')
@@ -0,0 +1,140 @@
+"""Log de alterações dos cadastros para a sincronização incremental (since=)
+
+alteracoes_cadastros guarda, para cada CPF que já existiu, o número da sua última alteração
+(seq) e quando ela aconteceu. Triggers em cadastros renovam esse número a cada INSERT,
+UPDATE e DELETE, inclusive os feitos fora do ORM. Um cadastro apagado continua no log e
+volta aos clientes como removido.
+
+Os números são dados na ordem de commit. No Postgres, o trigger é uma constraint trigger
+adiada (DEFERRABLE INITIALLY DEFERRED): roda no COMMIT, depois de todas as escritas da
+transação, pega um advisory lock de transação e só então faz o nextval. O lock fica preso
+só durante o commit, quando a transação já tem todos os locks de linha de que precisa e não
+espera por mais nenhum (só os triggers escrevem no log), então não há ciclo de espera entre
+uma UPDATE de várias linhas e uma edição avulsa. No SQLite as escritas já são serializadas,
+e o próximo número é MAX(seq) + 1, lido no índice único de seq. Linhas do log nunca são
+apagadas, então esse máximo nunca diminui. Assim, quem leu até o número N nunca perde uma
+alteração com número menor que ainda não tinha sido confirmada.
+
+data_alteracao é o relógio no momento do registro (clock_timestamp, não o início da
+transação), e acompanha a ordem de seq.
+
+Os cadastros existentes entram no log em ordem de última modificação.
+
+Revision ID: 0007_log_alteracoes_cadastros
+Revises: 0006_estatisticas_diarias
+Create Date: 2026-10-18 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_log_alteracoes_cadastros'
+down_revision = '0006_estatisticas_diarias'
+branch_labels = None
+depends_on = None
+
+# Chave do advisory lock que ordena as alterações no Postgres (qualquer número fixo serve).
+CHAVE_LOCK = 7007
+
+
+def _registrar(registro, proximo, agora):
+    return (f"INSERT INTO alteracoes_cadastros (cpf, seq, data_alteracao) VALUES ({registro}.cpf, {proximo}, {agora}) "
+            f"ON CONFLICT (cpf) DO UPDATE SET seq = excluded.seq, data_alteracao = excluded.data_alteracao;")
+
+
+PROXIMO_POSTGRES = "nextval('seq_alteracoes_cadastros')"
+AGORA_POSTGRES = "timezone('utc', clock_timestamp())"
+
+POSTGRES = [
+    f"""
+    CREATE OR REPLACE FUNCTION registrar_alteracao_cadastro() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock({CHAVE_LOCK});
+        IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.cpf <> NEW.cpf) THEN
+            {_registrar('OLD', PROXIMO_POSTGRES, AGORA_POSTGRES)}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_registrar('NEW', PROXIMO_POSTGRES, AGORA_POSTGRES)}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    # Não usar SET CONSTRAINTS ... IMMEDIATE nas transações que alteram cadastros: o trigger
+    # voltaria a rodar a cada linha, com o lock preso entre uma escrita e outra.
+    "CREATE CONSTRAINT TRIGGER tg_alteracoes_cadastros AFTER INSERT OR UPDATE OR DELETE ON cadastros "
+    "DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE PROCEDURE registrar_alteracao_cadastro()",
+]
+
+PROXIMO_SQLITE = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM alteracoes_cadastros)"
+
+SQLITE = [
+    f"CREATE TRIGGER tg_alteracoes_insercao AFTER INSERT ON cadastros BEGIN "
+    f"{_registrar('NEW', PROXIMO_SQLITE, 'CURRENT_TIMESTAMP')} END",
+    f"CREATE TRIGGER tg_alteracoes_edicao AFTER UPDATE ON cadastros BEGIN "
+    f"{_registrar('NEW', PROXIMO_SQLITE, 'CURRENT_TIMESTAMP')} END",
+    f"CREATE TRIGGER tg_alteracoes_troca_cpf AFTER UPDATE OF cpf ON cadastros WHEN OLD.cpf IS NOT NEW.cpf BEGIN "
+    f"{_registrar('OLD', PROXIMO_SQLITE, 'CURRENT_TIMESTAMP')} END",
+    f"CREATE TRIGGER tg_alteracoes_remocao AFTER DELETE ON cadastros BEGIN "
+    f"{_registrar('OLD', PROXIMO_SQLITE, 'CURRENT_TIMESTAMP')} END",
+]
+
+TRIGGERS_SQLITE = ['tg_alteracoes_insercao', 'tg_alteracoes_edicao', 'tg_alteracoes_troca_cpf', 'tg_alteracoes_remocao']
+
+
+def _remover_triggers():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS tg_alteracoes_cadastros ON cadastros')
+    else:
+        for trigger in TRIGGERS_SQLITE:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def _preencher():
+    op.execute('DELETE FROM alteracoes_cadastros')
+    op.execute("""
+        INSERT INTO alteracoes_cadastros (cpf, seq, data_alteracao)
+        SELECT cpf,
+               ROW_NUMBER() OVER (ORDER BY COALESCE(data_modificacao, data_criacao), cpf),
+               COALESCE(data_modificacao, data_criacao, CURRENT_TIMESTAMP)
+        FROM cadastros
+    """)
+
+
+def upgrade():
+    conexao = op.get_bind()
+    tabelas = sa.inspect(conexao).get_table_names()
+    if 'alteracoes_cadastros' not in tabelas:
+        op.create_table(
+            'alteracoes_cadastros',
+            sa.Column('cpf', sa.String(14), primary_key=True),
+            sa.Column('seq', sa.BigInteger(), nullable=False),
+            sa.Column('data_alteracao', sa.DateTime(), nullable=False),
+        )
+        op.create_index('ix_alteracoes_cadastros_seq', 'alteracoes_cadastros', ['seq'], unique=True)
+
+    if conexao.dialect.name == 'postgresql':
+        # Sem escritas em cadastros entre o preenchimento e a criação do trigger.
+        op.execute('LOCK TABLE cadastros IN SHARE MODE')
+        op.execute('CREATE SEQUENCE IF NOT EXISTS seq_alteracoes_cadastros')
+        _remover_triggers()
+        _preencher()
+        op.execute("SELECT setval('seq_alteracoes_cadastros', COALESCE((SELECT MAX(seq) FROM alteracoes_cadastros), 0) + 1, false)")
+        comandos = POSTGRES
+    else:
+        _remover_triggers()
+        _preencher()
+        comandos = SQLITE
+    for comando in comandos:
+        op.execute(comando)
+
+
+def downgrade():
+    _remover_triggers()
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP FUNCTION IF EXISTS registrar_alteracao_cadastro()')
+        op.execute('DROP SEQUENCE IF EXISTS seq_alteracoes_cadastros')
+    op.drop_index('ix_alteracoes_cadastros_seq', table_name='alteracoes_cadastros')
+    op.drop_table('alteracoes_cadastros')
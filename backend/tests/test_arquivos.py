@@ -0,0 +1,74 @@
+"""Foto e documento do cadastro: GET condicional (304) e Range (206)."""
+import io
+
+import pytest
+from PIL import Image
+
+CPF = '111.111.111-11'
+DOCUMENTO = b'%PDF-1.4\n' + bytes(range(256)) * 8
+
+
+def _jpeg():
+    saida = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 30, 30)).save(saida, 'JPEG')
+    return saida.getvalue()
+
+
+@pytest.fixture
+def cadastro_com_arquivos(criar_cadastro):
+    criar_cadastro(CPF, foto_segurado=(io.BytesIO(_jpeg()), 'foto.jpg'),
+                   documento=(io.BytesIO(DOCUMENTO), 'rg-frente.pdf'))
+
+
+@pytest.mark.parametrize('url', [f'/api/foto/{CPF}', f'/api/foto/{CPF}?size=thumb', f'/api/documento/{CPF}'])
+def test_get_condicional_devolve_304_com_etag_e_last_modified(cliente, cadastro_com_arquivos, url):
+    primeira = cliente.get(url)
+    assert primeira.status_code == 200
+    etag, ultima_modificacao = primeira.headers['ETag'], primeira.headers['Last-Modified']
+    assert 'no-cache' in primeira.headers['Cache-Control'] and 'private' in primeira.headers['Cache-Control']
+
+    for condicao in ({'If-None-Match': etag}, {'If-Modified-Since': ultima_modificacao}):
+        revalidada = cliente.get(url, headers=condicao)
+        assert revalidada.status_code == 304
+        assert revalidada.data == b''
+        assert revalidada.headers['ETag'] == etag
+        assert revalidada.headers['Last-Modified'] == ultima_modificacao
+
+    assert cliente.get(url, headers={'If-None-Match': '"outro"'}).status_code == 200
+
+
+def test_miniatura_e_foto_completa_tem_etags_distintas(cliente, cadastro_com_arquivos):
+    completa = cliente.get(f'/api/foto/{CPF}')
+    miniatura = cliente.get(f'/api/foto/{CPF}?size=thumb')
+    assert completa.headers['ETag'] != miniatura.headers['ETag']
+    assert cliente.get(f'/api/foto/{CPF}?size=thumb', headers={'If-None-Match': completa.headers['ETag']}).status_code == 200
+
+
+def test_range_devolve_206_com_o_trecho_pedido(cliente, cadastro_com_arquivos):
+    inteiro = cliente.get(f'/api/documento/{CPF}')
+    assert inteiro.data == DOCUMENTO
+
+    parcial = cliente.get(f'/api/documento/{CPF}', headers={'Range': 'bytes=100-199'})
+    assert parcial.status_code == 206
+    assert parcial.headers['Accept-Ranges'] == 'bytes'
+    assert parcial.data == DOCUMENTO[100:200]
+    assert parcial.headers['Content-Range'] == f'bytes 100-199/{len(DOCUMENTO)}'
+
+    foto = cliente.get(f'/api/foto/{CPF}').data
+    final = cliente.get(f'/api/foto/{CPF}', headers={'Range': 'bytes=-10'})
+    assert final.status_code == 206
+    assert final.data == foto[-10:]
+
+    fora = cliente.get(f'/api/documento/{CPF}', headers={'Range': f'bytes={len(DOCUMENTO) + 10}-'})
+    assert fora.status_code == 416
+
+
+def test_documento_usa_o_nome_guardado(cliente, cadastro_com_arquivos):
+    assert 'rg-frente.pdf' in cliente.get(f'/api/documento/{CPF}').headers['Content-Disposition']
+
+
+def test_arquivo_ausente_devolve_404(cliente, criar_cadastro):
+    criar_cadastro('222.222.222-22')
+    assert cliente.get('/api/foto/222.222.222-22').status_code == 404
+    assert cliente.get('/api/documento/222.222.222-22').status_code == 404
+    assert cliente.get('/api/documento/999.999.999-99').status_code == 404
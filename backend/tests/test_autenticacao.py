@@ -0,0 +1,143 @@
+"""Autenticação: senhas com hash, tokens de sessão, cache de credenciais e administrador."""
+import base64
+
+import pytest
+
+import app as provavida
+
+
+def _basic(usuario, senha):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{usuario}:{senha}'.encode()).decode()}
+
+
+def _bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def criar_usuario(app):
+    """Cria utilizadores direto no banco (senha em texto puro com hash=False) e os apaga no fim."""
+    criados = []
+
+    def criar(username, senha, hash=True):
+        with app.app_context():
+            user = provavida.User(username=username, password=provavida.gerar_hash_senha(senha) if hash else senha, permissions={})
+            provavida.db.session.add(user)
+            provavida.db.session.commit()
+            criados.append(user.id)
+            return user.id
+    yield criar
+    with app.app_context():
+        provavida.User.query.filter(provavida.User.id.in_(criados)).delete(synchronize_session=False)
+        provavida.db.session.commit()
+        provavida.db.session.remove()
+    for user_id in criados:
+        provavida.invalidar_cache_usuario(user_id)
+
+
+@pytest.fixture
+def admin(app):
+    with app.app_context():
+        provavida.garantir_admin()
+        provavida.db.session.remove()
+    return _basic(provavida.ADMIN_USERNAME, provavida.ADMIN_PASSWORD)
+
+
+def _senha_no_banco(app, user_id):
+    with app.app_context():
+        senha = provavida.db.session.get(provavida.User, user_id).password
+        provavida.db.session.remove()
+        return senha
+
+
+def _login(cliente, usuario, senha):
+    return cliente.post('/api/login', json={'username': usuario, 'password': senha})
+
+
+def test_login_emite_token_aceito_nas_rotas(cliente, criar_usuario):
+    criar_usuario('rita', 'senha-1')
+
+    resposta = _login(cliente, 'rita', 'senha-1')
+    assert resposta.status_code == 200
+    token = resposta.get_json()['token']
+
+    assert cliente.get('/api/cadastros', headers=_bearer(token)).status_code == 200
+    assert cliente.get('/api/cadastros', headers=_bearer(token + 'x')).status_code == 401
+    assert _login(cliente, 'rita', 'errada').status_code == 401
+
+
+def test_token_expirado_e_recusado(cliente, criar_usuario, monkeypatch, app):
+    criar_usuario('paulo', 'senha-1')
+    token = _login(cliente, 'paulo', 'senha-1').get_json()['token']
+    monkeypatch.setitem(app.config, 'AUTH_TOKEN_MAX_AGE', -1)
+
+    assert cliente.get('/api/cadastros', headers=_bearer(token)).status_code == 401
+
+
+def test_troca_de_senha_revoga_credencial_em_cache_e_tokens_antigos(cliente, criar_usuario):
+    criar_usuario('lucia', 'senha-antiga')
+    antigo = _login(cliente, 'lucia', 'senha-antiga').get_json()['token']
+    # Põe a credencial Basic no cache antes da troca.
+    assert cliente.get('/api/cadastros', headers=_basic('lucia', 'senha-antiga')).status_code == 200
+
+    resposta = cliente.post('/api/change-password', headers=_basic('lucia', 'senha-antiga'),
+                            json={'current_password': 'senha-antiga', 'new_password': 'senha-nova'})
+    assert resposta.status_code == 200
+    novo = resposta.get_json()['token']
+
+    assert cliente.get('/api/cadastros', headers=_basic('lucia', 'senha-antiga')).status_code == 401
+    assert cliente.get('/api/cadastros', headers=_bearer(antigo)).status_code == 401
+    assert cliente.get('/api/cadastros', headers=_basic('lucia', 'senha-nova')).status_code == 200
+    assert cliente.get('/api/cadastros', headers=_bearer(novo)).status_code == 200
+
+
+def test_apagar_utilizador_revoga_credencial_em_cache_e_token(cliente, criar_usuario, admin):
+    user_id = criar_usuario('marcos', 'senha-1')
+    token = _login(cliente, 'marcos', 'senha-1').get_json()['token']
+    assert cliente.get('/api/cadastros', headers=_basic('marcos', 'senha-1')).status_code == 200
+    assert cliente.get('/api/cadastros', headers=_bearer(token)).status_code == 200
+
+    assert cliente.delete(f'/api/users/{user_id}', headers=admin).status_code == 200
+
+    assert cliente.get('/api/cadastros', headers=_basic('marcos', 'senha-1')).status_code == 401
+    assert cliente.get('/api/cadastros', headers=_bearer(token)).status_code == 401
+
+
+def test_senha_legada_em_texto_puro_vira_hash_no_primeiro_acesso(app, cliente, criar_usuario):
+    user_id = criar_usuario('legado', 'senha-velha', hash=False)
+    assert _senha_no_banco(app, user_id) == 'senha-velha'
+
+    assert cliente.get('/api/cadastros', headers=_basic('legado', 'errada')).status_code == 401
+    assert _senha_no_banco(app, user_id) == 'senha-velha'
+
+    assert cliente.get('/api/cadastros', headers=_basic('legado', 'senha-velha')).status_code == 200
+    senha = _senha_no_banco(app, user_id)
+    assert senha.startswith('pbkdf2:') and provavida.check_password_hash(senha, 'senha-velha')
+    assert _login(cliente, 'legado', 'senha-velha').status_code == 200
+
+
+def test_admin_autenticado_pelo_hash_do_banco(app, cliente, admin):
+    assert cliente.get('/api/users', headers=admin).status_code == 200
+    token = _login(cliente, provavida.ADMIN_USERNAME, provavida.ADMIN_PASSWORD).get_json()['token']
+    assert cliente.get('/api/users', headers=_bearer(token)).status_code == 200
+    assert cliente.get('/api/users', headers=_basic(provavida.ADMIN_USERNAME, 'errada')).status_code == 403
+
+    # Com outra senha no banco, a constante deixa de valer.
+    with app.app_context():
+        user = provavida.User.query.filter_by(username=provavida.ADMIN_USERNAME).one()
+        user.password = provavida.gerar_hash_senha('nova-senha-do-admin')
+        provavida.db.session.commit()
+        provavida.invalidar_cache_usuario(user.id)
+        provavida.db.session.remove()
+    try:
+        assert cliente.get('/api/users', headers=admin).status_code == 403
+        assert cliente.get('/api/users', headers=_basic(provavida.ADMIN_USERNAME, 'nova-senha-do-admin')).status_code == 200
+    finally:
+        with app.app_context():
+            provavida.User.query.filter_by(username=provavida.ADMIN_USERNAME).delete()
+            provavida.db.session.commit()
+            provavida.db.session.remove()
+
+
+def test_utilizador_comum_nao_acessa_rotas_de_admin(cliente, auth):
+    assert cliente.get('/api/users', headers=auth).status_code == 403
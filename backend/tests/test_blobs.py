@@ -0,0 +1,143 @@
+"""Armazenamento de blobs (blobs.py): backend local e S3 (contra o moto, sem rede)."""
+import os
+
+import pytest
+
+from blobs import ArmazenamentoLocal, ArmazenamentoS3, criar_armazenamento, hash_conteudo
+
+FOTO = b'\xff\xd8\xff\xe0 foto de teste'
+HASH_FOTO = hash_conteudo(FOTO)
+HASH_AUSENTE = '0' * 64
+HASHES_INVALIDOS = ['', None, 'abc', HASH_FOTO.upper(), '../' + HASH_FOTO[3:], HASH_FOTO + '\n', 'g' * 64]
+
+
+@pytest.fixture
+def local(tmp_path):
+    return ArmazenamentoLocal(str(tmp_path))
+
+
+def test_hash_e_o_sha256_do_conteudo():
+    assert hash_conteudo(b'') == 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+
+
+def test_local_deduplica_pelo_conteudo(local, tmp_path, monkeypatch):
+    assert local.guardar(FOTO) == HASH_FOTO
+    caminho = tmp_path / HASH_FOTO[:2] / HASH_FOTO[2:4] / HASH_FOTO
+    assert caminho.read_bytes() == FOTO
+    gravado_em = os.path.getmtime(caminho)
+
+    # O mesmo conteúdo de novo não regrava nada.
+    monkeypatch.setattr(local, '_gravar', lambda *args: pytest.fail('conteúdo repetido foi regravado'))
+    assert local.guardar(FOTO) == HASH_FOTO
+    assert os.path.getmtime(caminho) == gravado_em
+    assert [nome for nome, _ in local.listar()] == [HASH_FOTO]
+
+
+def test_local_le_lista_e_remove(local):
+    outro = local.guardar(b'documento')
+    local.guardar(FOTO)
+
+    assert local.ler(HASH_FOTO) == FOTO
+    assert sorted(nome for nome, _ in local.listar()) == sorted([HASH_FOTO, outro])
+
+    local.remover(HASH_FOTO)
+    local.remover(HASH_FOTO)  # remover o que não existe não é erro
+    assert not local.existe(HASH_FOTO)
+    with pytest.raises(FileNotFoundError):
+        local.ler(HASH_FOTO)
+    assert [nome for nome, _ in local.listar()] == [outro]
+
+
+def test_local_ignora_temporarios_e_arquivos_estranhos_na_listagem(local, tmp_path):
+    local.guardar(FOTO)
+    (tmp_path / 'leia-me.txt').write_text('x')
+    (tmp_path / HASH_FOTO[:2] / HASH_FOTO[2:4] / f'{HASH_FOTO}.123.456.tmp').write_bytes(b'pela metade')
+
+    assert [nome for nome, _ in local.listar()] == [HASH_FOTO]
+
+
+def test_caminho_local_aponta_para_o_arquivo(local):
+    local.guardar(FOTO)
+    with open(local.caminho_local(HASH_FOTO), 'rb') as f:
+        assert f.read() == FOTO
+    with pytest.raises(FileNotFoundError):
+        local.caminho_local(HASH_AUSENTE)
+
+
+@pytest.mark.parametrize('invalido', HASHES_INVALIDOS)
+def test_hash_fora_do_formato_e_recusado(local, invalido):
+    for operacao in (local.existe, local.ler, local.caminho_local, local.remover):
+        with pytest.raises(ValueError, match='hash de blob inválido'):
+            operacao(invalido)
+
+
+def test_criar_armazenamento_pela_configuracao(tmp_path):
+    base = {'BLOB_DIR': str(tmp_path), 'BLOB_S3_BUCKET': '', 'BLOB_S3_PREFIX': '', 'BLOB_S3_ENDPOINT_URL': '', 'BLOB_S3_REGION': ''}
+
+    assert isinstance(criar_armazenamento(dict(base, BLOB_STORAGE='local')), ArmazenamentoLocal)
+    with pytest.raises(RuntimeError, match='BLOB_S3_BUCKET'):
+        criar_armazenamento(dict(base, BLOB_STORAGE='s3'))
+    with pytest.raises(RuntimeError, match='desconhecido'):
+        criar_armazenamento(dict(base, BLOB_STORAGE='ftp'))
+
+    s3 = criar_armazenamento(dict(base, BLOB_STORAGE='s3', BLOB_S3_BUCKET='fotos', BLOB_S3_PREFIX='blobs/',
+                                  BLOB_S3_ENDPOINT_URL='http://minio:9000', BLOB_S3_REGION='sa-east-1'))
+    assert (s3.bucket, s3.prefixo) == ('fotos', 'blobs/')
+    assert s3.opcoes_cliente == {'endpoint_url': 'http://minio:9000', 'region_name': 'sa-east-1'}
+
+
+# --- S3 ---
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip('moto', reason='testes do backend S3 precisam do moto (requirements-dev.txt)')
+    for variavel, valor in (('AWS_ACCESS_KEY_ID', 'teste'), ('AWS_SECRET_ACCESS_KEY', 'teste'), ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(variavel, valor)
+    with moto.mock_aws():
+        armazenamento = ArmazenamentoS3('provavida-blobs', prefixo='blobs/', region_name='us-east-1')
+        armazenamento.cliente.create_bucket(Bucket='provavida-blobs')
+        yield armazenamento
+
+
+def test_s3_deduplica_pelo_conteudo(s3, monkeypatch):
+    assert s3.guardar(FOTO) == HASH_FOTO
+    objeto = s3.cliente.get_object(Bucket='provavida-blobs', Key=f'blobs/{HASH_FOTO}')
+    assert objeto['Body'].read() == FOTO
+
+    monkeypatch.setattr(s3, '_gravar', lambda *args: pytest.fail('conteúdo repetido foi regravado'))
+    assert s3.guardar(FOTO) == HASH_FOTO
+
+
+def test_s3_le_lista_e_remove(s3):
+    outro = s3.guardar(b'documento')
+    s3.guardar(FOTO)
+    # Objetos fora do formato (ou de outro prefixo) no mesmo bucket não são blobs.
+    s3.cliente.put_object(Bucket='provavida-blobs', Key='blobs/leia-me.txt', Body=b'x')
+    s3.cliente.put_object(Bucket='provavida-blobs', Key=HASH_AUSENTE, Body=b'x')
+
+    assert s3.existe(HASH_FOTO)
+    assert not s3.existe(HASH_AUSENTE)
+    assert s3.ler(HASH_FOTO) == FOTO
+    assert s3.caminho_local(HASH_FOTO) is None
+    listados = dict(s3.listar())
+    assert sorted(listados) == sorted([HASH_FOTO, outro])
+    assert all(isinstance(timestamp, float) for timestamp in listados.values())
+
+    s3.remover(HASH_FOTO)
+    with pytest.raises(FileNotFoundError):
+        s3.ler(HASH_FOTO)
+    assert [nome for nome, _ in s3.listar()] == [outro]
+
+
+@pytest.mark.parametrize('invalido', HASHES_INVALIDOS)
+def test_s3_recusa_hash_fora_do_formato(s3, invalido):
+    for operacao in (s3.existe, s3.ler, s3.remover):
+        with pytest.raises(ValueError, match='hash de blob inválido'):
+            operacao(invalido)
+
+
+def test_s3_recria_o_cliente_depois_de_um_fork(s3, monkeypatch):
+    cliente = s3.cliente
+    assert s3.cliente is cliente
+    monkeypatch.setattr(s3, '_pid', -1)
+    assert s3.cliente is not cliente
@@ -0,0 +1,46 @@
+"""Busca por CPF (`cpf=`) e busca livre (`q=`) em /api/cadastros."""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cadastros(criar_cadastro):
+    criar_cadastro('123.456.789-00', 'José da Silva', matricula='2024001')
+    criar_cadastro('987.654.321-99', 'Maria Conceição')
+    criar_cadastro('120.000.000-01', 'Silvana José')
+
+
+def _cpfs(cliente, auth, **args):
+    resposta = cliente.get('/api/cadastros', query_string={'fields': 'cpf', **args}, headers=auth)
+    assert resposta.status_code == 200, resposta.data
+    return sorted(c['cpf'] for c in resposta.get_json())
+
+
+@pytest.mark.parametrize('termo', ['123.456.789-00', '12345678900', '123.456', '456789', '6.78'])
+def test_cpf_com_e_sem_pontuacao(cliente, auth, termo):
+    assert _cpfs(cliente, auth, cpf=termo) == ['123.456.789-00']
+
+
+def test_cpf_curto_busca_so_por_prefixo(cliente, auth):
+    assert _cpfs(cliente, auth, cpf='12') == ['120.000.000-01', '123.456.789-00']
+    # Com 2 dígitos, '99' no fim de um CPF não conta.
+    assert _cpfs(cliente, auth, cpf='99') == []
+
+
+def test_cpf_sem_digitos_nao_filtra(cliente, auth):
+    assert len(_cpfs(cliente, auth, cpf='.-')) == 3
+
+
+def test_busca_livre_por_cpf_ou_matricula(cliente, auth):
+    assert _cpfs(cliente, auth, q='987.654') == ['987.654.321-99']
+    assert _cpfs(cliente, auth, q='2024') == ['123.456.789-00']
+
+
+def test_busca_por_nome_sem_acentos_e_em_qualquer_ordem(cliente, auth):
+    assert _cpfs(cliente, auth, q='silva jose') == ['120.000.000-01', '123.456.789-00']
+    assert _cpfs(cliente, auth, q='CONCEICAO') == ['987.654.321-99']
+    assert _cpfs(cliente, auth, q='jose  da   silva') == ['123.456.789-00']
+
+
+def test_caracteres_curinga_sao_literais(cliente, auth):
+    assert _cpfs(cliente, auth, q='%') == []
+    assert _cpfs(cliente, auth, q='jo_e') == []
@@ -0,0 +1,100 @@
+"""Serialização das listagens e compressão das respostas (_comprimir_resposta)."""
+import gzip
+import io
+import json
+
+import pytest
+
+import app as provavida
+
+
+@pytest.fixture
+def lista_grande(criar_cadastro):
+    # Bem acima de COMPRESS_MIN_BYTES (1 KiB) em JSON.
+    for i in range(10):
+        criar_cadastro(f'{i:03d}.000.000-00', f'Segurado Número {i}', obs='observação ' * 10)
+
+
+def _listar(cliente, auth, encoding=None, **args):
+    headers = dict(auth)
+    if encoding is not None:
+        headers['Accept-Encoding'] = encoding
+    return cliente.get('/api/cadastros', query_string=args, headers=headers)
+
+
+def test_serializador_devolve_so_os_campos_pedidos(cliente, auth, lista_grande):
+    # nome e cpf entram no SELECT para o cursor, mas só saem no JSON se pedidos.
+    dados = _listar(cliente, auth, fields='telefone', limit=3).get_json()
+    assert dados == [{'telefone': '(82) 99999-0000'}] * 3
+
+    serializador = provavida.Serializador(provavida.Cadastro, ('cpf',), extras=('nome', 'cpf'))
+    assert [c.key for c in serializador.colunas] == ['cpf', 'nome']
+    assert serializador([('111', 'Maria')]) == [{'cpf': '111'}]
+
+
+def test_gzip_quando_o_cliente_so_aceita_gzip(cliente, auth, lista_grande):
+    sem_compressao = _listar(cliente, auth, encoding='identity')
+    resposta = _listar(cliente, auth, encoding='gzip')
+
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+    assert int(resposta.headers['Content-Length']) == len(resposta.data) < len(sem_compressao.data)
+    assert json.loads(gzip.decompress(resposta.data)) == sem_compressao.get_json()
+
+
+def test_brotli_tem_preferencia_quando_aceito(cliente, auth, lista_grande):
+    brotli = pytest.importorskip('brotli')
+    sem_compressao = _listar(cliente, auth, encoding='identity')
+
+    resposta = _listar(cliente, auth, encoding='gzip, deflate, br')
+
+    assert resposta.headers['Content-Encoding'] == 'br'
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+    assert json.loads(brotli.decompress(resposta.data)) == sem_compressao.get_json()
+
+    # q=0 recusa o brotli explicitamente.
+    assert _listar(cliente, auth, encoding='br;q=0, gzip').headers['Content-Encoding'] == 'gzip'
+
+
+def test_sem_brotli_instalado_cai_para_gzip(cliente, auth, lista_grande, monkeypatch):
+    monkeypatch.setattr(provavida, 'brotli', None)
+    assert _listar(cliente, auth, encoding='br, gzip').headers['Content-Encoding'] == 'gzip'
+
+
+def test_sem_accept_encoding_vai_sem_compressao_mas_com_vary(cliente, auth, lista_grande):
+    resposta = _listar(cliente, auth, encoding='identity')
+
+    assert 'Content-Encoding' not in resposta.headers
+    # Caches intermediários precisam separar a versão comprimida da que não é.
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+    assert len(resposta.get_json()) == 10
+
+
+def test_resposta_pequena_nao_e_comprimida(cliente, auth, criar_cadastro):
+    criar_cadastro('111.111.111-11', 'Maria')
+    resposta = _listar(cliente, auth, encoding='gzip, br', fields='cpf')
+
+    assert len(resposta.data) < provavida.app.config['COMPRESS_MIN_BYTES']
+    assert 'Content-Encoding' not in resposta.headers
+    assert resposta.get_json() == [{'cpf': '111.111.111-11'}]
+
+
+def test_stream_ja_comprimido_nao_e_comprimido_de_novo(cliente, auth, lista_grande):
+    resposta = cliente.get('/api/export/whatsapp', headers=dict(auth, **{'Accept-Encoding': 'gzip, br'}))
+
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    linhas = gzip.decompress(resposta.data).decode('utf-8').splitlines()
+    assert linhas[0].lstrip('﻿').startswith('Nome')
+    assert len(linhas) == 11
+
+
+def test_arquivos_e_tipos_binarios_nao_sao_comprimidos(cliente, auth, criar_cadastro):
+    from PIL import Image
+    foto = io.BytesIO()
+    Image.new('RGB', (400, 400), (10, 10, 10)).save(foto, 'JPEG')
+    criar_cadastro('111.111.111-11', foto_segurado=(io.BytesIO(foto.getvalue()), 'foto.jpg'))
+
+    resposta = cliente.get('/api/foto/111.111.111-11', headers={'Accept-Encoding': 'gzip, br'})
+
+    assert resposta.status_code == 200
+    assert 'Content-Encoding' not in resposta.headers
@@ -0,0 +1,147 @@
+"""Premissas de thread-safety listadas no gunicorn.conf.py, exercitadas com várias threads.
+
+Cada teste dispara as threads juntas (Barrier) e encurta o intervalo de troca do GIL para
+aumentar as intercalações.
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app as provavida
+from metrics import Registro
+
+THREADS = 16
+
+
+@pytest.fixture(autouse=True)
+def trocas_frequentes():
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(intervalo)
+
+
+def _em_paralelo(funcao, threads=THREADS):
+    """Roda funcao(i) em `threads` threads ao mesmo tempo e devolve os resultados (propaga exceções)."""
+    largada = threading.Barrier(threads)
+
+    def rodar(i):
+        largada.wait()
+        return funcao(i)
+
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(rodar, range(threads)))
+
+
+def test_cache_lru_consistente_sob_concorrencia():
+    cache = provavida.CacheLRU(tamanho_maximo=50, ttl=60)
+
+    def trabalhar(i):
+        for n in range(2000):
+            chave = (i * 7 + n) % 80
+            cache.guardar(chave, ('valor', chave))
+            valor = cache.obter(chave)
+            assert valor is None or valor == ('valor', chave)
+            if n % 100 == 0:
+                cache.remover_se(lambda v: v[1] % 3 == 0)
+
+    _em_paralelo(trabalhar)
+
+    assert len(cache._itens) <= 50
+    for chave, (valor, _) in cache._itens.items():
+        assert valor == ('valor', chave)
+
+
+def test_cache_estatisticas_nao_guarda_valor_calculado_antes_de_invalidar():
+    cache = provavida.CacheEstatisticas(ttl=60)
+    calculando, liberar = threading.Event(), threading.Event()
+
+    def calculo_lento():
+        calculando.set()
+        liberar.wait(5)
+        return 'antigo'
+
+    with ThreadPoolExecutor(1) as executor:
+        futuro = executor.submit(cache.obter, 'hoje', calculo_lento)
+        assert calculando.wait(5)
+        cache.invalidar()
+        liberar.set()
+        assert futuro.result() == 'antigo'
+
+    assert cache.obter('hoje', lambda: 'novo') == 'novo'
+
+
+def test_cache_estatisticas_sob_concorrencia():
+    cache = provavida.CacheEstatisticas(ttl=60)
+    versao = [0]
+    lock = threading.Lock()
+
+    def calcular():
+        with lock:
+            return versao[0]
+
+    def trabalhar(i):
+        for n in range(500):
+            if i == 0 and n % 50 == 0:
+                with lock:
+                    versao[0] += 1
+                cache.invalidar()
+            assert cache.obter('hoje', calcular) <= versao[0]
+
+    _em_paralelo(trabalhar)
+
+    # Depois da última invalidação, nenhum valor antigo pode ter ficado no cache.
+    assert cache.obter('hoje', calcular) == versao[0]
+
+
+def test_logo_do_pdf_decodificado_uma_vez_e_compartilhado(app, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', os.path.join(os.path.dirname(app.root_path), 'frontend'))
+    decodificacoes = []
+    original = provavida.FPDF._parsepng
+
+    def decodificar_devagar(self, caminho):
+        decodificacoes.append(caminho)
+        time.sleep(0.05)
+        return original(self, caminho)
+
+    monkeypatch.setattr(provavida.FPDF, '_parsepng', decodificar_devagar)
+    provavida.BasePDF.descartar_cache()
+    try:
+        logos = _em_paralelo(lambda i: provavida.BasePDF._logo_decodificado())
+        assert len(decodificacoes) == 1
+        assert logos[0] is not None and all(logo is logos[0] for logo in logos)
+
+        def gerar_pdf(i):
+            pdf = provavida.RelatorioPDF(orientation='L', unit='mm', format='A4')
+            pdf.add_page()
+            pdf.chapter_title(f'Relatório {i}')
+            return pdf.output(dest='S')
+
+        assert all(conteudo.startswith('%PDF') for conteudo in _em_paralelo(gerar_pdf))
+        # O fpdf apaga 'data' da imagem do documento ao gravar; o logo compartilhado fica intacto.
+        assert provavida.BasePDF._logo_decodificado()['data']
+    finally:
+        provavida.BasePDF.descartar_cache()
+
+
+@pytest.mark.parametrize('com_diretorio', [False, True], ids=['memoria', 'diretorio'])
+def test_registro_de_metricas_nao_perde_incrementos(tmp_path, com_diretorio):
+    registro = Registro(str(tmp_path) if com_diretorio else None, intervalo_gravacao=0)
+    contador = registro.contador('teste_total', 'Contador de teste.', ('rota',))
+    histograma = registro.histograma('teste_segundos', 'Histograma de teste.', buckets=(0.5, 1))
+
+    def trabalhar(i):
+        for n in range(500):
+            contador.inc(rota=f'/r{n % 3}')
+            histograma.observe(0.25 if n % 2 else 0.75)
+
+    _em_paralelo(trabalhar, threads=8)
+
+    texto = registro.exportar()
+    assert sum(int(linha.rsplit(' ', 1)[1]) for linha in texto.splitlines() if linha.startswith('teste_total{')) == 8 * 500
+    assert 'teste_segundos_count 4000' in texto
+    assert 'teste_segundos_bucket{le="0.5"} 2000' in texto
@@ -0,0 +1,39 @@
+"""Edição de cadastros e controle de versão (versao / 409)."""
+import io
+
+from PIL import Image
+
+
+def _jpeg():
+    saida = io.BytesIO()
+    Image.new('RGB', (32, 32), 'red').save(saida, 'JPEG')
+    return saida.getvalue()
+
+
+def _editar(cliente, auth, cpf, **campos):
+    return cliente.put(f'/api/cadastro/{cpf}', json={'atendente': 'Bia', **campos}, headers=auth)
+
+
+def test_salvar_sem_alteracoes_nao_incrementa_versao(cliente, auth, criar_cadastro):
+    cadastro = criar_cadastro('111.111.111-11')
+    resposta = _editar(cliente, auth, cadastro['cpf'], nome=cadastro['nome'], versao=cadastro['versao'])
+    assert resposta.status_code == 200
+    assert resposta.get_json()['versao'] == cadastro['versao']
+    # Quem abriu o formulário antes continua podendo salvar.
+    assert _editar(cliente, auth, cadastro['cpf'], obs='nova', versao=cadastro['versao']).status_code == 200
+
+
+def test_foto_trocada_no_formulario_nao_gera_conflito(cliente, auth, criar_cadastro):
+    cadastro = criar_cadastro('222.222.222-22')
+    resposta = cliente.post(f"/api/cadastro/{cadastro['cpf']}/foto", data={'foto': (io.BytesIO(_jpeg()), 'foto.jpg')},
+                            headers=auth, content_type='multipart/form-data')
+    assert resposta.status_code == 200
+    nova_versao = resposta.get_json()['versao']
+    assert nova_versao == cadastro['versao'] + 1
+    assert _editar(cliente, auth, cadastro['cpf'], obs='depois da foto', versao=nova_versao).status_code == 200
+
+
+def test_versao_antiga_e_recusada(cliente, auth, criar_cadastro):
+    cadastro = criar_cadastro('333.333.333-33')
+    assert _editar(cliente, auth, cadastro['cpf'], obs='primeira', versao=cadastro['versao']).status_code == 200
+    assert _editar(cliente, auth, cadastro['cpf'], obs='segunda', versao=cadastro['versao']).status_code == 409
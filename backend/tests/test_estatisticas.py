@@ -0,0 +1,183 @@
+"""Rollup estatisticas_diarias (triggers da migração 0006) e /api/statistics por período."""
+from datetime import date, timedelta
+
+import pytest
+
+import app as provavida
+
+DIMENSOES = 'dia, qualidade, atendente, com_whatsapp, com_email, status_visita'
+CONTAGEM_DIRETA = """
+    SELECT data_atendimento, qualidade, atendente_criacao, is_whatsapp, COALESCE(email, '') <> '', COALESCE(status_visita, ''), COUNT(*)
+    FROM cadastros
+    GROUP BY data_atendimento, qualidade, atendente_criacao, is_whatsapp, COALESCE(email, '') <> '', COALESCE(status_visita, '')
+"""
+
+
+def _contagens(app, sql):
+    with app.app_context():
+        linhas = provavida.db.session.execute(provavida.db.text(sql)).all()
+        provavida.db.session.remove()
+    # SQLite devolve datas como texto e booleanos como 0/1.
+    return {(str(dia), qualidade, atendente, bool(whatsapp), bool(email), status): total
+            for dia, qualidade, atendente, whatsapp, email, status, total in linhas}
+
+
+def _conferir(app):
+    rollup = _contagens(app, f'SELECT {DIMENSOES}, total FROM estatisticas_diarias')
+    assert all(total >= 0 for total in rollup.values()), rollup
+    # Combinações que ficaram sem cadastros permanecem com total 0.
+    assert {chave: total for chave, total in rollup.items() if total} == _contagens(app, CONTAGEM_DIRETA)
+    return rollup
+
+
+def _sql(app, comando, **parametros):
+    with app.app_context():
+        provavida.db.session.execute(provavida.db.text(comando), parametros)
+        provavida.db.session.commit()
+        provavida.db.session.remove()
+
+
+@pytest.fixture
+def cadastros(criar_cadastro):
+    criar_cadastro('111.111.111-11', 'Ana', data_atendimento='2026-09-28', email='ana@exemplo.com')
+    criar_cadastro('222.222.222-22', 'Bruno', data_atendimento='2026-09-30', is_whatsapp='Não', necessita_visita_social='on')
+    criar_cadastro('333.333.333-33', 'Carla', data_atendimento='2026-10-01', qualidade='Pensionista', atendente='Bia')
+    criar_cadastro('444.444.444-44', 'Davi', data_atendimento='2026-10-01', necessita_visita_social='on')
+    criar_cadastro('555.555.555-55', 'Eva', data_atendimento='2026-10-05', email='eva@exemplo.com', necessita_visita_social='on')
+    criar_cadastro('666.666.666-66', 'Fábio', data_atendimento='2026-11-02', qualidade='Pensionista')
+
+
+def test_insercao_alimenta_o_rollup(app, cadastros):
+    rollup = _conferir(app)
+    assert rollup[('2026-10-01', 'Aposentado', 'Ana', True, False, 'Pendente')] == 1
+    assert sum(rollup.values()) == 6
+
+
+def test_edicao_de_dimensoes_move_a_contagem(app, cliente, auth, cadastros):
+    editar = lambda cpf, **campos: cliente.put(f'/api/cadastro/{cpf}', json={'atendente': 'Bia', **campos}, headers=auth)
+
+    assert editar('111.111.111-11', data_atendimento='2026-10-02').status_code == 200
+    _conferir(app)
+    assert editar('333.333.333-33', qualidade='Aposentado', email='carla@exemplo.com').status_code == 200
+    _conferir(app)
+    assert editar('555.555.555-55', email='').status_code == 200
+    _conferir(app)
+
+    assert cliente.post('/api/visita/realizar/222.222.222-22', headers=auth).status_code == 200
+    rollup = _conferir(app)
+    assert rollup[('2026-09-30', 'Aposentado', 'Ana', False, False, 'Pendente')] == 0
+    assert rollup[('2026-09-30', 'Aposentado', 'Ana', False, False, 'Realizada')] == 1
+
+    assert cliente.post('/api/visitas/realizar', json={'data_inicio': '2026-10-01', 'data_fim': '2026-10-05'}, headers=auth).status_code == 200
+    _conferir(app)
+
+
+def test_edicao_de_outros_campos_nao_toca_o_rollup(app, cliente, auth, cadastros):
+    antes = _conferir(app)
+    assert cliente.put('/api/cadastro/111.111.111-11', json={'atendente': 'Bia', 'obs': 'só observação'}, headers=auth).status_code == 200
+    assert _conferir(app) == antes
+
+
+def test_escritas_fora_do_orm_tambem_contam(app, cadastros):
+    # UPDATE em massa de data e status da visita, como o de uma correção manual no banco.
+    _sql(app, "UPDATE cadastros SET data_atendimento = :dia, status_visita = 'Realizada' WHERE status_visita = 'Pendente'", dia=date(2026, 10, 10))
+    rollup = _conferir(app)
+    assert rollup[('2026-10-10', 'Aposentado', 'Ana', True, False, 'Realizada')] == 1
+    assert rollup[('2026-10-10', 'Aposentado', 'Ana', False, False, 'Realizada')] == 1
+
+    _sql(app, "UPDATE cadastros SET status_visita = NULL, is_whatsapp = :nao WHERE cpf = '555.555.555-55'", nao=False)
+    _conferir(app)
+
+    _sql(app, "DELETE FROM cadastros WHERE qualidade = 'Pensionista'")
+    rollup = _conferir(app)
+    assert sum(rollup.values()) == 4
+
+    _sql(app, 'DELETE FROM cadastros')
+    assert not any(_conferir(app).values())
+
+
+def test_recalcular_estatisticas_refaz_o_rollup(app, cadastros):
+    esperado = _conferir(app)
+    _sql(app, 'UPDATE estatisticas_diarias SET total = total + 7')
+
+    resultado = app.test_cli_runner().invoke(provavida.recalcular_estatisticas)
+
+    assert resultado.exit_code == 0, resultado.output
+    assert {chave: total for chave, total in _conferir(app).items() if total} == {chave: total for chave, total in esperado.items() if total}
+
+
+# --- /api/statistics ---
+
+def _estatisticas(cliente, auth, **args):
+    return cliente.get('/api/statistics', query_string=args, headers=auth)
+
+
+def test_periodo_por_dia_preenche_os_dias_vazios(cliente, auth, cadastros):
+    dados = _estatisticas(cliente, auth, **{'from': '2026-09-30', 'to': '2026-10-05'}).get_json()
+
+    assert dados['periodo'] == {'de': '2026-09-30', 'ate': '2026-10-05', 'granularidade': 'day'}
+    assert dados['daily_data'] == {'2026-09-30': 1, '2026-10-01': 2, '2026-10-02': 0, '2026-10-03': 0, '2026-10-04': 0, '2026-10-05': 1}
+    assert dados['total_cadastros'] == 4
+    assert dados['visitas_pendentes'] == 3
+    assert dados['qualidade_data'] == {'Aposentado': 3, 'Pensionista': 1}
+    assert dados['whatsapp_data'] == {'Com WhatsApp': 3, 'Sem WhatsApp': 1}
+    assert dados['email_data'] == {'Com Email': 1, 'Sem Email': 3}
+
+
+def test_periodo_por_semana_comeca_na_segunda(cliente, auth, cadastros):
+    dados = _estatisticas(cliente, auth, **{'from': '2026-09-30', 'to': '2026-10-05', 'granularity': 'week'}).get_json()
+
+    # 2026-09-30 é quarta: o primeiro ponto é a segunda 28/09, mas só conta o que está no período.
+    assert dados['daily_data'] == {'2026-09-28': 3, '2026-10-05': 1}
+
+
+def test_periodo_por_mes(cliente, auth, cadastros):
+    dados = _estatisticas(cliente, auth, **{'from': '2026-09-01', 'to': '2026-11-30', 'granularity': 'month'}).get_json()
+
+    assert dados['daily_data'] == {'2026-09': 2, '2026-10': 3, '2026-11': 1}
+    assert dados['total_cadastros'] == 6
+
+
+def test_so_granularidade_vai_do_primeiro_dia_ate_hoje(cliente, auth, cadastros):
+    dados = _estatisticas(cliente, auth, granularity='month').get_json()
+
+    assert dados['periodo']['de'] == '2026-09-28'
+    assert dados['periodo']['ate'] == date.today().isoformat()
+    dias = ['2026-09-28', '2026-09-30', '2026-10-01', '2026-10-01', '2026-10-05', '2026-11-02']
+    assert dados['total_cadastros'] == sum(1 for dia in dias if dia <= date.today().isoformat())
+
+
+def test_sem_parametros_mantem_os_ultimos_sete_dias(cliente, auth, criar_cadastro):
+    hoje = date.today()
+    criar_cadastro('111.111.111-11', data_atendimento=hoje.isoformat())
+    criar_cadastro('222.222.222-22', data_atendimento=(hoje - timedelta(days=30)).isoformat())
+
+    dados = _estatisticas(cliente, auth).get_json()
+
+    assert 'periodo' not in dados
+    assert list(dados['daily_data']) == [(hoje - timedelta(days=d)).strftime('%d/%m') for d in range(6, -1, -1)]
+    assert dados['daily_data'][hoje.strftime('%d/%m')] == 1
+    assert dados['total_cadastros'] == 2
+
+
+@pytest.mark.parametrize('args', [
+    {'granularity': 'year'},
+    {'from': '2026-13-01'},
+    {'to': '01/10/2026'},
+    {'from': '2026-10-05', 'to': '2026-10-01'},
+])
+def test_parametros_invalidos_dao_400(cliente, auth, args):
+    assert _estatisticas(cliente, auth, **args).status_code == 400
+    assert cliente.get('/api/export/statistics/pdf', query_string=args, headers=auth).status_code == 400
+
+
+def test_pdf_do_periodo_sem_tabela_por_atendente(cliente, auth, cadastros, monkeypatch):
+    tabelas = []
+    adicionar = provavida.StatisticsPDF.add_data_table
+    monkeypatch.setattr(provavida.StatisticsPDF, 'add_data_table', lambda pdf, titulo, dados: (tabelas.append(titulo), adicionar(pdf, titulo, dados)))
+
+    resposta = cliente.get('/api/export/statistics/pdf', query_string={'from': '2026-09-01', 'to': '2026-11-30', 'granularity': 'month'}, headers=auth)
+
+    assert resposta.status_code == 200
+    assert resposta.data.startswith(b'%PDF')
+    assert tabelas == ['Distribuição por Qualidade', 'Uso de WhatsApp', 'Uso de Email', 'Cadastros por Mês']
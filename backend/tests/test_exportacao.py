@@ -0,0 +1,94 @@
+"""Exportação de relatórios e declarações: lotes grandes passam pela fila de exportações."""
+import time
+
+from jobs import CONCLUIDO, ERRO
+
+
+def _esperar_exportacao(cliente, auth, status_url):
+    for _ in range(100):
+        status = cliente.get(status_url, headers=auth).get_json()
+        if status['estado'] in (CONCLUIDO, ERRO):
+            return status
+        time.sleep(0.1)
+    raise AssertionError(f'exportação não terminou: {status}')
+
+
+def _criar_visitas(criar_cadastro, quantidade):
+    for i in range(quantidade):
+        criar_cadastro(f'{i:03d}.000.000-00', f'Segurado {i}', necessita_visita_social='on', endereco='Rua A')
+
+
+def test_pdf_pequeno_e_gerado_na_hora(app, cliente, auth, criar_cadastro, monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_SYNC_MAX_ROWS', 2)
+    _criar_visitas(criar_cadastro, 2)
+
+    resposta = cliente.get('/api/export/visitas/pendentes/pdf', headers=auth)
+
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/pdf'
+
+
+def test_pdf_grande_vai_para_a_fila(app, cliente, auth, criar_cadastro, monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_SYNC_MAX_ROWS', 2)
+    _criar_visitas(criar_cadastro, 3)
+
+    resposta = cliente.get('/api/export/visitas/pendentes/pdf', headers=auth)
+
+    assert resposta.status_code == 202
+    assert resposta.headers['Location'] == resposta.get_json()['status_url']
+    status = _esperar_exportacao(cliente, auth, resposta.headers['Location'])
+    assert status['estado'] == CONCLUIDO, status
+    download = cliente.get(status['download_url'], headers=auth)
+    assert download.status_code == 200
+    assert download.data.startswith(b'%PDF')
+
+
+def _criar_cadastros(criar_cadastro, quantidade):
+    return [criar_cadastro(f'{i:03d}.111.111-11', f'Segurado {i}')['cpf'] for i in range(quantidade)]
+
+
+def test_lote_pequeno_de_declaracoes_e_gerado_na_hora(app, cliente, auth, criar_cadastro, monkeypatch):
+    monkeypatch.setitem(app.config, 'DECLARACOES_SYNC_MAX', 2)
+    cpfs = _criar_cadastros(criar_cadastro, 2)
+
+    resposta = cliente.post('/api/export/declaracoes', json={'cpfs': cpfs}, headers=auth)
+
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/pdf'
+
+
+def test_lote_grande_de_declaracoes_vai_para_a_fila(app, cliente, auth, criar_cadastro, monkeypatch):
+    monkeypatch.setitem(app.config, 'DECLARACOES_SYNC_MAX', 2)
+    cpfs = _criar_cadastros(criar_cadastro, 3)
+
+    for pedido, mimetype in (({'cpfs': cpfs}, 'application/pdf'),
+                             ({'data_inicio': '2026-10-01', 'formato': 'zip'}, 'application/zip')):
+        resposta = cliente.post('/api/export/declaracoes', json=pedido, headers=auth)
+
+        assert resposta.status_code == 202
+        assert resposta.get_json()['tipo'] == 'declaracoes'
+        assert resposta.headers['Location'] == resposta.get_json()['status_url']
+        status = _esperar_exportacao(cliente, auth, resposta.headers['Location'])
+        assert status['estado'] == CONCLUIDO, status
+        download = cliente.get(status['download_url'], headers=auth)
+        assert download.status_code == 200
+        assert download.mimetype == mimetype
+
+
+def test_lote_na_fila_com_cpf_inexistente_termina_em_erro(cliente, auth):
+    resposta = cliente.post('/api/export/jobs', json={'tipo': 'declaracoes', 'cpfs': ['999.999.999-99']}, headers=auth)
+
+    assert resposta.status_code == 202
+    status = _esperar_exportacao(cliente, auth, resposta.headers['Location'])
+    assert status['estado'] == ERRO
+    assert status['erro'] == 'Cadastro não encontrado'
+
+
+def test_lote_de_declaracoes_com_corpo_que_nao_e_objeto_da_400(cliente, auth):
+    for corpo in (['111.111.111-11'], '111.111.111-11'):
+        assert cliente.post('/api/export/declaracoes', json=corpo, headers=auth).status_code == 400
+
+
+def test_submeter_exportacao_com_corpo_que_nao_e_objeto_da_400(cliente, auth):
+    for corpo in (['cadastros'], 'cadastros'):
+        assert cliente.post('/api/export/jobs', json=corpo, headers=auth).status_code == 400
@@ -0,0 +1,43 @@
+"""Configuração do gunicorn (gunicorn.conf.py) conforme a classe de worker."""
+import os
+import runpy
+
+import pytest
+
+CONFIGURACAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gunicorn.conf.py')
+
+
+@pytest.fixture
+def carregar(monkeypatch):
+    def carregar(**ambiente):
+        # A configuração escreve no os.environ; o monkeypatch desfaz no fim do teste.
+        monkeypatch.setenv('WEB_CONCURRENCY', '2')
+        for chave in ('SECRET_KEY', 'GUNICORN_WORKER_CLASS', 'GUNICORN_THREADS', 'GUNICORN_WORKER_CONNECTIONS'):
+            monkeypatch.delenv(chave, raising=False)
+        for chave, valor in ambiente.items():
+            monkeypatch.setenv(chave, valor)
+        return runpy.run_path(CONFIGURACAO)
+    return carregar
+
+
+def test_gthread_pre_carrega_o_app(carregar):
+    assert carregar()['preload_app'] is True
+    assert 'SECRET_KEY' not in os.environ
+
+
+def test_gevent_nao_pre_carrega_e_compartilha_a_chave(carregar):
+    configuracao = carregar(GUNICORN_WORKER_CLASS='gevent')
+
+    assert configuracao['preload_app'] is False
+    assert len(os.environ['SECRET_KEY']) == 64
+
+
+def test_gevent_mantem_a_chave_definida(carregar):
+    carregar(GUNICORN_WORKER_CLASS='gevent', SECRET_KEY='fixa')
+    assert os.environ['SECRET_KEY'] == 'fixa'
+
+
+def test_configuracao_do_worker_publicada_para_o_limite_de_streams(carregar):
+    carregar(GUNICORN_THREADS='12')
+    assert (os.environ['GUNICORN_WORKER_CLASS'], os.environ['GUNICORN_THREADS']) == ('gthread', '12')
+    assert os.environ['GUNICORN_WORKER_CONNECTIONS'] == '100'
@@ -0,0 +1,47 @@
+"""Importação em lote (POST /api/import/cadastros) com upsert por CPF."""
+import io
+
+CABECALHO = 'cpf,nome,telefone,qualidade,data_atendimento,necessita_visita_social\n'
+
+
+def _importar(cliente, auth, conteudo):
+    resposta = cliente.post('/api/import/cadastros', data={'arquivo': (io.BytesIO(conteudo.encode()), 'cadastros.csv')},
+                            headers=auth, content_type='multipart/form-data')
+    assert resposta.status_code == 200, resposta.data
+    relatorio = resposta.get_json()
+    assert relatorio['total_erros'] == 0, relatorio
+    return relatorio
+
+
+def _status(cliente, auth, cpf):
+    return next(c for c in cliente.get('/api/cadastros', headers=auth).get_json() if c['cpf'] == cpf)['status_visita']
+
+
+def _auditoria(cliente, auth, cpf):
+    return [(linha['campo_alterado'], linha['valor_antigo'], linha['valor_novo'])
+            for linha in cliente.get(f'/api/audit_logs?cpf={cpf}', headers=auth).get_json()]
+
+
+def test_reimportar_nao_reabre_visita_realizada(cliente, auth):
+    cpf = '444.444.444-44'
+    _importar(cliente, auth, CABECALHO + f'{cpf},Maria,(82) 1111-1111,Pensionista,2026-10-01,sim\n')
+    assert _status(cliente, auth, cpf) == 'Pendente'
+    assert cliente.post(f'/api/visita/realizar/{cpf}', headers=auth).status_code == 200
+
+    _importar(cliente, auth, CABECALHO + f'{cpf},Maria,(82) 2222-2222,Pensionista,2026-10-01,sim\n')
+
+    assert _status(cliente, auth, cpf) == 'Realizada'
+    auditoria = _auditoria(cliente, auth, cpf)
+    assert ('telefone', '(82) 1111-1111', '(82) 2222-2222') in auditoria
+    assert ('status_visita', 'Realizada', 'Pendente') not in auditoria
+
+
+def test_reimportar_abre_visita_em_cadastro_sem_visita(cliente, auth):
+    cpf = '555.555.555-55'
+    _importar(cliente, auth, CABECALHO + f'{cpf},João,(82) 1111-1111,Aposentado,2026-10-01,não\n')
+    assert _status(cliente, auth, cpf) is None
+
+    _importar(cliente, auth, CABECALHO + f'{cpf},João,(82) 1111-1111,Aposentado,2026-10-01,sim\n')
+
+    assert _status(cliente, auth, cpf) == 'Pendente'
+    assert _auditoria(cliente, auth, cpf) == [('status_visita', '', 'Pendente')]
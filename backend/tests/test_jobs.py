@@ -0,0 +1,38 @@
+"""Fila de exportações (jobs.py): status ausente e limite do cache em disco."""
+import json
+import os
+import time
+
+from jobs import CONCLUIDO, EXECUTANDO, PENDENTE, FilaRelatorios
+
+
+def _gravar(diretorio, job_id, estado, tamanho):
+    (diretorio / f'{job_id}.bin').write_bytes(b'x' * tamanho)
+    (diretorio / f'{job_id}.json').write_text(json.dumps({'id': job_id, 'estado': estado, 'atualizado_em': time.time()}))
+
+
+def test_tarefa_sem_status_e_descartada_sem_erro(tmp_path):
+    fila = FilaRelatorios(str(tmp_path), max_bytes=10 ** 6)
+    executadas = []
+    (tmp_path / 'sumiu.lock').write_text('')
+
+    fila._executar('sumiu', executadas.append)
+
+    assert executadas == []
+    assert not (tmp_path / 'sumiu.lock').exists()
+    assert fila.status('sumiu') is None
+
+
+def test_limite_do_cache_preserva_tarefas_pendentes_e_em_execucao(tmp_path):
+    fila = FilaRelatorios(str(tmp_path), max_bytes=0)
+    _gravar(tmp_path, 'refeita', PENDENTE, 100)
+    _gravar(tmp_path, 'rodando', EXECUTANDO, 100)
+    _gravar(tmp_path, 'pronta', CONCLUIDO, 100)
+
+    fila._limitar_cache()
+
+    assert fila.status('refeita')['estado'] == PENDENTE
+    assert fila.status('rodando')['estado'] == EXECUTANDO
+    assert fila.status('pronta') is None
+    assert sorted(os.listdir(tmp_path)) == ['refeita.bin', 'refeita.json', 'rodando.bin', 'rodando.json']
+
@@ -0,0 +1,64 @@
+"""Listagem paginada por chave (nome, cpf) em /api/cadastros."""
+import pytest
+
+
+def _pagina(cliente, auth, **args):
+    resposta = cliente.get('/api/cadastros', query_string={'fields': 'cpf,nome', **args}, headers=auth)
+    assert resposta.status_code == 200, resposta.data
+    return resposta
+
+
+def _percorrer(cliente, auth, limit, cursor=None, **args):
+    """Segue X-Next-Cursor até a última página; devolve as páginas como listas de (nome, cpf)."""
+    paginas = []
+    while True:
+        resposta = _pagina(cliente, auth, limit=limit, **({'cursor': cursor} if cursor else {}), **args)
+        paginas.append([(c['nome'], c['cpf']) for c in resposta.get_json()])
+        cursor = resposta.headers.get('X-Next-Cursor')
+        if not cursor:
+            return paginas
+
+
+@pytest.fixture
+def cadastros_com_empates(criar_cadastro):
+    # Três "Ana Souza": a ordem entre eles é decidida pelo CPF.
+    dados = [('333.333.333-33', 'Ana Souza'), ('111.111.111-11', 'Ana Souza'), ('222.222.222-22', 'Ana Souza'),
+             ('444.444.444-44', 'Bruno Lima'), ('555.555.555-55', 'Carla Dias')]
+    for cpf, nome in dados:
+        criar_cadastro(cpf, nome)
+    return sorted((nome, cpf) for cpf, nome in dados)
+
+
+def test_paginas_cobrem_tudo_na_ordem_sem_repetir(cliente, auth, cadastros_com_empates):
+    paginas = _percorrer(cliente, auth, limit=2)
+
+    assert [len(p) for p in paginas] == [2, 2, 1]
+    assert [linha for pagina in paginas for linha in pagina] == cadastros_com_empates
+
+
+def test_limite_exato_nao_gera_pagina_vazia(cliente, auth, cadastros_com_empates):
+    resposta = _pagina(cliente, auth, limit=5)
+
+    assert len(resposta.get_json()) == 5
+    assert 'X-Next-Cursor' not in resposta.headers
+    assert resposta.headers['X-Total-Count'] == '5'
+
+
+def test_cursor_estavel_quando_entram_cadastros_antes_dele(cliente, auth, criar_cadastro, cadastros_com_empates):
+    primeira = _pagina(cliente, auth, limit=2)
+    cursor = primeira.headers['X-Next-Cursor']
+    assert primeira.headers['Link'].endswith('>; rel="next"')
+
+    # Entram um empate antes do cursor (mesmo nome, CPF menor) e um nome que ordena antes de todos.
+    criar_cadastro('000.000.000-00', 'Ana Souza')
+    criar_cadastro('999.999.999-99', 'Aaron Alves')
+
+    resto = _percorrer(cliente, auth, limit=2, cursor=cursor)
+    vistos = [(c['nome'], c['cpf']) for c in primeira.get_json()] + [linha for pagina in resto for linha in pagina]
+    assert vistos == cadastros_com_empates
+
+
+def test_contagem_opcional_e_parametros_invalidos(cliente, auth, cadastros_com_empates):
+    assert 'X-Total-Count' not in _pagina(cliente, auth, limit=2, count=0).headers
+    for args in ({'limit': 0}, {'limit': 'x'}, {'cursor': 'nao-e-um-cursor'}):
+        assert cliente.get('/api/cadastros', query_string=args, headers=auth).status_code == 400
@@ -0,0 +1,56 @@
+"""Agregação das métricas entre processos (metrics.py): retratos em METRICS_DIR."""
+import multiprocessing
+import os
+import time
+
+from metrics import Registro
+
+
+def _worker_que_fica_ocioso(diretorio, pronto, encerrar):
+    registro = Registro(diretorio, intervalo_gravacao=0.2)
+    contador = registro.contador('teste_total', 'Contador de teste.')
+    contador.inc()
+    # Dentro do intervalo: antes do timer, só iria para o disco numa próxima alteração.
+    contador.inc()
+    pronto.set()
+    encerrar.wait(10)
+
+
+def _valor(texto):
+    return [linha for linha in texto.splitlines() if linha.startswith('teste_total ')]
+
+
+def test_ultimo_incremento_de_um_worker_ocioso_chega_ao_total(tmp_path):
+    contexto = multiprocessing.get_context('fork')
+    pronto, encerrar = contexto.Event(), contexto.Event()
+    worker = contexto.Process(target=_worker_que_fica_ocioso, args=(str(tmp_path), pronto, encerrar))
+    worker.start()
+    try:
+        assert pronto.wait(10)
+        coletor = Registro(str(tmp_path))
+        coletor.contador('teste_total', 'Contador de teste.')
+
+        for _ in range(50):
+            if _valor(coletor.exportar()) == ['teste_total 2']:
+                break
+            time.sleep(0.05)
+        assert _valor(coletor.exportar()) == ['teste_total 2']
+        assert worker.is_alive()
+    finally:
+        encerrar.set()
+        worker.join(10)
+
+
+def test_alteracoes_no_intervalo_gravadas_uma_vez_ao_fim_dele(tmp_path, monkeypatch):
+    registro = Registro(str(tmp_path), intervalo_gravacao=0.2)
+    contador = registro.contador('teste_total', 'Contador de teste.')
+    gravacoes = []
+    persistir = registro.persistir
+    monkeypatch.setattr(registro, 'persistir', lambda: (gravacoes.append(time.monotonic()), persistir()))
+
+    for _ in range(100):
+        contador.inc()
+    time.sleep(0.5)
+
+    assert len(gravacoes) == 2
+    assert (tmp_path / f'{os.getpid()}.json').read_text() == '{"teste_total": [[[], 100]]}'
@@ -0,0 +1,79 @@
+"""Planos de execução das consultas de listagem, busca e filtros (ver verificar-planos no app.py).
+
+Só roda no Postgres (TEST_DATABASE_URL): os índices trigram e varchar_pattern_ops não existem
+no SQLite, e o plano que importa é o de produção.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app as provavida
+
+CADASTROS = 5000
+ALTERACOES = 20000
+NOMES = ['Maria Aparecida', 'José Ferreira', 'Antônio Pereira', 'Francisca Lima', 'João Batista', 'Ana Souza']
+
+
+def _cpf(i):
+    digitos = f'{i * 7919 % 10 ** 11:011d}'
+    return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+
+
+def _povoar():
+    """Volume e distribuição de produção em miniatura, para o planejador ter estatísticas reais."""
+    cadastros = []
+    for i in range(CADASTROS):
+        nome = f'{NOMES[i % len(NOMES)]} {i:05d}' if i % 100 else f'José Carlos da Silva {i:05d}'
+        cpf = _cpf(i)
+        cadastros.append({
+            'cpf': cpf, 'cpf_digitos': provavida.somente_digitos(cpf), 'nome': nome, 'nome_busca': provavida.normalizar_busca(nome),
+            'matricula': f'{2000 + i % 30}{i:06d}', 'telefone': '(82) 99999-0000', 'is_whatsapp': i % 20 == 0,
+            'qualidade': 'Aposentado', 'data_atendimento': date(2024, 1, 1) + timedelta(days=i % 1000), 'atendente_criacao': 'Ana',
+            'status_visita': {0: 'Pendente', 1: 'Realizada'}.get(i % 10),
+        })
+    provavida.db.session.execute(provavida.Cadastro.__table__.insert(), cadastros)
+    provavida.db.session.execute(provavida.AuditoriaAlteracoes.__table__.insert(), [
+        {'cadastro_cpf': _cpf(i % CADASTROS), 'atendente': f'atendente{i % 50}', 'data_alteracao': datetime(2024, 1, 1) + timedelta(minutes=i),
+         'campo_alterado': 'telefone', 'valor_antigo': '', 'valor_novo': '(82) 99999-0000'}
+        for i in range(ALTERACOES)
+    ])
+    provavida.db.session.commit()
+    # Como o autovacuum faria em produção: sem o VACUUM, a lista pendente dos índices GIN e as
+    # linhas mortas dos testes anteriores encarecem os índices trigram e o plano varia entre execuções.
+    with provavida.db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+        conexao.execute(provavida.db.text('VACUUM ANALYZE cadastros'))
+        conexao.execute(provavida.db.text('VACUUM ANALYZE auditoria_alteracoes'))
+
+
+@pytest.fixture
+def postgres(app):
+    with app.app_context():
+        if provavida.db.engine.dialect.name != 'postgresql':
+            pytest.skip('planos de execução só são verificados no Postgres (defina TEST_DATABASE_URL)')
+        _povoar()
+        # Como no verificar-planos: só interessa saber se o índice é utilizável pela consulta.
+        provavida.db.session.execute(provavida.db.text('SET LOCAL enable_seqscan = off'))
+        yield
+        provavida.db.session.rollback()
+        provavida.db.session.remove()
+
+
+def test_consultas_criticas_usam_os_indices_esperados(postgres):
+    consultas = provavida._consultas_criticas()
+    descricoes = {descricao for descricao, _, _ in consultas}
+    assert {'listagem paginada', 'listagem, página seguinte', 'busca por nome', 'busca por CPF parcial'} <= descricoes
+
+    falhas = []
+    for descricao, query, indice in consultas:
+        plano = provavida._plano_de_execucao(query)
+        if not provavida.usa_indice(plano, indice):
+            falhas.append(f'{descricao}: esperado {indice}\n{plano}')
+    assert not falhas, '\n\n'.join(falhas)
+
+
+def test_pagina_seguinte_nao_reordena(postgres):
+    # Keyset: a página seguinte continua no índice (nome, cpf), sem Sort nem leitura desde o início.
+    query = [q for descricao, q, _ in provavida._consultas_criticas() if descricao == 'listagem, página seguinte'][0]
+    plano = provavida._plano_de_execucao(query)
+    assert '"Node Type": "Sort"' not in plano
+    assert '"Index Cond"' in plano
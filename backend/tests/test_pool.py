@@ -0,0 +1,22 @@
+"""Dimensionamento do pool de conexões pelo número de workers do gunicorn."""
+import pytest
+
+from app import dimensionar_pool
+
+
+def test_pool_configurado_cabe_no_limite():
+    assert dimensionar_pool(5, 10, 90, 3) == (5, 10)
+
+
+def test_pool_reduzido_para_caber_no_limite():
+    # 9 workers (cpu*2+1 numa máquina de 4 núcleos) × 15 passaria dos 90.
+    pool_size, max_overflow = dimensionar_pool(5, 10, 90, 9)
+    assert (pool_size, max_overflow) == (5, 5)
+    assert 9 * (pool_size + max_overflow) <= 90
+
+    assert dimensionar_pool(5, 10, 90, 30) == (3, 0)
+
+
+def test_sem_conexao_para_cada_worker_nao_sobe():
+    with pytest.raises(RuntimeError, match='WEB_CONCURRENCY'):
+        dimensionar_pool(5, 10, 8, 9)
@@ -0,0 +1,150 @@
+"""Sincronização incremental (since=) sobre o log de alterações da migração 0007."""
+import threading
+
+import pytest
+
+import app as provavida
+
+
+def _sincronizar(cliente, auth, since):
+    resposta = cliente.get(f'/api/cadastros?since={since}&fields=cpf,nome', headers=auth)
+    assert resposta.status_code == 200, resposta.data
+    return resposta.get_json()
+
+
+def test_since_devolve_so_o_que_mudou_depois_do_cursor(cliente, auth, criar_cadastro):
+    criar_cadastro('111.111.111-11', 'Maria')
+    primeira = _sincronizar(cliente, auth, 0)
+    assert [c['cpf'] for c in primeira['cadastros']] == ['111.111.111-11']
+
+    criar_cadastro('222.222.222-22', 'João')
+    segunda = _sincronizar(cliente, auth, primeira['cursor'])
+
+    assert [c['cpf'] for c in segunda['cadastros']] == ['222.222.222-22']
+    assert int(segunda['cursor']) > int(primeira['cursor'])
+    assert _sincronizar(cliente, auth, segunda['cursor'])['cadastros'] == []
+
+
+@pytest.fixture
+def conexoes_postgres(app):
+    with app.app_context():
+        engine = provavida.db.engine
+        if engine.dialect.name != 'postgresql':
+            pytest.skip('concorrência entre transações só é verificada no Postgres (defina TEST_DATABASE_URL)')
+        conexoes = [engine.connect() for _ in range(2)]
+        for conexao in conexoes:
+            # Com o lock por linha antigo, o teste travava em vez de falhar.
+            conexao.exec_driver_sql("SET lock_timeout = '5s'")
+        yield conexoes
+        for conexao in conexoes:
+            conexao.close()
+
+
+def _seq(conexao, cpf):
+    return conexao.exec_driver_sql('SELECT seq FROM alteracoes_cadastros WHERE cpf = %(cpf)s', {'cpf': cpf}).scalar()
+
+
+def test_escritas_cruzadas_sem_deadlock_e_numeradas_na_ordem_de_commit(criar_cadastro, conexoes_postgres):
+    primeiro, segundo, so_da_edicao = '111.111.111-11', '222.222.222-22', '333.333.333-33'
+    for cpf in (primeiro, segundo, so_da_edicao):
+        criar_cadastro(cpf)
+    lote, edicao = conexoes_postgres
+    atualizar = "UPDATE cadastros SET obs = %(obs)s WHERE cpf = ANY(%(cpfs)s)"
+
+    # Um lote que altera várias linhas começa antes de uma edição avulsa, e precisa de uma
+    # linha que a edição já travou.
+    transacao_lote = lote.begin()
+    lote.exec_driver_sql(atualizar, {'obs': 'lote', 'cpfs': [primeiro]})
+    transacao_edicao = edicao.begin()
+    edicao.exec_driver_sql(atualizar, {'obs': 'edição', 'cpfs': [segundo, so_da_edicao]})
+
+    erros = []
+
+    def continuar_lote():
+        try:
+            lote.exec_driver_sql(atualizar, {'obs': 'lote', 'cpfs': [segundo]})
+            transacao_lote.commit()
+        except Exception as e:
+            erros.append(e)
+            transacao_lote.rollback()
+
+    thread = threading.Thread(target=continuar_lote)
+    thread.start()
+    transacao_edicao.commit()
+    thread.join(10)
+
+    assert not thread.is_alive() and not erros, erros
+    # O lote escreveu primeiro, mas confirmou depois: quem sincronizou entre os dois commits
+    # já tem a edição e precisa receber o lote com números maiores.
+    assert _seq(edicao, primeiro) > _seq(edicao, so_da_edicao)
+
+
+def test_stream_recusa_acima_do_limite_e_libera_a_vaga_ao_fechar(cliente, auth, monkeypatch):
+    monkeypatch.setattr(provavida, 'vagas_streams', threading.BoundedSemaphore(1))
+
+    aberto = cliente.get('/api/cadastros/stream', headers=auth, buffered=False)
+    assert aberto.status_code == 200
+    assert aberto.mimetype == 'text/event-stream'
+
+    recusado = cliente.get('/api/cadastros/stream', headers=auth, buffered=False)
+    assert recusado.status_code == 503
+    assert recusado.headers['Retry-After'] == '30'
+
+    aberto.close()
+    reaberto = cliente.get('/api/cadastros/stream', headers=auth, buffered=False)
+    assert reaberto.status_code == 200
+    reaberto.close()
+
+
+def test_limite_padrao_de_streams_vem_das_threads_do_worker():
+    assert provavida.vagas_para_streams('gthread', 4, 100, 2) == 2
+    assert provavida.vagas_para_streams('gthread', 16, 100, 2) == 14
+    assert provavida.vagas_para_streams('gevent', 4, 100, 2) == 98
+    # Mesmo com todas as threads reservadas, um stream ainda é aceito.
+    assert provavida.vagas_para_streams('gthread', 2, 100, 2) == 1
+
+
+def test_varios_clientes_conectados_ao_mesmo_tempo_recebem_as_alteracoes(app, cliente, auth, criar_cadastro, monkeypatch):
+    vagas = provavida.vagas_para_streams('gthread', 6, 100, 2)
+    monkeypatch.setattr(provavida, 'vagas_streams', threading.BoundedSemaphore(vagas))
+    monkeypatch.setattr(provavida, 'vigia_alteracoes', provavida.VigiaAlteracoes(0.05))
+    monkeypatch.setitem(app.config, 'SSE_POLL_INTERVAL', 0.05)
+
+    conectados = threading.Barrier(vagas + 1, timeout=10)
+    status, recebidos = [None] * vagas, [None] * vagas
+
+    def acompanhar(i):
+        # Como no gthread: cada stream é aberto, lido e fechado pela mesma thread.
+        aberto = app.test_client().get('/api/cadastros/stream?fields=cpf', headers=auth, buffered=False)
+        status[i] = aberto.status_code
+        conectados.wait()
+        try:
+            for bloco in aberto.response:
+                if b'event: alteracoes' in bloco:
+                    recebidos[i] = bloco.decode('utf-8')
+                    return
+        finally:
+            aberto.close()
+
+    leitores = [threading.Thread(target=acompanhar, args=(i,), daemon=True) for i in range(vagas)]
+    for leitor in leitores:
+        leitor.start()
+    conectados.wait()
+
+    assert status == [200] * vagas
+    assert cliente.get('/api/cadastros/stream', headers=auth, buffered=False).status_code == 503
+    # As threads reservadas continuam atendendo as demais rotas.
+    assert cliente.get('/api/cadastros', headers=auth).status_code == 200
+
+    criar_cadastro('111.111.111-11', 'Maria')
+    for leitor in leitores:
+        leitor.join(10)
+    assert not any(leitor.is_alive() for leitor in leitores)
+    assert all(recebido and '111.111.111-11' in recebido for recebido in recebidos), recebidos
+
+    # Fechados os streams, as vagas voltam.
+    reabertos = [cliente.get('/api/cadastros/stream', headers=auth, buffered=False) for _ in range(vagas)]
+    assert [reaberto.status_code for reaberto in reabertos] == [200] * vagas
+    # Na mesma thread os contextos dos streams ficam empilhados: fecha do último para o primeiro.
+    for reaberto in reversed(reabertos):
+        reaberto.close()
@@ -0,0 +1,132 @@
+"""Visitas sociais realizadas em lote (POST /api/visitas/realizar)."""
+import pytest
+
+import app as provavida
+
+PENDENTE_1, PENDENTE_2, PENDENTE_FORA, REALIZADA, SEM_VISITA = (
+    '111.111.111-11', '222.222.222-22', '333.333.333-33', '444.444.444-44', '555.555.555-55')
+
+
+@pytest.fixture
+def visitas(cliente, auth, criar_cadastro):
+    criar_cadastro(PENDENTE_1, 'Ana', data_atendimento='2026-10-01', necessita_visita_social='on')
+    criar_cadastro(PENDENTE_2, 'Bruno', data_atendimento='2026-10-03', necessita_visita_social='on')
+    criar_cadastro(PENDENTE_FORA, 'Carla', data_atendimento='2026-10-10', necessita_visita_social='on')
+    criar_cadastro(REALIZADA, 'Davi', data_atendimento='2026-10-02', necessita_visita_social='on')
+    criar_cadastro(SEM_VISITA, 'Eva', data_atendimento='2026-10-02')
+    assert cliente.post(f'/api/visita/realizar/{REALIZADA}', headers=auth).status_code == 200
+
+
+def _realizar(cliente, auth, **corpo):
+    return cliente.post('/api/visitas/realizar', json=corpo, headers=auth)
+
+
+def _estado(app):
+    """{cpf: (status_visita, versao)} e as linhas de auditoria de status_visita."""
+    with app.app_context():
+        cadastros = {cpf: (status, versao) for cpf, status, versao in
+                     provavida.db.session.query(provavida.Cadastro.cpf, provavida.Cadastro.status_visita, provavida.Cadastro.versao)}
+        a = provavida.AuditoriaAlteracoes
+        auditoria = provavida.db.session.query(a.cadastro_cpf, a.atendente, a.campo_alterado, a.valor_antigo, a.valor_novo) \
+            .filter(a.campo_alterado == 'status_visita').order_by(a.id).all()
+        provavida.db.session.remove()
+    return cadastros, [tuple(linha) for linha in auditoria]
+
+
+def test_resultado_por_cpf(app, cliente, auth, visitas):
+    antes, auditoria_antes = _estado(app)
+
+    resposta = _realizar(cliente, auth, cpfs=[PENDENTE_1, REALIZADA, SEM_VISITA, '999.999.999-99', PENDENTE_1], atendente='Bia')
+
+    assert resposta.status_code == 200
+    assert resposta.get_json() == {'realizadas': 1, 'resultados': [
+        {'cpf': PENDENTE_1, 'resultado': 'realizada'},
+        {'cpf': REALIZADA, 'resultado': 'ja_realizada'},
+        {'cpf': SEM_VISITA, 'resultado': 'sem_visita'},
+        {'cpf': '999.999.999-99', 'resultado': 'nao_encontrado'},
+    ]}
+
+    depois, auditoria = _estado(app)
+    assert depois[PENDENTE_1] == ('Realizada', antes[PENDENTE_1][1] + 1)
+    # Só a visita realizada muda de versão e ganha auditoria.
+    assert {cpf: depois[cpf] for cpf in depois if cpf != PENDENTE_1} == {cpf: antes[cpf] for cpf in antes if cpf != PENDENTE_1}
+    assert auditoria == auditoria_antes + [(PENDENTE_1, 'Bia', 'status_visita', 'Pendente', 'Realizada')]
+
+
+def test_repetir_o_pedido_nao_realiza_nem_audita_de_novo(app, cliente, auth, visitas):
+    assert _realizar(cliente, auth, cpfs=[PENDENTE_1]).get_json()['realizadas'] == 1
+    estado = _estado(app)
+
+    resposta = _realizar(cliente, auth, cpfs=[PENDENTE_1])
+
+    assert resposta.get_json() == {'realizadas': 0, 'resultados': [{'cpf': PENDENTE_1, 'resultado': 'ja_realizada'}]}
+    assert _estado(app) == estado
+
+
+def test_atendente_padrao_e_o_utilizador_autenticado(app, cliente, auth, visitas):
+    _realizar(cliente, auth, cpfs=[PENDENTE_2])
+    _, auditoria = _estado(app)
+    assert auditoria[-1][:2] == (PENDENTE_2, 'atendente')
+
+
+def test_periodo_realiza_so_as_pendentes_do_intervalo(app, cliente, auth, visitas):
+    antes, auditoria_antes = _estado(app)
+
+    resposta = _realizar(cliente, auth, data_inicio='2026-10-01', data_fim='2026-10-05')
+
+    assert resposta.status_code == 200
+    assert resposta.get_json() == {'realizadas': 2, 'resultados': [
+        {'cpf': PENDENTE_1, 'resultado': 'realizada'},
+        {'cpf': PENDENTE_2, 'resultado': 'realizada'},
+    ]}
+    depois, auditoria = _estado(app)
+    for cpf in (PENDENTE_1, PENDENTE_2):
+        assert depois[cpf] == ('Realizada', antes[cpf][1] + 1)
+    assert depois[PENDENTE_FORA] == antes[PENDENTE_FORA]
+    assert depois[REALIZADA] == antes[REALIZADA]
+    assert sorted(auditoria[len(auditoria_antes):]) == [
+        (PENDENTE_1, 'atendente', 'status_visita', 'Pendente', 'Realizada'),
+        (PENDENTE_2, 'atendente', 'status_visita', 'Pendente', 'Realizada'),
+    ]
+
+
+def test_periodo_de_um_dia_so(cliente, auth, visitas):
+    resposta = _realizar(cliente, auth, data_inicio='2026-10-10')
+    assert resposta.get_json() == {'realizadas': 1, 'resultados': [{'cpf': PENDENTE_FORA, 'resultado': 'realizada'}]}
+
+
+def test_limite_do_lote(app, cliente, auth, visitas, monkeypatch):
+    monkeypatch.setitem(app.config, 'VISITAS_MAX_LOTE', 1)
+    estado = _estado(app)
+
+    assert _realizar(cliente, auth, cpfs=[PENDENTE_1, PENDENTE_2]).status_code == 400
+    assert _realizar(cliente, auth, data_inicio='2026-10-01', data_fim='2026-10-05').status_code == 400
+    assert _estado(app) == estado
+    # CPFs repetidos contam uma vez.
+    assert _realizar(cliente, auth, cpfs=[PENDENTE_1, PENDENTE_1]).status_code == 200
+
+
+@pytest.mark.parametrize('corpo', [[PENDENTE_1], PENDENTE_1, 42, None])
+def test_corpo_que_nao_e_objeto_json_da_400(app, cliente, auth, visitas, corpo):
+    estado = _estado(app)
+    resposta = cliente.post('/api/visitas/realizar', json=corpo, headers=auth)
+    assert resposta.status_code == 400
+    assert 'error' in resposta.get_json()
+    assert _estado(app) == estado
+
+
+@pytest.mark.parametrize('corpo', [
+    {},
+    {'cpfs': []},
+    {'cpfs': PENDENTE_1},
+    {'cpfs': [1, 2]},
+    {'data_inicio': '01/10/2026'},
+    {'data_inicio': '2026-10-01', 'data_fim': 'amanhã'},
+])
+def test_parametros_invalidos_dao_400(cliente, auth, visitas, corpo):
+    assert _realizar(cliente, auth, **corpo).status_code == 400
+
+
+def test_corpo_malformado_da_400(cliente, auth, visitas):
+    resposta = cliente.post('/api/visitas/realizar', data='{"cpfs": [', content_type='application/json', headers=auth)
+    assert resposta.status_code == 400